@@ -0,0 +1,163 @@
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import psycopg2.extras
+
+# Занятость хранится интервалами: одна строка booked_ranges на бронь, stay = daterange [заезд, выезд).
+# Цены и закрытые тарифом дни по-прежнему лежат построчно в availability_calendar (пишет sync-bnovo-rates).
+RANGES_TABLE = 't_p9202093_hotel_design_site.booked_ranges'
+CALENDAR_TABLE = 't_p9202093_hotel_design_site.availability_calendar'
+# Строк в одном INSERT ... ON CONFLICT
+RANGES_BATCH_SIZE = 1000
+
+# booking_id -> (room_id, check_in, check_out, bnovo_id, guest_name)
+BookedRange = Tuple[str, Any, Any, Optional[int], Optional[str]]
+
+def to_date(value: Any) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+def _fetch_dicts(cur) -> List[Dict[str, Any]]:
+    '''Строки как dict для любого курсора: и обычного, и RealDictCursor'''
+    rows = cur.fetchall()
+    if rows and isinstance(rows[0], dict):
+        return [dict(row) for row in rows]
+    columns = [c[0] for c in cur.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+def write_booked_ranges(cur, ranges: Dict[str, BookedRange], scope_booking_ids: Sequence[str]) -> Dict[str, int]:
+    '''
+    Приводит booked_ranges к желаемому состоянию одной строкой на бронь.
+    ranges — желаемые интервалы; scope_booking_ids — брони, чьи интервалы вне ranges надо удалить.
+    Переписываются только изменившиеся строки; возвращает число вставленных/изменённых и удалённых.
+    '''
+    stats = {'upserted': 0, 'deleted': 0}
+    rows = []
+    for booking_id, (room_id, check_in, check_out, bnovo_id, guest_name) in ranges.items():
+        check_in, check_out = to_date(check_in), to_date(check_out)
+        if check_out > check_in:
+            rows.append((booking_id, str(room_id), check_in, check_out, bnovo_id, guest_name))
+
+    for i in range(0, len(rows), RANGES_BATCH_SIZE):
+        psycopg2.extras.execute_values(cur, f"""
+            INSERT INTO {RANGES_TABLE} AS r (booking_id, room_id, stay, bnovo_id, guest_name)
+            SELECT v.booking_id, v.room_id, daterange(v.check_in, v.check_out, '[)'), v.bnovo_id, v.guest_name
+            FROM (VALUES %s) AS v (booking_id, room_id, check_in, check_out, bnovo_id, guest_name)
+            ON CONFLICT (booking_id) DO UPDATE SET
+                room_id = EXCLUDED.room_id,
+                stay = EXCLUDED.stay,
+                bnovo_id = EXCLUDED.bnovo_id,
+                guest_name = EXCLUDED.guest_name,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE (r.room_id, r.stay, r.bnovo_id, r.guest_name)
+                  IS DISTINCT FROM (EXCLUDED.room_id, EXCLUDED.stay, EXCLUDED.bnovo_id, EXCLUDED.guest_name)
+        """, rows[i:i + RANGES_BATCH_SIZE], template='(%s, %s, %s::date, %s::date, %s::bigint, %s::text)',
+           page_size=RANGES_BATCH_SIZE)
+        # rowcount — только реально изменённые строки: WHERE ... IS DISTINCT FROM отсекает совпавшие
+        stats['upserted'] += cur.rowcount
+
+    # Брони без ночей (выезд не позже заезда) тоже теряют интервал
+    kept = {row[0] for row in rows}
+    stale = [b for b in set(scope_booking_ids) | set(ranges) if b not in kept]
+    if stale:
+        cur.execute(f"DELETE FROM {RANGES_TABLE} WHERE booking_id = ANY(%s)", (stale,))
+        stats['deleted'] = cur.rowcount
+
+    return stats
+
+def is_room_free(cur, room_id: str, check_in: Any, check_out: Any) -> bool:
+    '''Свободна ли комната на [check_in, check_out): нет пересекающихся броней и закрытых тарифом дней'''
+    return bool(free_rooms(cur, check_in, check_out, [room_id]))
+
+def free_rooms(cur, check_in: Any, check_out: Any, room_ids: Optional[Sequence[str]] = None) -> List[str]:
+    '''Комнаты, свободные на весь интервал [check_in, check_out); поиск пересечений идёт по GiST-индексу'''
+    check_in, check_out = to_date(check_in), to_date(check_out)
+    if check_out <= check_in:
+        return []
+    cur.execute(f"""
+        SELECT r.id AS room_id
+        FROM t_p9202093_hotel_design_site.rooms r
+        WHERE (%(room_ids)s::text[] IS NULL OR r.id = ANY(%(room_ids)s::text[]))
+          AND NOT EXISTS (
+              SELECT 1 FROM {RANGES_TABLE} br
+              WHERE br.room_id = r.id AND br.stay && daterange(%(check_in)s, %(check_out)s, '[)')
+          )
+          AND NOT EXISTS (
+              SELECT 1 FROM {CALENDAR_TABLE} ac
+              WHERE ac.room_id = r.id AND ac.date >= %(check_in)s AND ac.date < %(check_out)s
+                AND ac.is_available = false AND ac.booking_id IS NULL
+          )
+        ORDER BY r.id
+    """, {'room_ids': list(room_ids) if room_ids is not None else None,
+          'check_in': check_in, 'check_out': check_out})
+    return [row['room_id'] for row in _fetch_dicts(cur)]
+
+def search_free_rooms(cur, check_in: Any, check_out: Any, guests: int = 1,
+                      min_price: Optional[float] = None, max_price: Optional[float] = None) -> List[Dict[str, Any]]:
+    '''
+    Апартаменты, свободные на всё [check_in, check_out), вместимостью от guests, с ценой проживания.
+    Цена ночи — тариф из availability_calendar, иначе rooms.price_per_night; границы цены — за ночь в среднем.
+    Пересечения с бронями ищутся по GiST (room_id, stay), ночи тарифов — по уникальному (room_id, date).
+    '''
+    check_in, check_out = to_date(check_in), to_date(check_out)
+    if check_out <= check_in:
+        return []
+    cur.execute(f"""
+        WITH nights AS (
+            SELECT generate_series(%(check_in)s::date, %(check_out)s::date - 1, interval '1 day')::date AS date
+        )
+        SELECT r.id AS room_id, r.number, r.bnovo_name, r.max_guests, r.bedrooms, r.bathrooms,
+               COUNT(*) AS nights,
+               SUM(COALESCE(ac.price, r.price_per_night)) AS total_price,
+               COUNT(*) FILTER (WHERE COALESCE(ac.price, r.price_per_night) IS NULL) AS unpriced_nights
+        FROM t_p9202093_hotel_design_site.rooms r
+        CROSS JOIN nights n
+        LEFT JOIN {CALENDAR_TABLE} ac ON ac.room_id = r.id AND ac.date = n.date
+        WHERE COALESCE(r.max_guests, 2) >= %(guests)s
+          AND NOT EXISTS (
+              SELECT 1 FROM {RANGES_TABLE} br
+              WHERE br.room_id = r.id AND br.stay && daterange(%(check_in)s, %(check_out)s, '[)')
+          )
+        GROUP BY r.id
+        HAVING bool_and(COALESCE(ac.is_available, true) OR ac.booking_id IS NOT NULL)
+           AND (%(min_price)s::numeric IS NULL OR SUM(COALESCE(ac.price, r.price_per_night)) / COUNT(*) >= %(min_price)s::numeric)
+           AND (%(max_price)s::numeric IS NULL OR SUM(COALESCE(ac.price, r.price_per_night)) / COUNT(*) <= %(max_price)s::numeric)
+        ORDER BY total_price NULLS LAST, r.id
+    """, {'check_in': check_in, 'check_out': check_out, 'guests': guests,
+          'min_price': min_price, 'max_price': max_price})
+    return _fetch_dicts(cur)
+
+def load_booked_ranges(cur, date_from: Optional[Any] = None, date_to: Optional[Any] = None,
+                       room_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    '''Интервалы, пересекающие [date_from, date_to); без границ — все. check_out не включается'''
+    lower = to_date(date_from) if date_from else None
+    upper = to_date(date_to) if date_to else None
+    cur.execute(f"""
+        SELECT br.booking_id, br.room_id, lower(br.stay) AS check_in, upper(br.stay) AS check_out,
+               br.bnovo_id, COALESCE(b.guest_name, br.guest_name) AS guest_name
+        FROM {RANGES_TABLE} br
+        LEFT JOIN t_p9202093_hotel_design_site.bookings b ON b.id = br.booking_id
+        WHERE br.stay && daterange(%(lower)s::date, %(upper)s::date, '[)')
+          AND (%(room_id)s::text IS NULL OR br.room_id = %(room_id)s::text)
+        ORDER BY br.room_id, lower(br.stay)
+    """, {'lower': lower, 'upper': upper, 'room_id': room_id})
+    return _fetch_dicts(cur)
+
+def iter_booked_nights(ranges: Iterable[Dict[str, Any]], date_from: Optional[Any] = None,
+                       date_to: Optional[Any] = None) -> Iterable[Tuple[str, date, Dict[str, Any]]]:
+    '''Ночи интервалов, обрезанные окном [date_from, date_to): (room_id, ночь, интервал)'''
+    lower = to_date(date_from) if date_from else None
+    upper = to_date(date_to) if date_to else None
+    for booked in ranges:
+        current = to_date(booked['check_in'])
+        end = to_date(booked['check_out'])
+        if lower and current < lower:
+            current = lower
+        if upper and end > upper:
+            end = upper
+        while current < end:
+            yield str(booked['room_id']), current, booked
+            current += timedelta(days=1)
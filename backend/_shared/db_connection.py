@@ -0,0 +1,92 @@
+import time
+from typing import Any, Dict, List, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+# Соединения с Postgres, переживающие вызовы функции: тёплый экземпляр не тратит
+# TLS-рукопожатие и аутентификацию на каждый запрос. Ключ — параметры подключения.
+_idle: Dict[Tuple[Any, ...], List['WarmConnection']] = {}
+# Сколько простаивающих соединений держать на один набор параметров
+POOL_SIZE = 2
+# Дольше простаивавшее соединение могли закрыть сервер или прокси — открываем новое
+MAX_IDLE_SECONDS = 300
+# Состав DISCARD ALL, кроме DEALLOCATE ALL и DISCARD PLANS
+SESSION_RESET = (
+    'CLOSE ALL', 'SET SESSION AUTHORIZATION DEFAULT', 'RESET ALL', 'UNLISTEN *',
+    'SELECT pg_advisory_unlock_all()', 'DISCARD TEMP', 'DISCARD SEQUENCES'
+)
+
+class WarmConnection(psycopg2.extensions.connection):
+    '''
+    Обычное соединение psycopg2, у которого close() возвращает его в пул экземпляра:
+    обработчикам не нужно менять свой conn.close(). Закрыть по-настоящему — discard().
+    '''
+
+    def close(self) -> None:
+        _release(self)
+
+    def discard(self) -> None:
+        super().close()
+
+def _key(dsn: str, kwargs: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (dsn,) + tuple(sorted((k, repr(v)) for k, v in kwargs.items()))
+
+def _healthy(conn: WarmConnection) -> bool:
+    '''Соединение живо и простаивало недолго; SELECT 1 дешевле нового рукопожатия'''
+    if conn.closed or time.monotonic() - conn.released_at > MAX_IDLE_SECONDS:
+        return False
+    try:
+        cur = psycopg2.extensions.cursor(conn)
+        cur.execute('SELECT 1')
+        cur.close()
+        # SELECT 1 открыл транзакцию — закрываем, чтобы обработчик начал с чистой
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _release(conn: WarmConnection) -> None:
+    '''Сброс состояния сессии и возврат в пул; сломанное соединение закрывается'''
+    pool = _idle.setdefault(conn.pool_key, [])
+    if conn.closed or conn in pool:
+        return
+    try:
+        # ROLLBACK незавершённой транзакции и сброс сессии: SET, временные таблицы, advisory locks
+        # и прочее, что обработчик поменял, не достанется следующему вызову. Это DISCARD ALL
+        # без DEALLOCATE ALL (conn.reset() шлёт именно DISCARD ALL): подготовленные запросы
+        # prepared.py должны пережить возврат в пул, иначе его реестр разойдётся с сервером
+        conn.rollback()
+        conn.autocommit = True
+        cur = psycopg2.extensions.cursor(conn)
+        for statement in SESSION_RESET:
+            cur.execute(statement)
+        cur.close()
+        conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT', deferrable='DEFAULT', autocommit=False)
+    except psycopg2.Error:
+        conn.discard()
+        return
+    if len(pool) >= POOL_SIZE:
+        conn.discard()
+        return
+    conn.released_at = time.monotonic()
+    pool.append(conn)
+
+def get_connection(dsn: str, cursor_factory: Any = None, **kwargs: Any) -> WarmConnection:
+    '''
+    Соединение из пула экземпляра или новое; параметры — как у psycopg2.connect.
+    cursor_factory применяется к каждому выданному соединению, а в ключ пула не входит.
+    '''
+    key = _key(dsn, kwargs)
+    pool = _idle.get(key) or []
+    while pool:
+        conn = pool.pop()
+        if _healthy(conn):
+            conn.cursor_factory = cursor_factory
+            return conn
+        conn.discard()
+
+    conn = psycopg2.connect(dsn, connection_factory=WarmConnection, cursor_factory=cursor_factory, **kwargs)
+    conn.pool_key = key
+    conn.released_at = time.monotonic()
+    return conn
@@ -0,0 +1,199 @@
+import base64
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import uuid
+import zipfile
+from datetime import date
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, Sequence
+from xml.sax.saxutils import escape
+
+import boto3
+
+# Выгрузки в CSV и XLSX без списков в памяти: строки идут из именованного (серверного) курсора
+# порциями, файл пишется порциями во временный файл, большой файл уходит в S3-хранилище
+# проекта и отдаётся ссылкой на CDN. Память функции не зависит от числа строк.
+# Копируется к функциям scripts/vendor_shared.py.
+CHUNK_ROWS = 2000
+# Файл до этого размера отдаётся прямо в ответе, больше — ссылкой на скачивание
+INLINE_LIMIT_BYTES = 1024 * 1024
+# После этого размера временный файл переезжает из памяти на диск
+SPOOL_BYTES = 1024 * 1024
+
+S3_ENDPOINT = 'https://bucket.poehali.dev'
+S3_BUCKET = 'files'
+EXPORT_PREFIX = 'exports'
+
+CSV_CONTENT_TYPE = 'text/csv; charset=utf-8'
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Минимальная книга XLSX с одним листом: без стилей и общих строк — строки пишутся inline,
+# поэтому лист можно писать в zip потоком, не собирая таблицу строк в памяти
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+_XLSX_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_XLSX_SHEET_TAIL = '</sheetData></worksheet>'
+# Управляющие символы недопустимы в XML — Excel не откроет файл
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def stream_query(conn, sql: str, params: Sequence[Any] = (), name: str = 'export') -> Iterator[Dict[str, Any]]:
+    '''
+    Строки запроса как dict, по CHUNK_ROWS за обращение к серверу. Курсор живёт внутри
+    транзакции соединения — генератор нужно дочитать до commit/rollback/close.
+    '''
+    with conn.cursor(name=f'{name}_{uuid.uuid4().hex[:12]}') as cur:
+        cur.itersize = CHUNK_ROWS
+        cur.execute(sql, list(params))
+        columns = None
+        while True:
+            rows = cur.fetchmany(CHUNK_ROWS)
+            if not rows:
+                break
+            if columns is None:
+                columns = [c[0] for c in cur.description]
+            for row in rows:
+                yield dict(row) if isinstance(row, dict) else dict(zip(columns, row))
+
+def write_csv(rows: Iterable[Dict[str, Any]], header: Sequence[str],
+              to_values: Callable[[Dict[str, Any]], Sequence[Any]]) -> Any:
+    '''CSV (UTF-8 с BOM — Excel открывает кириллицу без импорта) во временный файл; позиция — в конце'''
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, mode='w+b')
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(to_values(row))
+        if i % CHUNK_ROWS == 0:
+            out.write(buffer.getvalue().encode('utf-8'))
+            buffer.seek(0)
+            buffer.truncate()
+    out.write(buffer.getvalue().encode('utf-8'))
+    return out
+
+def _xlsx_cell(value: Any) -> str:
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, date):
+        value = value.isoformat()
+    text = escape(_XML_ILLEGAL.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def _xlsx_row(values: Sequence[Any]) -> str:
+    return '<row>' + ''.join(_xlsx_cell(v) for v in values) + '</row>'
+
+def write_xlsx(rows: Iterable[Dict[str, Any]], header: Sequence[str],
+               to_values: Callable[[Dict[str, Any]], Sequence[Any]]) -> Any:
+    '''XLSX во временный файл: лист пишется в zip потоком, по CHUNK_ROWS строк; позиция — в конце'''
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, mode='w+b')
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as book:
+        for name, content in _XLSX_PARTS.items():
+            book.writestr(name, content)
+        with book.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            buffer = [_XLSX_SHEET_HEAD, _xlsx_row(header)]
+            for i, row in enumerate(rows, 1):
+                buffer.append(_xlsx_row(to_values(row)))
+                if i % CHUNK_ROWS == 0:
+                    sheet.write(''.join(buffer).encode('utf-8'))
+                    buffer = []
+            buffer.append(_XLSX_SHEET_TAIL)
+            sheet.write(''.join(buffer).encode('utf-8'))
+    return out
+
+# format=... -> (запись файла, Content-Type); расширение файла — сам format
+EXPORT_FORMATS = {
+    'csv': (write_csv, CSV_CONTENT_TYPE),
+    'xlsx': (write_xlsx, XLSX_CONTENT_TYPE),
+}
+
+def upload_export(file: Any, filename: str, content_type: str = CSV_CONTENT_TYPE) -> str:
+    '''Файл в S3 (multipart порциями, целиком в память не читается) -> ссылка на CDN'''
+    access_key = os.environ.get('AWS_ACCESS_KEY_ID')
+    secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
+    if not access_key or not secret_key:
+        raise RuntimeError('File storage is not configured (AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY)')
+    s3 = boto3.client('s3', endpoint_url=S3_ENDPOINT,
+                      aws_access_key_id=access_key, aws_secret_access_key=secret_key)
+    key = f'{EXPORT_PREFIX}/{uuid.uuid4()}/{filename}'
+    file.seek(0)
+    s3.upload_fileobj(file, S3_BUCKET, key, ExtraArgs={
+        'ContentType': content_type,
+        'ContentDisposition': f'attachment; filename="{filename}"'
+    })
+    return f'https://cdn.poehali.dev/projects/{access_key}/bucket/{key}'
+
+def export_response(file: Any, filename: str, content_type: str = CSV_CONTENT_TYPE) -> Dict[str, Any]:
+    '''
+    Небольшой файл — телом ответа (attachment; двоичный, как XLSX, — в base64), большой —
+    JSON со ссылкой {url, fileName, size}
+    '''
+    size = file.tell()
+    try:
+        if size <= INLINE_LIMIT_BYTES:
+            file.seek(0)
+            content = file.read()
+            text = content_type.startswith('text/')
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': content_type,
+                    'Content-Disposition': f'attachment; filename="{filename}"',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'isBase64Encoded': not text,
+                'body': content.decode('utf-8') if text else base64.b64encode(content).decode('ascii')
+            }
+        url = upload_export(file, filename, content_type)
+    finally:
+        file.close()
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'isBase64Encoded': False,
+        'body': json.dumps({'url': url, 'fileName': filename, 'size': size})
+    }
@@ -0,0 +1,222 @@
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Аналитика собственника по апартаментам и месяцам — целиком в одном запросе:
+# ночи броней делятся по календарным месяцам, доступные ночи — дни месяца без закрытых
+# в календаре, выплаты и расходы — из booking_monthly_rollups (V0099), динамика — оконными функциями.
+# Прошлые месяцы кэшируются в owner_analytics_months (V0100, V0103); триггеры на bookings,
+# availability_calendar и rooms помечают затронутые месяцы устаревшими.
+# Копируется к функциям scripts/vendor_shared.py.
+BOOKINGS_TABLE = 't_p9202093_hotel_design_site.bookings'
+ROOMS_TABLE = 't_p9202093_hotel_design_site.rooms'
+CALENDAR_TABLE = 't_p9202093_hotel_design_site.availability_calendar'
+ROLLUPS_TABLE = 't_p9202093_hotel_design_site.booking_monthly_rollups'
+CACHE_TABLE = 't_p9202093_hotel_design_site.owner_analytics_months'
+
+# Больше месяцев за запрос не считаем: дашборд показывает год-два
+MAX_MONTHS = 36
+DEFAULT_MONTHS = 12
+
+EXPENSE_COLUMNS = ('maid', 'laundry', 'hygiene', 'transport', 'compliment', 'other')
+
+# Базовые метрики месяца (то, что кэшируется) -> тип для jsonb_to_record
+BASE_METRICS = {
+    'nights_in_month': 'integer', 'closed_nights': 'integer', 'booked_nights': 'integer',
+    'bookings_count': 'integer', 'revenue': 'numeric', 'total_amount': 'numeric',
+    'management_commission': 'numeric', 'operating_expenses': 'numeric',
+    'owner_funds': 'numeric', 'payment_to_owner': 'numeric',
+    **{column: 'numeric' for column in EXPENSE_COLUMNS},
+}
+
+_ANALYTICS_SQL = f"""
+    WITH apartments AS (
+        SELECT a.apartment_id, r.number
+        FROM unnest(%s::text[]) AS a(apartment_id)
+        LEFT JOIN {ROOMS_TABLE} r ON r.id = a.apartment_id
+    ),
+    -- С января года month_from (и не позже месяца до него): для LAG и сумм с начала года
+    grid AS (
+        SELECT a.apartment_id, a.number, m::date AS month, (m + interval '1 month')::date AS month_end
+        FROM apartments a
+        CROSS JOIN generate_series(
+            LEAST(date_trunc('year', %s::timestamp), %s::timestamp - interval '1 month'), %s::timestamp,
+            interval '1 month'
+        ) m
+    ),
+    known AS (
+        SELECT g.*, c.metrics, c.stale, c.generation
+        FROM grid g
+        LEFT JOIN {CACHE_TABLE} c ON c.apartment_id = g.apartment_id AND c.month = g.month
+    ),
+    cached AS (
+        SELECT apartment_id, month, metrics FROM known WHERE metrics IS NOT NULL AND NOT stale
+    ),
+    -- Нет в кэше или помечен устаревшим; generation из снимка запроса — см. stored
+    missing AS (
+        SELECT apartment_id, number, month, month_end, COALESCE(generation, 0) AS seen_generation
+        FROM known WHERE metrics IS NULL OR stale
+    ),
+    -- Бронь на стыке месяцев: ночи и выручка за проживание — пропорционально ночам в каждом месяце
+    stays AS (
+        SELECT m.apartment_id, m.month,
+               SUM(LEAST(b.check_out, m.month_end) - GREATEST(b.check_in, m.month)) AS booked_nights,
+               SUM(COALESCE(NULLIF(b.accommodation_amount, 0), b.total_amount, 0)
+                   * (LEAST(b.check_out, m.month_end) - GREATEST(b.check_in, m.month))
+                   / (b.check_out - b.check_in)) AS revenue
+        FROM missing m
+        JOIN {BOOKINGS_TABLE} b ON b.apartment_id = ANY(ARRAY[m.apartment_id, m.number])
+            AND b.check_in < m.month_end AND b.check_out > m.month
+        WHERE COALESCE(b.status, '') <> 'cancelled' AND b.check_out > b.check_in
+        GROUP BY m.apartment_id, m.month
+    ),
+    -- Закрытые дни: недоступные в календаре и не занятые бронью (владелец, ремонт)
+    closed AS (
+        SELECT m.apartment_id, m.month, COUNT(*) AS closed_nights
+        FROM missing m
+        JOIN {CALENDAR_TABLE} c ON c.room_id = m.apartment_id AND c.date >= m.month AND c.date < m.month_end
+        WHERE c.is_available = FALSE AND c.booking_id IS NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM {BOOKINGS_TABLE} b
+              WHERE b.apartment_id = ANY(ARRAY[m.apartment_id, m.number])
+                AND b.check_in <= c.date AND b.check_out > c.date AND COALESCE(b.status, '') <> 'cancelled'
+          )
+        GROUP BY m.apartment_id, m.month
+    ),
+    -- Финансы собственника — по месяцу заезда, как в отчётах и архиве
+    money AS (
+        SELECT m.apartment_id, m.month,
+               SUM(r.bookings_count) AS bookings_count, SUM(r.total_amount) AS total_amount,
+               SUM(r.management_commission) AS management_commission,
+               SUM(r.operating_expenses) AS operating_expenses,
+               SUM(r.owner_funds) AS owner_funds, SUM(r.payment_to_owner) AS payment_to_owner,
+               {', '.join(f'SUM(r.{c}) AS {c}' for c in EXPENSE_COLUMNS)}
+        FROM missing m
+        JOIN {ROLLUPS_TABLE} r ON r.apartment_id = ANY(ARRAY[m.apartment_id, m.number]) AND r.month = m.month
+        GROUP BY m.apartment_id, m.month
+    ),
+    fresh AS (
+        SELECT m.apartment_id, m.month, m.seen_generation, m.month < date_trunc('month', CURRENT_DATE) AS is_closed,
+               jsonb_build_object(
+                   'nights_in_month', m.month_end - m.month,
+                   'closed_nights', COALESCE(cl.closed_nights, 0),
+                   'booked_nights', COALESCE(s.booked_nights, 0),
+                   'bookings_count', COALESCE(mo.bookings_count, 0),
+                   'revenue', ROUND(COALESCE(s.revenue, 0), 2),
+                   'total_amount', COALESCE(mo.total_amount, 0),
+                   'management_commission', COALESCE(mo.management_commission, 0),
+                   'operating_expenses', COALESCE(mo.operating_expenses, 0),
+                   'owner_funds', COALESCE(mo.owner_funds, 0),
+                   'payment_to_owner', COALESCE(mo.payment_to_owner, 0),
+                   {', '.join(f"'{c}', COALESCE(mo.{c}, 0)" for c in EXPENSE_COLUMNS)}
+               ) AS metrics
+        FROM missing m
+        LEFT JOIN stays s ON s.apartment_id = m.apartment_id AND s.month = m.month
+        LEFT JOIN closed cl ON cl.apartment_id = m.apartment_id AND cl.month = m.month
+        LEFT JOIN money mo ON mo.apartment_id = m.apartment_id AND mo.month = m.month
+    ),
+    -- Метрики посчитаны по снимку начала запроса. Если за это время бронь или день календаря
+    -- в этом месяце уже закоммитили, триггер V0103 поднял generation — такие метрики не сохраняются
+    stored AS (
+        INSERT INTO {CACHE_TABLE} AS c (apartment_id, month, metrics, generation, stale, computed_at)
+        SELECT apartment_id, month, metrics, seen_generation, false, CURRENT_TIMESTAMP FROM fresh WHERE is_closed
+        ON CONFLICT (apartment_id, month) DO UPDATE SET
+            metrics = EXCLUDED.metrics, stale = false, computed_at = EXCLUDED.computed_at
+        WHERE c.stale AND c.generation = EXCLUDED.generation
+    ),
+    months AS (
+        SELECT x.apartment_id, x.month, m.*,
+               GREATEST(m.nights_in_month - m.closed_nights, m.booked_nights) AS available_nights
+        FROM (SELECT apartment_id, month, metrics FROM cached
+              UNION ALL SELECT apartment_id, month, metrics FROM fresh) x
+        CROSS JOIN LATERAL jsonb_to_record(x.metrics) AS m({', '.join(f'{k} {t}' for k, t in BASE_METRICS.items())})
+    ),
+    rated AS (
+        SELECT months.*,
+               ROUND(100.0 * booked_nights / NULLIF(available_nights, 0), 1) AS occupancy,
+               ROUND(revenue / NULLIF(booked_nights, 0), 2) AS adr,
+               ROUND(revenue / NULLIF(available_nights, 0), 2) AS revpar
+        FROM months
+    )
+    SELECT apartment_id, month, {', '.join(BASE_METRICS)}, available_nights, occupancy, adr, revpar,
+           occupancy - LAG(occupancy) OVER apartment_months AS occupancy_change,
+           SUM(owner_funds) OVER (PARTITION BY apartment_id, date_trunc('year', month) ORDER BY month) AS owner_funds_ytd,
+           ROUND(100.0 * SUM(booked_nights) OVER same_month / NULLIF(SUM(available_nights) OVER same_month, 0), 1)
+               AS portfolio_occupancy,
+           ROUND(SUM(revenue) OVER same_month / NULLIF(SUM(available_nights) OVER same_month, 0), 2)
+               AS portfolio_revpar
+    FROM rated
+    WINDOW apartment_months AS (PARTITION BY apartment_id ORDER BY month),
+           same_month AS (PARTITION BY month)
+    ORDER BY apartment_id, month
+"""
+
+def parse_month(raw: Optional[str], name: str) -> Optional[date]:
+    if not raw:
+        return None
+    try:
+        return datetime.strptime(raw, '%Y-%m').date()
+    except ValueError:
+        raise ValueError(f'{name} must be YYYY-MM')
+
+def month_range(month_from: Optional[str], month_to: Optional[str],
+                today: Optional[date] = None) -> Tuple[date, date]:
+    '''Границы периода (первые числа месяцев); по умолчанию — DEFAULT_MONTHS до текущего включительно'''
+    today = today or date.today()
+    end = parse_month(month_to, 'month_to') or today.replace(day=1)
+    start = parse_month(month_from, 'month_from')
+    if start is None:
+        index = end.year * 12 + end.month - DEFAULT_MONTHS
+        start = date(index // 12, index % 12 + 1, 1)
+    span = (end.year - start.year) * 12 + end.month - start.month + 1
+    if span < 1:
+        raise ValueError('month_from must not be after month_to')
+    if span > MAX_MONTHS:
+        raise ValueError(f'Period must not exceed {MAX_MONTHS} months')
+    return start, end
+
+def _number(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def owner_analytics(cur, apartment_ids: Sequence[str], start: date, end: date) -> List[Dict[str, Any]]:
+    '''
+    Метрики апартаментов по месяцам [start, end]: загрузка (%), ADR и RevPAR по выручке
+    за проживание, выплаты собственнику и статьи расходов. Пишет кэш — нужен conn.commit().
+    '''
+    if not apartment_ids:
+        return []
+    cur.execute(_ANALYTICS_SQL, (list(apartment_ids), start, start, end))
+    rows = cur.fetchall()
+    columns = [c[0] for c in cur.description]
+    result = []
+    for row in rows:
+        r = dict(row) if isinstance(row, dict) else dict(zip(columns, row))
+        if r['month'] < start:
+            continue
+        result.append({
+            'apartmentId': r['apartment_id'],
+            'month': r['month'].strftime('%Y-%m'),
+            'nightsAvailable': r['available_nights'],
+            'nightsBooked': r['booked_nights'],
+            'nightsClosed': r['closed_nights'],
+            'bookingsCount': r['bookings_count'],
+            'occupancy': _number(r['occupancy']),
+            'occupancyChange': _number(r['occupancy_change']),
+            'adr': _number(r['adr']),
+            'revpar': _number(r['revpar']),
+            'revenue': _number(r['revenue']),
+            'totalAmount': _number(r['total_amount']),
+            'managementCommission': _number(r['management_commission']),
+            'ownerFunds': _number(r['owner_funds']),
+            'ownerFundsYtd': _number(r['owner_funds_ytd']),
+            'paymentToOwner': _number(r['payment_to_owner']),
+            'expenses': {
+                'total': _number(r['operating_expenses']),
+                **{column: _number(r[column]) for column in EXPENSE_COLUMNS}
+            },
+            'portfolioOccupancy': _number(r['portfolio_occupancy']),
+            'portfolioRevpar': _number(r['portfolio_revpar']),
+        })
+    return result
@@ -0,0 +1,167 @@
+import json
+from typing import Any, Dict, Optional
+
+import psycopg2
+import psycopg2.errors
+
+# Одна блокировка на все синхронизации Bnovo: они качают одно и то же окно и пишут в одни календари
+SYNC_LOCK_KEY = 920209301
+# Сколько ждать идущую синхронизацию при ?wait=true; ограничено таймаутом функции
+DEFAULT_WAIT_SECONDS = 120
+MAX_WAIT_SECONDS = 240
+# Журнал запусков: result нужен только ждущим вызовам (не дольше MAX_WAIT_SECONDS),
+# сами строки — для running_status и разбора сбоев
+RUNS_RETENTION_DAYS = 30
+
+def wait_seconds_from(event: Dict[str, Any]) -> float:
+    '''?wait=true|<секунды> — дождаться идущей синхронизации вместо немедленного ответа'''
+    raw = str((event.get('queryStringParameters') or {}).get('wait', '')).strip().lower()
+    if raw in ('', '0', 'false', 'no'):
+        return 0.0
+    if raw in ('1', 'true', 'yes'):
+        return float(DEFAULT_WAIT_SECONDS)
+    try:
+        return max(0.0, min(float(raw), MAX_WAIT_SECONDS))
+    except ValueError:
+        return 0.0
+
+def _row_to_json(row: Optional[tuple], columns: tuple) -> Optional[Dict[str, Any]]:
+    if not row:
+        return None
+    return {c: (v.isoformat() if hasattr(v, 'isoformat') else v) for c, v in zip(columns, row)}
+
+class SyncLock:
+    '''
+    Single-flight для синхронизаций Bnovo на pg_try_advisory_lock.
+    Блокировка сессионная и живёт на отдельном autocommit-соединении: не зависит от транзакций
+    синхронизации и снимается сама, если процесс упал. Запуски пишутся в bnovo_sync_runs.
+    '''
+
+    def __init__(self, dsn: str, function_name: str):
+        self.function_name = function_name
+        self.conn = psycopg2.connect(dsn)
+        self.conn.autocommit = True
+        self.held = False
+        self.run_id: Optional[int] = None
+        self.recorded = False
+        # Результат запуска той же функции, завершившегося, пока мы ждали блокировку
+        self.coalesced: Optional[Dict[str, Any]] = None
+
+    def acquire(self, wait_seconds: float = 0, coalesce: bool = True) -> bool:
+        '''
+        Захват без ожидания, либо с ожиданием до wait_seconds; False — занято другим запуском.
+        coalesce=False — не подхватывать итог запуска, завершившегося за время ожидания
+        '''
+        cur = self.conn.cursor()
+        cur.execute("SELECT pg_try_advisory_lock(%s), CURRENT_TIMESTAMP::timestamp", (SYNC_LOCK_KEY,))
+        self.held, asked_at = cur.fetchone()
+        waited_since = None
+
+        if not self.held and wait_seconds > 0:
+            waited_since = asked_at
+            cur.execute("SELECT set_config('lock_timeout', %s, false)", (f'{int(wait_seconds * 1000)}ms',))
+            try:
+                cur.execute("SELECT pg_advisory_lock(%s)", (SYNC_LOCK_KEY,))
+                self.held = True
+            except psycopg2.errors.LockNotAvailable:
+                self.held = False
+            cur.execute("SELECT set_config('lock_timeout', '0', false)")
+
+        if not self.held:
+            cur.close()
+            return False
+
+        if waited_since is not None and coalesce:
+            # Пока ждали, такая же синхронизация могла закончиться — её результат и есть ответ
+            cur.execute("""
+                SELECT result FROM t_p9202093_hotel_design_site.bnovo_sync_runs
+                WHERE function_name = %s AND status = 'success' AND finished_at >= %s
+                ORDER BY finished_at DESC LIMIT 1
+            """, (self.function_name, waited_since))
+            row = cur.fetchone()
+            if row:
+                self.coalesced = row[0]
+                cur.close()
+                return True
+
+        # Под блокировкой других запусков нет: «running» остались от упавших процессов
+        cur.execute("""
+            UPDATE t_p9202093_hotel_design_site.bnovo_sync_runs
+            SET status = 'abandoned', finished_at = CURRENT_TIMESTAMP
+            WHERE status = 'running'
+        """)
+        # Под блокировкой же чистим журнал: старые запуски удаляются, итоги вне окна ожидания — обнуляются
+        cur.execute("""
+            DELETE FROM t_p9202093_hotel_design_site.bnovo_sync_runs
+            WHERE finished_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+        """, (RUNS_RETENTION_DAYS,))
+        cur.execute("""
+            UPDATE t_p9202093_hotel_design_site.bnovo_sync_runs
+            SET result = NULL
+            WHERE result IS NOT NULL AND finished_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+        """, (MAX_WAIT_SECONDS,))
+        cur.execute(
+            "INSERT INTO t_p9202093_hotel_design_site.bnovo_sync_runs (function_name) VALUES (%s) RETURNING id",
+            (self.function_name,)
+        )
+        self.run_id = cur.fetchone()[0]
+        cur.close()
+        return True
+
+    def running_status(self) -> Dict[str, Any]:
+        '''Что сейчас держит блокировку и чем закончился прошлый запуск этой функции'''
+        cur = self.conn.cursor()
+        cur.execute("""
+            SELECT id, function_name, started_at,
+                   ROUND(EXTRACT(EPOCH FROM CURRENT_TIMESTAMP::timestamp - started_at)) AS running_seconds
+            FROM t_p9202093_hotel_design_site.bnovo_sync_runs
+            WHERE status = 'running'
+            ORDER BY started_at DESC LIMIT 1
+        """)
+        running = _row_to_json(cur.fetchone(), ('run_id', 'function_name', 'started_at', 'running_seconds'))
+        if running and running['running_seconds'] is not None:
+            running['running_seconds'] = int(running['running_seconds'])
+        cur.execute("""
+            SELECT id, status, started_at, finished_at
+            FROM t_p9202093_hotel_design_site.bnovo_sync_runs
+            WHERE function_name = %s AND finished_at IS NOT NULL
+            ORDER BY finished_at DESC LIMIT 1
+        """, (self.function_name,))
+        last_run = _row_to_json(cur.fetchone(), ('run_id', 'status', 'started_at', 'finished_at'))
+        cur.close()
+        return {'running': running, 'last_run': last_run}
+
+    def record(self, result: Dict[str, Any], success: bool = True) -> None:
+        '''
+        Итог запуска: его отдадут вызовам, которые ждали блокировку. Только сводка (счётчики,
+        метрики, ошибка) — брони и данные гостей в журнал не пишутся
+        '''
+        if self.run_id is None or self.recorded:
+            return
+        cur = self.conn.cursor()
+        cur.execute("""
+            UPDATE t_p9202093_hotel_design_site.bnovo_sync_runs
+            SET status = %s, finished_at = CURRENT_TIMESTAMP, result = %s
+            WHERE id = %s
+        """, ('success' if success else 'failed', json.dumps(result, ensure_ascii=False, default=str), self.run_id))
+        cur.close()
+        self.recorded = True
+
+    def release(self) -> None:
+        '''Снятие блокировки и закрытие соединения; безопасно вызывать повторно'''
+        if self.conn is None:
+            return
+        try:
+            if self.run_id is not None and not self.recorded:
+                self.record({'success': False, 'error': 'sync finished without result'}, success=False)
+            if self.held:
+                cur = self.conn.cursor()
+                cur.execute("SELECT pg_advisory_unlock(%s)", (SYNC_LOCK_KEY,))
+                cur.close()
+        except psycopg2.Error as e:
+            # Закрытие соединения всё равно снимет сессионную блокировку
+            print(f'[SYNC LOCK] release failed: {e}')
+        finally:
+            self.held = False
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,36 @@
+'''
+Тесты общих модулей против настоящего Postgres. Нужна пустая тестовая база:
+
+    createdb shared_tests
+    TEST_DATABASE_URL=postgresql://localhost/shared_tests python3 -m pytest backend/_shared/tests
+
+Без TEST_DATABASE_URL (или без psycopg2) тесты пропускаются. Схема t_p9202093_hotel_design_site
+в тестовой базе пересоздаётся из db_migrations, как в scripts/bench_bnovo_sync.py.
+'''
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+SHARED_DIR = Path(__file__).resolve().parent.parent
+ROOT = SHARED_DIR.parent.parent
+sys.path.insert(0, str(SHARED_DIR))
+sys.path.insert(0, str(ROOT / 'scripts'))
+
+@pytest.fixture(scope='session')
+def dsn() -> str:
+    value = os.environ.get('TEST_DATABASE_URL')
+    if not value:
+        pytest.skip('TEST_DATABASE_URL не задан')
+    return value
+
+@pytest.fixture(scope='session')
+def schema_dsn(dsn: str) -> str:
+    '''Тестовая база со схемой из всех миграций'''
+    from bench_bnovo_sync import prepare_schema
+
+    failed = prepare_schema(dsn)
+    if failed:
+        pytest.fail('Миграции не применились:\n' + '\n'.join(failed))
+    return dsn
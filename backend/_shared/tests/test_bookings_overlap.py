@@ -0,0 +1,34 @@
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+import psycopg2.errors  # noqa: E402
+
+SCHEMA = 't_p9202093_hotel_design_site'
+INSERT = f"""
+    INSERT INTO {SCHEMA}.bookings (id, apartment_id, check_in, check_out, accommodation_amount, total_amount, source)
+    VALUES (%s, 'overlap-test', '2030-03-01', '2030-03-05', 1000, 1000, %s)
+    RETURNING overbooked
+"""
+
+@pytest.fixture
+def cur(schema_dsn):
+    conn = psycopg2.connect(schema_dsn)
+    cur = conn.cursor()
+    cur.execute(f"DELETE FROM {SCHEMA}.bookings WHERE apartment_id = 'overlap-test'")
+    cur.execute(INSERT, ('overlap-first', 'website'))
+    conn.commit()
+    yield cur
+    conn.rollback()
+    cur.execute(f"DELETE FROM {SCHEMA}.bookings WHERE apartment_id = 'overlap-test'")
+    conn.commit()
+    conn.close()
+
+def test_bnovo_source_outside_sync_hits_constraint(cur):
+    # create-booking и админка: source из запроса не обходит bookings_no_overlap
+    with pytest.raises(psycopg2.errors.ExclusionViolation):
+        cur.execute(INSERT, ('overlap-second', 'bnovo'))
+
+def test_sync_transaction_flags_bnovo_overbooking(cur):
+    cur.execute("SELECT set_config('app.bnovo_sync', 'on', true)")
+    cur.execute(INSERT, ('overlap-second', 'bnovo'))
+    assert cur.fetchone() == (True,)
@@ -0,0 +1,121 @@
+import threading
+import time
+from datetime import date
+
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+from owner_analytics import owner_analytics  # noqa: E402
+
+SCHEMA = 't_p9202093_hotel_design_site'
+JANUARY, FEBRUARY = date(2025, 1, 1), date(2025, 2, 1)
+
+@pytest.fixture
+def conn(schema_dsn):
+    conn = psycopg2.connect(schema_dsn)
+    cur = conn.cursor()
+    cur.execute(f"DELETE FROM {SCHEMA}.availability_calendar WHERE room_id = 'r-test'")
+    cur.execute(f"DELETE FROM {SCHEMA}.bookings WHERE apartment_id IN ('r-test', '901')")
+    cur.execute(f"DELETE FROM {SCHEMA}.rooms WHERE id = 'r-test'")
+    cur.execute(f"INSERT INTO {SCHEMA}.rooms (id, number, floor) VALUES ('r-test', '901', 9)")
+    # Бронь Bnovo по номеру комнаты на стыке месяцев: 2 ночи в январе, 2 в феврале
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.bookings (id, apartment_id, check_in, check_out, accommodation_amount, total_amount, source)
+        VALUES ('b-test', '901', '2025-01-30', '2025-02-03', 4000, 4000, 'bnovo')
+    """)
+    # Закрытый владельцем день
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.availability_calendar (room_id, date, is_available) VALUES ('r-test', '2025-01-10', false)
+    """)
+    # Вставки выше оставили метки триггеров — тесты начинают с пустого кэша
+    cur.execute(f'DELETE FROM {SCHEMA}.owner_analytics_months')
+    conn.commit()
+    yield conn
+    conn.rollback()
+    conn.close()
+
+def by_month(rows):
+    return {row['month']: row for row in rows}
+
+def cache_row(cur, month):
+    cur.execute(
+        f"SELECT metrics IS NOT NULL, stale, generation FROM {SCHEMA}.owner_analytics_months "
+        "WHERE apartment_id = 'r-test' AND month = %s", (month,)
+    )
+    return cur.fetchone()
+
+def test_metrics_split_by_month_and_cached(conn):
+    cur = conn.cursor()
+    months = by_month(owner_analytics(cur, ['r-test'], JANUARY, FEBRUARY))
+    conn.commit()
+
+    january, february = months['2025-01'], months['2025-02']
+    assert (january['nightsBooked'], january['nightsClosed'], january['nightsAvailable']) == (2, 1, 30)
+    assert january['revenue'] == 2000
+    assert january['adr'] == 1000
+    assert january['occupancy'] == pytest.approx(6.7)
+    assert (february['nightsBooked'], february['nightsAvailable']) == (2, 28)
+    assert february['occupancyChange'] == pytest.approx(round(100 * 2 / 28, 1) - 6.7)
+    assert cache_row(cur, JANUARY) == (True, False, 0)
+
+def test_write_marks_cached_month_stale_and_next_read_recomputes(conn):
+    cur = conn.cursor()
+    owner_analytics(cur, ['r-test'], JANUARY, FEBRUARY)
+    conn.commit()
+
+    cur.execute(f"UPDATE {SCHEMA}.bookings SET accommodation_amount = 8000 WHERE id = 'b-test'")
+    conn.commit()
+    assert cache_row(cur, JANUARY) == (True, True, 1)
+
+    months = by_month(owner_analytics(cur, ['r-test'], JANUARY, FEBRUARY))
+    conn.commit()
+    assert months['2025-01']['revenue'] == 4000
+    assert cache_row(cur, JANUARY) == (True, False, 1)
+
+def wait_for_lock(cur, pid):
+    for _ in range(100):
+        cur.execute("SELECT wait_event_type FROM pg_stat_activity WHERE pid = %s", (pid,))
+        if cur.fetchone() == ('Lock',):
+            return
+        time.sleep(0.05)
+    pytest.fail('запрос аналитики не дождался записи')
+
+def test_write_committed_during_read_is_not_overwritten(conn, schema_dsn):
+    # Запись открыта, но не закоммичена: снимок запроса аналитики её не видит,
+    # а вставка в кэш ждёт строку-метку триггера
+    writer_conn = psycopg2.connect(schema_dsn)
+    writer = writer_conn.cursor()
+    writer.execute(f"UPDATE {SCHEMA}.bookings SET accommodation_amount = 8000 WHERE id = 'b-test'")
+
+    result = {}
+    reader = threading.Thread(
+        target=lambda: result.update(by_month(owner_analytics(conn.cursor(), ['r-test'], JANUARY, FEBRUARY)))
+    )
+    reader.start()
+    wait_for_lock(writer, conn.info.backend_pid)
+    writer_conn.commit()
+    reader.join()
+    conn.commit()
+    assert result['2025-01']['revenue'] == 2000
+
+    # Метрики из старого снимка не сохранились: месяц остаётся помеченным до следующего чтения
+    assert cache_row(writer, JANUARY) == (False, True, 1)
+    months = by_month(owner_analytics(conn.cursor(), ['r-test'], JANUARY, FEBRUARY))
+    conn.commit()
+    assert months['2025-01']['revenue'] == 4000
+    assert cache_row(writer, JANUARY) == (True, False, 1)
+    writer_conn.close()
+
+def test_room_number_change_marks_cache_stale(conn):
+    cur = conn.cursor()
+    owner_analytics(cur, ['r-test'], JANUARY, FEBRUARY)
+    conn.commit()
+
+    cur.execute(f"UPDATE {SCHEMA}.rooms SET number = '902' WHERE id = 'r-test'")
+    conn.commit()
+    assert cache_row(cur, JANUARY)[1] is True
+
+    months = by_month(owner_analytics(cur, ['r-test'], JANUARY, FEBRUARY))
+    conn.commit()
+    assert months['2025-01']['nightsBooked'] == 0
@@ -0,0 +1,70 @@
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+import prepared  # noqa: E402
+from db_connection import get_connection  # noqa: E402
+from prepared import execute_prepared, statement_name  # noqa: E402
+
+def test_prepared_statement_survives_warm_reuse(dsn):
+    sql = 'SELECT %s::int + 1'
+    conn = get_connection(dsn)
+    cur = conn.cursor()
+    execute_prepared(cur, sql, [1])
+    assert cur.fetchone() == (2,)
+    conn.commit()
+    conn.close()
+
+    reused = get_connection(dsn)
+    assert reused is conn
+    cur = reused.cursor()
+    # Не первый запрос транзакции: при расхождении реестра с сервером восстановиться нельзя
+    cur.execute('SELECT 1')
+    execute_prepared(cur, sql, [41])
+    assert cur.fetchone() == (42,)
+    cur.execute('SELECT count(*) FROM pg_prepared_statements WHERE name = %s', (statement_name(sql),))
+    assert cur.fetchone() == (1,)
+    reused.discard()
+
+def test_release_resets_session_state(dsn):
+    conn = get_connection(dsn)
+    cur = conn.cursor()
+    cur.execute("SET application_name = 'dirty'")
+    cur.execute('CREATE TEMP TABLE scratch (id int)')
+    conn.commit()
+    conn.close()
+
+    reused = get_connection(dsn)
+    cur = reused.cursor()
+    cur.execute('SHOW application_name')
+    assert cur.fetchone() != ('dirty',)
+    cur.execute("SELECT to_regclass('pg_temp.scratch')")
+    assert cur.fetchone() == (None,)
+    reused.discard()
+
+def test_changed_result_type_is_deallocated_before_reprepare(dsn):
+    conn = get_connection(dsn)
+    cur = conn.cursor()
+    cur.execute('CREATE TEMP TABLE shape (a int)')
+    sql = 'SELECT * FROM shape'
+    execute_prepared(cur, sql)
+    conn.commit()
+    cur.execute('ALTER TABLE shape ADD COLUMN b int')
+    conn.commit()
+
+    cur.execute('SELECT 1')
+    try:
+        execute_prepared(cur, sql)
+        raised = False
+    except psycopg2.errors.FeatureNotSupported:
+        raised = True
+    conn.rollback()
+    assert raised
+
+    # Следующая транзакция, снова не с первого запроса: DEALLOCATE + PREPARE, а не DuplicatePreparedStatement
+    cur.execute('SELECT 1')
+    execute_prepared(cur, sql)
+    assert [c[0] for c in cur.description] == ['a', 'b']
+    conn.rollback()
+    prepared.forget(conn)
+    conn.discard()
@@ -1,7 +1,9 @@
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
+from booked_ranges import iter_booked_nights, load_booked_ranges
+from snapshot_cache import cached_json_response
 
 # Force redeploy
 
@@ -20,7 +22,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -29,6 +31,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     try:
         import psycopg2
         import psycopg2.extras
+        from db_connection import get_connection
+        from prepared import execute_prepared
         
         params = event.get('queryStringParameters', {}) or {}
         room_id = params.get('room_id', '')
@@ -52,29 +56,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         # Подключаемся к базе данных
-        conn = psycopg2.connect(database_url)
+        conn = get_connection(database_url)
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
-        # Получаем информацию об апартаменте
-        cur.execute("""
-            SELECT id, number, floor, bnovo_name, description, 
-                   price_per_night, max_guests, bedrooms, bathrooms, 
-                   area, images, amenities, address
-            FROM t_p9202093_hotel_design_site.rooms
-            WHERE id = %s
-        """, (room_id,))
-        
-        apartment = cur.fetchone()
-        
-        if not apartment:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Apartment not found'})
-            }
-        
         # Рассчитываем диапазон дат для месяца
         start_date = datetime(year, month, 1).date()
         if month == 12:
@@ -82,50 +66,63 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         else:
             end_date = datetime(year, month + 1, 1).date()
         
-        # Получаем календарь доступности
-        cur.execute("""
-            SELECT date, is_available, price, booking_id
-            FROM t_p9202093_hotel_design_site.availability_calendar
-            WHERE room_id = %s 
-              AND date >= %s 
-              AND date < %s
-            ORDER BY date
-        """, (room_id, start_date, end_date))
-        
-        calendar_data = cur.fetchall()
-        
-        # Формируем календарь для всех дней месяца
-        calendar = []
-        current_date = start_date
-        calendar_dict = {row['date']: row for row in calendar_data}
-        
-        while current_date < end_date:
-            if current_date in calendar_dict:
-                day_data = calendar_dict[current_date]
-                calendar.append({
-                    'date': current_date.isoformat(),
-                    'available': day_data['is_available'],
-                    'price': float(day_data['price']) if day_data['price'] else float(apartment['price_per_night'] or 0),
-                    'booked': day_data['booking_id'] is not None
-                })
-            else:
-                # День не в календаре - считаем доступным
-                calendar.append({
-                    'date': current_date.isoformat(),
-                    'available': True,
-                    'price': float(apartment['price_per_night'] or 0),
-                    'booked': False
-                })
+        def build_calendar() -> Optional[Dict[str, Any]]:
+            # Получаем информацию об апартаменте
+            execute_prepared(cur, """
+                SELECT id, number, floor, bnovo_name, description, 
+                       price_per_night, max_guests, bedrooms, bathrooms, 
+                       area, images, amenities, address
+                FROM t_p9202093_hotel_design_site.rooms
+                WHERE id = %s
+            """, (room_id,))
             
-            current_date += timedelta(days=1)
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
+            apartment = cur.fetchone()
+            if not apartment:
+                return None
+            
+            # Тарифы и закрытые дни — из availability_calendar, занятость — интервалами из booked_ranges
+            execute_prepared(cur, """
+                SELECT date, is_available, price
+                FROM t_p9202093_hotel_design_site.availability_calendar
+                WHERE room_id = %s 
+                  AND date >= %s 
+                  AND date < %s
+                ORDER BY date
+            """, (room_id, start_date, end_date))
+            
+            calendar_data = cur.fetchall()
+            booked_nights = {
+                night for _, night, _ in iter_booked_nights(
+                    load_booked_ranges(cur, start_date, end_date, room_id), start_date, end_date
+                )
+            }
+            
+            # Формируем календарь для всех дней месяца
+            calendar = []
+            current_date = start_date
+            calendar_dict = {row['date']: row for row in calendar_data}
+            
+            while current_date < end_date:
+                if current_date in calendar_dict:
+                    day_data = calendar_dict[current_date]
+                    calendar.append({
+                        'date': current_date.isoformat(),
+                        'available': day_data['is_available'] and current_date not in booked_nights,
+                        'price': float(day_data['price']) if day_data['price'] else float(apartment['price_per_night'] or 0),
+                        'booked': current_date in booked_nights
+                    })
+                else:
+                    # День не в календаре тарифов - доступен, если не занят бронью
+                    calendar.append({
+                        'date': current_date.isoformat(),
+                        'available': current_date not in booked_nights,
+                        'price': float(apartment['price_per_night'] or 0),
+                        'booked': current_date in booked_nights
+                    })
+            
+                current_date += timedelta(days=1)
+            
+            return {
                 'apartment': {
                     'id': apartment['id'],
                     'name': apartment['bnovo_name'] or apartment['number'],
@@ -142,8 +139,22 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'calendar': calendar,
                 'month': month,
                 'year': year
-            }, ensure_ascii=False)
-        }
+            }
+            
+                # Готовый ответ берётся из снимка текущей версии календаря; при совпадении ETag — 304
+        response = cached_json_response(conn, event, f'apartment-availability:{room_id}:{year}-{month:02d}', build_calendar)
+        
+        cur.close()
+        conn.close()
+        
+        if response is None:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Apartment not found'})
+            }
+        
+        return response
     
     except Exception as e:
         import traceback
@@ -1,7 +1,7 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from db_connection import get_connection
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -43,7 +43,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
+    conn = get_connection(dsn)
     conn.autocommit = True
     cur = conn.cursor()
     
@@ -0,0 +1,487 @@
+# Копия backend/_shared/bnovo_client.py. Не редактировать: правьте оригинал и запустите python3 scripts/vendor_shared.py
+import base64
+import gzip
+import http.client
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+BNOVO_API_URL = os.environ.get('BNOVO_API_URL', 'https://api.pms.bnovo.ru').rstrip('/')
+# Bnovo отдаёт не больше 20 броней на страницу; параметр оставлен настраиваемым
+PAGE_SIZE = int(os.environ.get('BNOVO_PAGE_SIZE', '20'))
+MAX_WORKERS = int(os.environ.get('BNOVO_MAX_WORKERS', '6'))
+RATES_MAX_WORKERS = int(os.environ.get('BNOVO_RATES_MAX_WORKERS', '8'))
+SLICE_DAYS = int(os.environ.get('BNOVO_SLICE_DAYS', '14'))
+# Защита от бесконечной пагинации: при превышении — ошибка, а не молчаливое усечение
+MAX_PAGES_PER_SLICE = 500
+REQUEST_TIMEOUT = 30
+# Повторы с экспоненциальной задержкой и полным джиттером на 429/5xx и сетевых ошибках
+MAX_RETRIES = int(os.environ.get('BNOVO_MAX_RETRIES', '4'))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 10.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Circuit breaker: после N подряд неудачных вызовов Bnovo не дёргаем COOLDOWN секунд
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+POOL_SIZE = 10
+# Срок жизни токена, если Bnovo не сообщил его ни в ответе, ни в JWT
+TOKEN_DEFAULT_TTL = 3600
+# Токен обновляется заранее, чтобы не истёк посреди синхронизации
+TOKEN_EXPIRY_MARGIN = 120
+
+DateLike = Union[date, datetime, str]
+
+class BnovoFetchError(Exception):
+    pass
+
+class BnovoAuthError(BnovoFetchError):
+    pass
+
+class BnovoHTTPError(BnovoFetchError):
+    def __init__(self, status: int, body: str, path: str):
+        super().__init__(f'Bnovo HTTP {status} for {path}: {body[:300]}')
+        self.status = status
+        self.body = body
+        self.path = path
+
+class BnovoCircuitOpenError(BnovoFetchError):
+    pass
+
+# Токен живёт в области модуля и переживает тёплые вызовы функции
+_token_lock = threading.Lock()
+_token_cache: Dict[str, Any] = {'token': None, 'expires_at': 0.0}
+# Токен, на который Bnovo ответил 401: такой из bnovo_auth_tokens больше не берём
+_rejected_token: Dict[str, Optional[str]] = {'token': None}
+_token_store_dsn: Optional[str] = None
+
+def _to_date(value: DateLike) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+def _token_expires_at(token: str, auth_data: Dict[str, Any]) -> float:
+    '''Момент истечения токена: expires_in из ответа, иначе claim exp из JWT'''
+    data = auth_data.get('data') if isinstance(auth_data.get('data'), dict) else auth_data
+    expires_in = data.get('expires_in')
+    if isinstance(expires_in, (int, float)) and expires_in > 0:
+        return time.time() + expires_in
+    try:
+        payload_part = token.split('.')[1]
+        payload_part += '=' * (-len(payload_part) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload_part)).get('exp')
+        if isinstance(exp, (int, float)):
+            return float(exp)
+    except (IndexError, ValueError):
+        pass
+    return time.time() + TOKEN_DEFAULT_TTL
+
+def enable_db_token_store(dsn: Optional[str]) -> None:
+    '''Хранить токен также в bnovo_auth_tokens, чтобы холодный старт не ходил в /auth'''
+    global _token_store_dsn
+    _token_store_dsn = dsn or None
+
+def _load_stored_token(account_id: str) -> Optional[Tuple[str, float]]:
+    from db_connection import get_connection
+    conn = get_connection(_token_store_dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT access_token, EXTRACT(EPOCH FROM expires_at) "
+            "FROM t_p9202093_hotel_design_site.bnovo_auth_tokens WHERE account_id = %s",
+            (account_id,)
+        )
+        row = cur.fetchone()
+        return (row[0], float(row[1])) if row else None
+    finally:
+        conn.close()
+
+def _save_stored_token(account_id: str, token: str, expires_at: float) -> None:
+    from db_connection import get_connection
+    conn = get_connection(_token_store_dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO t_p9202093_hotel_design_site.bnovo_auth_tokens (account_id, access_token, expires_at, updated_at)
+            VALUES (%s, %s, to_timestamp(%s) AT TIME ZONE 'UTC', CURRENT_TIMESTAMP)
+            ON CONFLICT (account_id) DO UPDATE SET
+                access_token = EXCLUDED.access_token,
+                expires_at = EXCLUDED.expires_at,
+                updated_at = EXCLUDED.updated_at
+        """, (account_id, token, expires_at))
+        conn.commit()
+    finally:
+        conn.close()
+
+def _expire_stored_token(account_id: str, token: str) -> None:
+    '''Отклонённый токен в таблице помечается истёкшим — другие функции тоже пойдут за новым'''
+    from db_connection import get_connection
+    conn = get_connection(_token_store_dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE t_p9202093_hotel_design_site.bnovo_auth_tokens
+            SET expires_at = CURRENT_TIMESTAMP AT TIME ZONE 'UTC', updated_at = CURRENT_TIMESTAMP
+            WHERE account_id = %s AND access_token = %s
+        """, (account_id, token))
+        conn.commit()
+    finally:
+        conn.close()
+
+def authenticate() -> Tuple[str, float]:
+    '''POST /api/v1/auth с учётными данными из BNOVO_ACCOUNT_ID / BNOVO_PASSWORD'''
+    account_id = os.environ.get('BNOVO_ACCOUNT_ID', '')
+    password = os.environ.get('BNOVO_PASSWORD', '')
+    if not account_id or not password:
+        raise BnovoAuthError('BNOVO credentials not configured')
+
+    auth_data = request_json('/api/v1/auth', payload={'id': int(account_id), 'password': password}, auth=False)
+    data = auth_data.get('data') if isinstance(auth_data.get('data'), dict) else {}
+    token = data.get('access_token') or auth_data.get('access_token') or auth_data.get('token')
+    if not token:
+        raise BnovoAuthError('Failed to get Bnovo token')
+    return token, _token_expires_at(token, auth_data)
+
+def get_token(force_refresh: bool = False) -> str:
+    '''
+    JWT Bnovo из кэша: память процесса -> таблица bnovo_auth_tokens (если включена) -> /api/v1/auth.
+    Повторная авторизация только при истечении срока или после 401.
+    '''
+    with _token_lock:
+        now = time.time()
+        if not force_refresh and _token_cache['token'] and _token_cache['expires_at'] - TOKEN_EXPIRY_MARGIN > now:
+            return _token_cache['token']
+
+        account_id = os.environ.get('BNOVO_ACCOUNT_ID', '')
+        if _token_store_dsn and not force_refresh:
+            try:
+                stored = _load_stored_token(account_id)
+                if stored and stored[0] != _rejected_token['token'] and stored[1] - TOKEN_EXPIRY_MARGIN > now:
+                    _token_cache.update(token=stored[0], expires_at=stored[1])
+                    return stored[0]
+            except Exception as e:
+                print(f'[BNOVO] Token store read failed: {e}')
+
+        token, expires_at = authenticate()
+        _token_cache.update(token=token, expires_at=expires_at)
+        if _token_store_dsn:
+            try:
+                _save_stored_token(account_id, token, expires_at)
+            except Exception as e:
+                print(f'[BNOVO] Token store write failed: {e}')
+        return token
+
+def invalidate_token(token: str) -> None:
+    '''
+    Сброс токена после 401, если его ещё не заменил другой поток. Токен помечается
+    отклонённым и в bnovo_auth_tokens, иначе get_token() снова прочитал бы его оттуда.
+    '''
+    with _token_lock:
+        if _token_cache['token'] == token:
+            _token_cache.update(token=None, expires_at=0.0)
+        if _rejected_token['token'] == token:
+            return
+        _rejected_token['token'] = token
+        if _token_store_dsn:
+            try:
+                _expire_stored_token(os.environ.get('BNOVO_ACCOUNT_ID', ''), token)
+            except Exception as e:
+                print(f'[BNOVO] Token store invalidate failed: {e}')
+
+class _ConnectionPool:
+    '''Keep-alive соединения к Bnovo: TLS-рукопожатие один раз на соединение, а не на запрос'''
+
+    def __init__(self, base_url: str, size: int):
+        parts = urllib.parse.urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self._idle: 'queue.LifoQueue[http.client.HTTPConnection]' = queue.LifoQueue(maxsize=size)
+
+    def acquire(self) -> http.client.HTTPConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            conn_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            return conn_class(self.host, self.port, timeout=REQUEST_TIMEOUT)
+
+    def release(self, conn: http.client.HTTPConnection, reusable: bool) -> None:
+        if reusable:
+            try:
+                self._idle.put_nowait(conn)
+                return
+            except queue.Full:
+                pass
+        conn.close()
+
+class _CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.failures >= self.threshold and time.time() - self.opened_at < self.cooldown:
+                raise BnovoCircuitOpenError(
+                    f'Bnovo circuit open after {self.failures} failures, retry in '
+                    f'{self.cooldown - (time.time() - self.opened_at):.0f}s'
+                )
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if success:
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                # Полуоткрытое состояние: после паузы пропускаем пробный вызов, неудача снова открывает
+                self.opened_at = time.time()
+
+class _Metrics:
+    '''Задержки вызовов Bnovo за время жизни процесса (или с последнего reset_metrics)'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: List[Dict[str, Any]] = []
+
+    def add(self, method: str, path: str, status: Optional[int], latency_ms: float, attempts: int) -> None:
+        with self._lock:
+            self.calls.append({
+                'method': method, 'path': path, 'status': status,
+                'latency_ms': latency_ms, 'attempts': attempts
+            })
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = []
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = list(self.calls)
+        latencies = sorted(c['latency_ms'] for c in calls)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1)
+
+        by_path: Dict[str, Dict[str, Any]] = {}
+        for c in calls:
+            stats = by_path.setdefault(c['path'], {'calls': 0, 'total_ms': 0.0})
+            stats['calls'] += 1
+            stats['total_ms'] = round(stats['total_ms'] + c['latency_ms'], 1)
+        return {
+            'calls': len(calls),
+            'errors': sum(1 for c in calls if c['status'] is None or c['status'] >= 400),
+            'retries': sum(c['attempts'] - 1 for c in calls),
+            'total_ms': round(sum(latencies), 1),
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'max_ms': round(latencies[-1], 1) if latencies else 0.0,
+            'by_path': by_path
+        }
+
+_pool = _ConnectionPool(BNOVO_API_URL, POOL_SIZE)
+_breaker = _CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+_metrics = _Metrics()
+
+def get_metrics() -> Dict[str, Any]:
+    '''Сводка по HTTP-вызовам Bnovo: число, ошибки, повторы, p50/p95 задержки'''
+    return _metrics.summary()
+
+def reset_metrics() -> None:
+    _metrics.reset()
+
+def _retry_delay(attempt: int, retry_after: Optional[str]) -> float:
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), RETRY_MAX_DELAY)
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+def _send_once(method: str, target: str, headers: Dict[str, str], data: Optional[bytes]) -> Tuple[int, Dict[str, str], bytes]:
+    conn = _pool.acquire()
+    reusable = False
+    try:
+        conn.request(method, target, body=data, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        reusable = not response.will_close
+        if (response.getheader('Content-Encoding') or '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        return response.status, {k.lower(): v for k, v in response.getheaders()}, body
+    finally:
+        _pool.release(conn, reusable)
+
+def _send(path: str, token: Optional[str], params: Optional[Dict[str, Any]],
+          payload: Optional[Dict[str, Any]]) -> Any:
+    '''Один логический вызов Bnovo: повторы на 429/5xx/сетевых ошибках, circuit breaker, метрики'''
+    target = f'{_pool.prefix}{path}'
+    if params:
+        target = f'{target}?{urllib.parse.urlencode(params)}'
+
+    headers = {'Accept': 'application/json', 'Accept-Encoding': 'gzip', 'User-Agent': 'Mozilla/5.0'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    data = None
+    if payload is not None:
+        data = json.dumps(payload).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    method = 'POST' if data is not None else 'GET'
+
+    _breaker.before_call()
+    started = time.perf_counter()
+    status = None
+    attempt = 0
+    try:
+        while True:
+            retry_after = None
+            try:
+                status, response_headers, body = _send_once(method, target, headers, data)
+                if status < 400:
+                    _breaker.record(True)
+                    return json.loads(body.decode())
+                if status not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+                    # 4xx — ошибка запроса, а не недоступность Bnovo: breaker не трогаем
+                    _breaker.record(status < 500)
+                    raise BnovoHTTPError(status, body.decode('utf-8', errors='ignore'), path)
+                retry_after = response_headers.get('retry-after')
+            except (OSError, http.client.HTTPException, socket.timeout) as e:
+                status = None
+                if attempt >= MAX_RETRIES:
+                    _breaker.record(False)
+                    raise BnovoFetchError(f'Bnovo request failed for {path}: {type(e).__name__}: {e}') from e
+            attempt += 1
+            time.sleep(_retry_delay(attempt, retry_after))
+    finally:
+        _metrics.add(method, path, status, (time.perf_counter() - started) * 1000, attempt + 1)
+
+def request_json(path: str, params: Optional[Dict[str, Any]] = None,
+                 payload: Optional[Dict[str, Any]] = None, auth: bool = True) -> Any:
+    '''GET/POST к Bnovo API с разбором JSON-ответа; при 401 токен обновляется и запрос повторяется один раз'''
+    if not auth:
+        return _send(path, None, params, payload)
+
+    token = get_token()
+    try:
+        return _send(path, token, params, payload)
+    except BnovoHTTPError as e:
+        if e.status != 401:
+            raise
+        invalidate_token(token)
+    return _send(path, get_token(), params, payload)
+
+def extract_bookings(payload: Any) -> List[Dict[str, Any]]:
+    '''Список броней из ответа Bnovo: {'data': {'bookings': [...]}}, {'bookings': [...]} или [...]'''
+    if isinstance(payload, dict):
+        if 'data' in payload and isinstance(payload['data'], dict):
+            batch = payload['data'].get('bookings', [])
+        else:
+            batch = payload.get('bookings', payload.get('data', []))
+    else:
+        batch = payload
+
+    if not isinstance(batch, list):
+        raise BnovoFetchError(f'Invalid bookings data format: {str(payload)[:500]}')
+    return batch
+
+def split_window(date_from: DateLike, date_to: DateLike, slice_days: int = SLICE_DAYS) -> List[Tuple[date, date]]:
+    '''Разбивка окна [date_from, date_to] на непересекающиеся отрезки по slice_days дней'''
+    start = _to_date(date_from)
+    end = _to_date(date_to)
+    slices = []
+    while start <= end:
+        slice_end = min(start + timedelta(days=slice_days - 1), end)
+        slices.append((start, slice_end))
+        start = slice_end + timedelta(days=1)
+    return slices
+
+def fetch_slice(date_from: date, date_to: date, page_size: int = PAGE_SIZE) -> List[Dict[str, Any]]:
+    '''Все страницы броней одного отрезка дат'''
+    bookings = []
+    offset = 0
+    for _ in range(MAX_PAGES_PER_SLICE):
+        payload = request_json('/api/v1/bookings', {
+            'date_from': date_from.isoformat(),
+            'date_to': date_to.isoformat(),
+            'limit': page_size,
+            'offset': offset
+        })
+        batch = extract_bookings(payload)
+        bookings.extend(batch)
+        if len(batch) < page_size:
+            return bookings
+        offset += len(batch)
+    raise BnovoFetchError(
+        f'Too many pages for {date_from}..{date_to}: more than {MAX_PAGES_PER_SLICE * page_size} bookings'
+    )
+
+def fetch_bookings(date_from: DateLike, date_to: DateLike, page_size: int = PAGE_SIZE,
+                   max_workers: int = MAX_WORKERS, slice_days: int = SLICE_DAYS) -> List[Dict[str, Any]]:
+    '''
+    Все брони Bnovo за окно: окно режется на отрезки, отрезки качаются параллельно
+    (не больше max_workers запросов одновременно). Ошибка любого отрезка прерывает выборку,
+    чтобы синхронизация не работала с неполными данными.
+    '''
+    slices = split_window(date_from, date_to, slice_days)
+    if not slices:
+        return []
+
+    # Токен получаем до запуска потоков, чтобы не авторизоваться из каждого
+    get_token()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(slices)))) as pool:
+        results = list(pool.map(lambda s: fetch_slice(s[0], s[1], page_size), slices))
+
+    # Бронь, пересекающая границу отрезков, может прийти дважды
+    bookings = []
+    seen_ids = set()
+    for batch in results:
+        for booking in batch:
+            booking_id = booking.get('id') if isinstance(booking, dict) else None
+            if booking_id is not None:
+                if booking_id in seen_ids:
+                    continue
+                seen_ids.add(booking_id)
+            bookings.append(booking)
+    return bookings
+
+def fetch_room_rates(bnovo_room_id: Any, date_from: DateLike, date_to: DateLike) -> List[Dict[str, Any]]:
+    '''Тарифы и доступность одной комнаты за период'''
+    payload = request_json('/api/v1/rates', {
+        'room_id': bnovo_room_id,
+        'date_from': _to_date(date_from).isoformat(),
+        'date_to': _to_date(date_to).isoformat()
+    })
+    rates = payload.get('data', {}).get('rates', []) if isinstance(payload, dict) else []
+    return rates if isinstance(rates, list) else []
+
+def fetch_rates(bnovo_room_ids: List[Any], date_from: DateLike, date_to: DateLike,
+                max_workers: int = RATES_MAX_WORKERS) -> Dict[Any, Union[List[Dict[str, Any]], Exception]]:
+    '''
+    Тарифы нескольких комнат параллельно (не больше max_workers запросов одновременно).
+    Ошибка одной комнаты не прерывает остальные: вместо списка тарифов в результате будет исключение.
+    '''
+    if not bnovo_room_ids:
+        return {}
+    get_token()
+
+    def fetch_one(room_id: Any) -> Union[List[Dict[str, Any]], Exception]:
+        try:
+            return fetch_room_rates(room_id, date_from, date_to)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(bnovo_room_ids)))) as pool:
+        return dict(zip(bnovo_room_ids, pool.map(fetch_one, bnovo_room_ids)))
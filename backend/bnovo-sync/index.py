@@ -1,11 +1,9 @@
 import json
 import os
 from typing import Dict, Any
-import urllib.request as url_request
-import urllib.parse as url_parse
-import urllib.error as url_error
-import base64
 from datetime import datetime, timedelta
+from bnovo_client import BNOVO_API_URL, BnovoAuthError, BnovoHTTPError, fetch_bookings, get_metrics, get_token, reset_metrics
+from sync_lock import SyncLock, wait_seconds_from
 
 # Force redeploy
 
@@ -30,98 +28,76 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': ''
         }
     
-    account_id = os.environ.get('BNOVO_ACCOUNT_ID', '')
-    password = os.environ.get('BNOVO_PASSWORD', '')
-    
-    # Кодируем логин:пароль в Base64 для Basic Auth
-    credentials = f'{account_id}:{password}'
-    encoded_credentials = base64.b64encode(credentials.encode()).decode()
+    reset_metrics()
     
+    sync_lock = None
     try:
         # Правильный API endpoint: https://api.pms.bnovo.ru
-        # Сначала авторизуемся и получаем JWT токен
-        auth_url = 'https://api.pms.bnovo.ru/api/v1/auth'
-        auth_payload = {
-            'id': int(account_id),
-            'password': password
-        }
-        
-        auth_request = url_request.Request(
-            auth_url,
-            data=json.dumps(auth_payload).encode('utf-8'),
-            headers={
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
-            },
-            method='POST'
-        )
-        
-        with url_request.urlopen(auth_request, timeout=30) as auth_response:
-            auth_data = json.loads(auth_response.read().decode())
-        
-        # Получаем JWT токен из data.access_token
-        jwt_token = auth_data.get('data', {}).get('access_token') or auth_data.get('access_token') or auth_data.get('token')
-        
-        if not jwt_token:
+        # JWT токен берётся из кэша модуля; /auth вызывается только при истечении срока
+        try:
+            get_token()
+        except BnovoAuthError as e:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'body': json.dumps({
                     'success': False,
-                    'error': 'JWT token not found in response',
-                    'auth_response': auth_data
+                    'error': str(e)
                 })
             }
         
+        # Single-flight с cron-sync-bnovo и sync-bnovo-to-db: без DATABASE_URL проверка работает как раньше
+        database_url = os.environ.get('DATABASE_URL', '')
+        if database_url:
+            sync_lock = SyncLock(database_url, 'bnovo-sync')
+            # Итог прошлого запуска — только сводка без броней: дождавшийся вызов качает окно сам
+            if not sync_lock.acquire(wait_seconds_from(event), coalesce=False):
+                return {
+                    'statusCode': 409,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({
+                        'success': False,
+                        'error': 'Bnovo sync is already running',
+                        **sync_lock.running_status()
+                    })
+                }
+        
         # Теперь получаем бронирования с JWT токеном
-        # Добавляем обязательные параметры: date_from, date_to, limit, offset
         # Получаем бронирования за последние 30 дней и следующие 90 дней
         # Bnovo использует формат даты Y-m-d (например, 2025-06-25)
         date_from = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
         date_to = (datetime.now() + timedelta(days=90)).strftime('%Y-%m-%d')
         
-        # Формируем URL с параметрами (limit max 20)
-        params = url_parse.urlencode({
-            'date_from': date_from,
-            'date_to': date_to,
-            'limit': 20,
-            'offset': 0
-        })
-        url = f'https://api.pms.bnovo.ru/api/v1/bookings?{params}'
-        
-        request_obj = url_request.Request(
-            url,
-            headers={
-                'Authorization': f'Bearer {jwt_token}',
-                'Accept': 'application/json'
-            }
-        )
+        # Все страницы окна, отрезки дат качаются параллельно
+        bookings = fetch_bookings(date_from, date_to)
         
-        with url_request.urlopen(request_obj, timeout=30) as response:
-            data = json.loads(response.read().decode())
+        result = {
+            'success': True,
+            'message': 'Successfully connected to Bnovo',
+            'bookings': bookings,
+            'total_bookings': len(bookings),
+            'bnovo_http': get_metrics()
+        }
+        if sync_lock:
+            # В журнал — без списка броней: имена и контакты гостей там не хранятся
+            sync_lock.record({key: value for key, value in result.items() if key != 'bookings'})
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'isBase64Encoded': False,
-            'body': json.dumps({
-                'success': True,
-                'message': 'Successfully connected to Bnovo',
-                'bookings': data.get('data', []) if isinstance(data, dict) else data,
-                'total_bookings': len(data.get('data', [])) if isinstance(data, dict) else len(data)
-            }, ensure_ascii=False)
+            'body': json.dumps(result, ensure_ascii=False)
         }
     
-    except url_error.HTTPError as e:
-        error_body = e.read().decode('utf-8', errors='ignore') if e.fp else ''
+    except BnovoHTTPError as e:
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({
                 'success': False,
-                'http_code': e.code,
-                'url_tested': e.url if hasattr(e, 'url') else 'https://api.pms.bnovo.ru',
-                'error_details': error_body[:1000]
+                'http_code': e.status,
+                'url_tested': f'{BNOVO_API_URL}{e.path}',
+                'error_details': e.body[:1000]
             })
         }
     
@@ -134,4 +110,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'error': str(e),
                 'error_type': type(e).__name__
             })
-        }
\ No newline at end of file
+        }
+    
+    finally:
+        if sync_lock:
+            sync_lock.release()
\ No newline at end of file
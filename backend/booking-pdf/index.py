@@ -10,8 +10,8 @@ from typing import Dict, Any
 from datetime import datetime
 import base64
 from io import BytesIO
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db_connection import get_connection
 
 try:
     from reportlab.lib.pagesizes import A4
@@ -30,7 +30,7 @@ def get_db_connection():
     dsn = os.environ.get('DATABASE_URL')
     if not dsn:
         raise ValueError('DATABASE_URL not set')
-    return psycopg2.connect(dsn)
+    return get_connection(dsn)
 
 def format_date(date_str: str) -> str:
     """Format date to Russian format"""
@@ -5,10 +5,17 @@ import secrets
 import string
 # Force redeploy
 from typing import Dict, Any, Tuple
-import psycopg2
 from psycopg2.extras import RealDictCursor
 import requests
 from datetime import datetime
+from bookings_db import (
+    ADMIN_DEFAULT_FIELDS, ADMIN_EXPORT_FIELDS, ADMIN_FIELDS, DEFAULT_PAGE_SIZE, booking_filters, columns_for,
+    decode_cursor, delete_booking, export_query, get_booking, list_bookings, parse_fields, parse_limit, serialize,
+    update_booking
+)
+from db_connection import get_connection
+from export_file import EXPORT_FORMATS, export_response, stream_query
+from prepared import execute_prepared
 
 def generate_password(length: int = 8) -> str:
     alphabet = string.ascii_letters + string.digits
@@ -18,25 +25,28 @@ def create_or_get_guest(cursor, conn, guest_name: str, guest_email: str, guest_p
     search_field = guest_email if guest_email else guest_phone
     search_column = 'email' if guest_email else 'phone'
     
-    query = f"SELECT id, email, phone FROM t_p9202093_hotel_design_site.guests WHERE {search_column} = '{search_field}'"
-    cursor.execute(query)
+    # Колонка поиска — одна из двух констант, значение передаётся параметром
+    execute_prepared(
+        cursor,
+        f"SELECT id, email, phone, password FROM t_p9202093_hotel_design_site.guests WHERE {search_column} = %s",
+        (search_field,)
+    )
     existing_guest = cursor.fetchone()
     
     if existing_guest:
-        guest_id = existing_guest[0]
-        login = existing_guest[1] if existing_guest[1] else existing_guest[2]
-        password_query = f"SELECT password FROM t_p9202093_hotel_design_site.guests WHERE id = '{guest_id}'"
-        cursor.execute(password_query)
-        password_data = cursor.fetchone()
-        password = password_data[0] if password_data else ''
-        return guest_id, login, password
+        guest_id = existing_guest['id']
+        login = existing_guest['email'] if existing_guest['email'] else existing_guest['phone']
+        return guest_id, login, existing_guest['password'] or ''
     
     guest_id = str(uuid.uuid4())
     password = generate_password()
     login = guest_email if guest_email else guest_phone
     
-    insert_query = f"INSERT INTO t_p9202093_hotel_design_site.guests (id, name, email, phone, password, bonus_points, is_vip) VALUES ('{guest_id}', '{guest_name}', '{guest_email}', '{guest_phone}', '{password}', 0, false)"
-    cursor.execute(insert_query)
+    cursor.execute(
+        "INSERT INTO t_p9202093_hotel_design_site.guests (id, name, email, phone, password, bonus_points, is_vip) "
+        "VALUES (%s, %s, %s, %s, %s, 0, false)",
+        (guest_id, guest_name, guest_email, guest_phone, password)
+    )
     conn.commit()
     
     return guest_id, login, password
@@ -45,6 +55,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для управления бронированиями апартаментов
     Args: event - dict с httpMethod, body, queryStringParameters
+          (GET: apartment_id, booking_id, date_from, date_to, status, source, fields, limit, cursor,
+          format=csv|xlsx — выгрузка всех подходящих броней файлом)
           context - объект с атрибутами request_id, function_name
     Returns: HTTP response dict
     '''
@@ -71,60 +83,55 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     try:
-        conn = psycopg2.connect(database_url)
+        conn = get_connection(database_url)
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
         if method == 'GET':
             query_params = event.get('queryStringParameters', {}) or {}
-            apartment_id = query_params.get('apartment_id')
+            export_format = query_params.get('format')
+            export = export_format in EXPORT_FORMATS
+            try:
+                if export_format not in (None, '', 'json') and not export:
+                    raise ValueError('format must be json, csv or xlsx')
+                if export:
+                    fields = parse_fields(query_params.get('fields'), ADMIN_EXPORT_FIELDS, list(ADMIN_EXPORT_FIELDS))
+                else:
+                    fields = parse_fields(query_params.get('fields'), ADMIN_FIELDS, ADMIN_DEFAULT_FIELDS)
+                limit = parse_limit(query_params.get('limit'))
+                after = decode_cursor(query_params['cursor']) if query_params.get('cursor') else None
+                conditions, params = booking_filters(query_params)
+            except ValueError as e:
+                cursor.close()
+                conn.close()
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': str(e)})
+                }
             
-            if apartment_id:
-                sql = f"""
-                    SELECT * FROM t_p9202093_hotel_design_site.bookings 
-                    WHERE apartment_id = '{apartment_id}' 
-                    ORDER BY check_in DESC
-                """
-            else:
-                sql = """
-                    SELECT * FROM t_p9202093_hotel_design_site.bookings 
-                    ORDER BY check_in DESC
-                """
+            # Выгрузка: вся история без limit, серверным курсором порциями в CSV или XLSX
+            if export:
+                sql, values = export_query(columns_for(ADMIN_EXPORT_FIELDS, fields), conditions, params)
+                getters = [ADMIN_EXPORT_FIELDS[f][1] for f in fields]
+                write_file, content_type = EXPORT_FORMATS[export_format]
+                export_file = write_file(
+                    stream_query(conn, sql, values, 'bookings_export'), fields, lambda row: [g(row) for g in getters]
+                )
+                cursor.close()
+                conn.close()
+                return export_response(
+                    export_file, f"bookings-{datetime.now().strftime('%Y-%m-%d')}.{export_format}", content_type
+                )
             
-            cursor.execute(sql)
-            bookings = cursor.fetchall()
+            # Без limit и cursor — прежний ответ массивом; с ними — страница и next_cursor
+            paginated = limit is not None or after is not None
+            if paginated and limit is None:
+                limit = DEFAULT_PAGE_SIZE
             
-            result = []
-            for booking in bookings:
-                total = float(booking['total_amount']) if booking['total_amount'] else 0
-                commission = float(booking['aggregator_commission']) if booking['aggregator_commission'] else 0
-                owner_funds = float(booking['owner_funds']) if booking.get('owner_funds') is not None else (total - commission)
-                
-                result.append({
-                    'id': booking['id'],
-                    'apartmentId': booking['apartment_id'],
-                    'guestName': booking['guest_name'],
-                    'guestEmail': booking['guest_email'],
-                    'guestPhone': booking['guest_phone'],
-                    'checkIn': str(booking['check_in']),
-                    'checkOut': str(booking['check_out']),
-                    'totalAmount': total,
-                    'aggregatorCommission': commission,
-                    'ownerFunds': owner_funds,
-                    'isPrepaid': booking.get('is_prepaid', False),
-                    'prepaymentAmount': float(booking['prepayment_amount']) if booking.get('prepayment_amount') else 0,
-                    'prepaymentDate': str(booking['prepayment_date']) if booking.get('prepayment_date') else None,
-                    'showToGuest': True,
-                    'paymentStatus': 'paid' if booking.get('is_prepaid', False) else 'pending',
-                    'expenses': {
-                        'maid': float(booking['maid']) if booking.get('maid') else 0,
-                        'laundry': float(booking['laundry']) if booking.get('laundry') else 0,
-                        'hygiene': float(booking['hygiene']) if booking.get('hygiene') else 0,
-                        'transport': float(booking['transport']) if booking.get('transport') else 0,
-                        'compliment': float(booking['compliment']) if booking.get('compliment') else 0,
-                        'other': float(booking['other']) if booking.get('other') else 0,
-                        'otherNote': booking.get('other_note') or ''
-                    }
-                })
+            bookings, next_cursor = list_bookings(
+                cursor, columns_for(ADMIN_FIELDS, fields), conditions, params, after, limit if paginated else None
+            )
+            result = serialize(bookings, ADMIN_FIELDS, fields)
             
             cursor.close()
             conn.close()
@@ -133,7 +140,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'isBase64Encoded': False,
-                'body': json.dumps(result)
+                'body': json.dumps({'bookings': result, 'next_cursor': next_cursor} if paginated else result)
             }
         
         if method == 'PUT':
@@ -149,20 +156,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Missing booking id'})
                 }
             
-            is_prepaid = 'true' if body_data.get('is_prepaid', False) else 'false'
-            prepayment_amount = body_data.get('prepayment_amount', 0)
-            
-            sql = f"""
-                UPDATE t_p9202093_hotel_design_site.bookings 
-                SET is_prepaid = {is_prepaid}, 
-                    prepayment_amount = {prepayment_amount},
-                    prepayment_date = CURRENT_TIMESTAMP
-                WHERE id = '{booking_id}'
-                RETURNING id, is_prepaid, prepayment_amount
-            """
-            
-            cursor.execute(sql)
-            updated_booking = cursor.fetchone()
+            updated_booking = update_booking(cursor, booking_id, {
+                'is_prepaid': bool(body_data.get('is_prepaid', False)),
+                'prepayment_amount': body_data.get('prepayment_amount', 0),
+                'prepayment_date': datetime.now()
+            }, returning=('id', 'is_prepaid', 'prepayment_amount'))
             
             if not updated_booking:
                 cursor.close()
@@ -208,9 +206,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Missing required fields'})
                 }
             
-            cursor.execute(f"SELECT bnovo_name, number FROM t_p9202093_hotel_design_site.rooms WHERE id = '{apartment_id}'")
+            cursor.execute("SELECT bnovo_name, number FROM t_p9202093_hotel_design_site.rooms WHERE id = %s", (apartment_id,))
             room_data = cursor.fetchone()
-            apartment_name = room_data[0] if room_data and room_data[0] else (room_data[1] if room_data else apartment_id)
+            apartment_name = (room_data['bnovo_name'] or room_data['number']) if room_data else apartment_id
             
             guest_login = ''
             guest_password = ''
@@ -281,17 +279,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             transport = expenses.get('transport', 0)
             compliment = expenses.get('compliment', 0)
             other = expenses.get('other', 0)
-            other_note = expenses.get('otherNote', '').replace("'", "''")
+            other_note = expenses.get('otherNote', '')
             
             total_expenses = maid + laundry + hygiene + transport + compliment + other
             
-            cursor.execute(f"""
-                SELECT total_amount, aggregator_commission 
-                FROM t_p9202093_hotel_design_site.bookings 
-                WHERE id = '{booking_id}'
-            """)
-            
-            booking_data = cursor.fetchone()
+            booking_data = get_booking(cursor, booking_id, ('total_amount', 'aggregator_commission'))
             if not booking_data:
                 cursor.close()
                 conn.close()
@@ -305,22 +297,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             commission = float(booking_data['aggregator_commission']) if booking_data['aggregator_commission'] else 0
             owner_funds = total_amount - commission - total_expenses
             
-            sql = f"""
-                UPDATE t_p9202093_hotel_design_site.bookings 
-                SET maid = {maid},
-                    laundry = {laundry},
-                    hygiene = {hygiene},
-                    transport = {transport},
-                    compliment = {compliment},
-                    other = {other},
-                    other_note = '{other_note}',
-                    owner_funds = {owner_funds}
-                WHERE id = '{booking_id}'
-                RETURNING id, maid, laundry, hygiene, transport, compliment, other, other_note, owner_funds
-            """
-            
-            cursor.execute(sql)
-            updated = cursor.fetchone()
+            updated = update_booking(cursor, booking_id, {
+                'maid': maid,
+                'laundry': laundry,
+                'hygiene': hygiene,
+                'transport': transport,
+                'compliment': compliment,
+                'other': other,
+                'other_note': other_note,
+                'owner_funds': owner_funds
+            }, returning=('id', 'maid', 'laundry', 'hygiene', 'transport', 'compliment', 'other', 'other_note', 'owner_funds'))
             conn.commit()
             cursor.close()
             conn.close()
@@ -357,13 +343,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Missing booking id'})
                 }
             
-            cursor.execute(f"""
-                DELETE FROM t_p9202093_hotel_design_site.bookings 
-                WHERE id = '{booking_id}'
-                RETURNING id
-            """)
-            
-            deleted = cursor.fetchone()
+            deleted = delete_booking(cursor, booking_id)
             if not deleted:
                 cursor.close()
                 conn.close()
@@ -380,7 +360,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'id': deleted['id']})
+                'body': json.dumps({'success': True, 'id': deleted})
             }
         
         cursor.close()
@@ -4,11 +4,16 @@ import psycopg2
 import psycopg2.extras
 from typing import Dict, Any
 from collections import defaultdict
+from datetime import timedelta
+from booked_ranges import iter_booked_nights, load_booked_ranges, to_date
+from calendar_runs import RUNS_FORMAT, encode_runs, wants_runs
+from db_connection import get_connection
+from snapshot_cache import cached_json_response
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Get calendar data from availability_calendar table grouped by apartment
-    Args: event with httpMethod, queryStringParameters (start_date, end_date)
+    Business: Get calendar data from availability_calendar and booked_ranges grouped by apartment
+    Args: event with httpMethod, queryStringParameters (start_date, end_date, format=runs — компактные серии дней)
     Returns: HTTP response with calendar data grouped by room_id
     '''
     method: str = event.get('httpMethod', 'GET')
@@ -19,7 +24,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -40,91 +45,116 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'DATABASE_URL not configured'})
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = get_connection(dsn)
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
-    # Получаем параметры
+    # Получаем параметры (end_date включительно)
     query_params = event.get('queryStringParameters', {}) or {}
-    start_date = query_params.get('start_date')
-    end_date = query_params.get('end_date')
-    
-    # Строим WHERE условие
-    where_conditions = []
-    if start_date:
-        start_date_escaped = start_date.replace("'", "''")
-        where_conditions.append(f"date >= '{start_date_escaped}'")
-    if end_date:
-        end_date_escaped = end_date.replace("'", "''")
-        where_conditions.append(f"date <= '{end_date_escaped}'")
-    
-    where_clause = f"WHERE {' AND '.join(where_conditions)}" if where_conditions else ""
-    
-    # Получаем данные из календаря с информацией о бронированиях и названиями комнат
-    cur.execute(f"""
-        SELECT 
-            ac.room_id,
-            ac.date,
-            ac.is_available,
-            ac.booking_id,
-            ac.price,
-            b.guest_name,
-            r.bnovo_name,
-            r.number
-        FROM t_p9202093_hotel_design_site.availability_calendar ac
-        LEFT JOIN t_p9202093_hotel_design_site.bookings b ON ac.booking_id = b.id
-        LEFT JOIN t_p9202093_hotel_design_site.rooms r ON ac.room_id = r.id
-        {where_clause}
-        ORDER BY ac.room_id, ac.date
-    """)
-    
-    rows = cur.fetchall()
-    
-    # Группируем по room_id и сохраняем информацию о комнате
-    calendars_dict = defaultdict(lambda: {'days': [], 'bnovo_name': None, 'number': None})
-    
-    for row in rows:
-        room_id = row['room_id']
-        calendars_dict[room_id]['days'].append({
-            'date': str(row['date']),
-            'is_available': row['is_available'],
-            'price': float(row['price']) if row['price'] else 0,
-            'booking_id': row['booking_id'],
-            'guest_name': row['guest_name']
-        })
-        # Сохраняем название комнаты (одинаковое для всех дней)
-        if row.get('bnovo_name'):
-            calendars_dict[room_id]['bnovo_name'] = row['bnovo_name']
-        if row.get('number'):
-            calendars_dict[room_id]['number'] = row['number']
+    try:
+        date_from = to_date(query_params['start_date']) if query_params.get('start_date') else None
+        date_to = to_date(query_params['end_date']) + timedelta(days=1) if query_params.get('end_date') else None
+    except ValueError:
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'start_date and end_date must be YYYY-MM-DD'})
+        }
     
-    # Преобразуем в список календарей
-    calendars = []
-    for room_id, data in calendars_dict.items():
-        # Формируем название: ID (номер - название)
-        if data['bnovo_name'] and data['number']:
-            room_name = f"{room_id} ({data['number']} - {data['bnovo_name']})"
-        elif data['number']:
-            room_name = f"{room_id} ({data['number']})"
-        elif data['bnovo_name']:
-            room_name = f"{room_id} ({data['bnovo_name']})"
-        else:
-            room_name = f"Апартамент {room_id}"
+    def build_calendars() -> Dict[str, Any]:
+        # Тарифы и закрытые дни — построчно из availability_calendar
+        cur.execute("""
+            SELECT room_id, date, is_available, price
+            FROM t_p9202093_hotel_design_site.availability_calendar
+            WHERE (%(date_from)s::date IS NULL OR date >= %(date_from)s::date)
+              AND (%(date_to)s::date IS NULL OR date < %(date_to)s::date)
+            ORDER BY room_id, date
+        """, {'date_from': date_from, 'date_to': date_to})
+        
+        days_by_room = defaultdict(dict)
+        for row in cur.fetchall():
+            days_by_room[row['room_id']][row['date']] = {
+                'date': str(row['date']),
+                'is_available': row['is_available'],
+                'price': float(row['price']) if row['price'] else 0,
+                'booking_id': None,
+                'guest_name': None
+            }
+        
+        # Занятость — интервалами из booked_ranges, в ответ разворачивается только внутри окна
+        for room_id, night, booked in iter_booked_nights(load_booked_ranges(cur, date_from, date_to), date_from, date_to):
+            day = days_by_room[room_id].setdefault(night, {'date': str(night), 'price': 0})
+            day.update(is_available=False, booking_id=booked['booking_id'], guest_name=booked['guest_name'])
         
-        calendars.append({
-            'room_id': room_id,
-            'room_name': room_name,
-            'days': data['days']
-        })
+        cur.execute(
+            "SELECT id, bnovo_name, number FROM t_p9202093_hotel_design_site.rooms WHERE id = ANY(%s)",
+            (list(days_by_room.keys()),)
+        )
+        rooms = {row['id']: row for row in cur.fetchall()}
+        
+        # Группируем по room_id и сохраняем информацию о комнате
+        calendars_dict = {}
+        for room_id in sorted(days_by_room.keys()):
+            room = rooms.get(room_id) or {}
+            calendars_dict[room_id] = {
+                'days': [days_by_room[room_id][day] for day in sorted(days_by_room[room_id])],
+                'bnovo_name': room.get('bnovo_name'),
+                'number': room.get('number')
+            }
+        
+        # Компактный формат: start — первый день окна (или самый ранний день в данных)
+        runs_start = date_from or min((day for days in days_by_room.values() for day in days), default=None)
+        
+        # Преобразуем в список календарей
+        calendars = []
+        for room_id, data in calendars_dict.items():
+            # Формируем название: ID (номер - название)
+            if data['bnovo_name'] and data['number']:
+                room_name = f"{room_id} ({data['number']} - {data['bnovo_name']})"
+            elif data['number']:
+                room_name = f"{room_id} ({data['number']})"
+            elif data['bnovo_name']:
+                room_name = f"{room_id} ({data['bnovo_name']})"
+            else:
+                room_name = f"Апартамент {room_id}"
+            
+            if runs_format:
+                # Серии [смещение от start, длина, is_available, price, booking_id, guest_name]
+                calendars.append({
+                    'room_id': room_id,
+                    'room_name': room_name,
+                    'runs': encode_runs(
+                        ((to_date(day['date']), (day['is_available'], day['price'], day['booking_id'], day['guest_name']))
+                         for day in data['days']),
+                        runs_start
+                    )
+                })
+            else:
+                calendars.append({
+                    'room_id': room_id,
+                    'room_name': room_name,
+                    'days': data['days']
+                })
+        
+        if runs_format:
+            return {
+                'format': RUNS_FORMAT,
+                'start': runs_start.isoformat() if runs_start else None,
+                'calendars': calendars,
+                'total_rooms': len(calendars)
+            }
+        return {
+            'calendars': calendars,
+            'total_rooms': len(calendars)
+        }
+    
+    # Готовый ответ берётся из снимка текущей версии календаря; при совпадении ETag — 304
+    runs_format = wants_runs(event)
+    cache_key = f"calendar-bnovo:{date_from or ''}:{date_to or ''}{':runs' if runs_format else ''}"
+    response = cached_json_response(conn, event, cache_key, build_calendars)
     
     cur.close()
     conn.close()
     
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'isBase64Encoded': False,
-        'body': json.dumps({
-            'calendars': calendars,
-            'total_rooms': len(calendars)
-        }, ensure_ascii=False)
-    }
\ No newline at end of file
+    return response
@@ -6,9 +6,10 @@ Returns: Success confirmation or error message
 
 import json
 import os
-import psycopg2
 from datetime import datetime
 from typing import Dict, Any
+from bookings_db import get_booking, update_booking
+from db_connection import get_connection
 
 # Force redeploy
 
@@ -68,14 +69,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     conn = None
     try:
-        conn = psycopg2.connect(database_url)
+        conn = get_connection(database_url)
         cursor = conn.cursor()
         
-        cursor.execute(
-            "SELECT id, guest_email, check_in, status FROM bookings WHERE id = %s",
-            (booking_id,)
-        )
-        booking = cursor.fetchone()
+        booking = get_booking(cursor, booking_id, ('id', 'guest_email', 'check_in', 'status'))
         
         if not booking:
             cursor.close()
@@ -89,7 +86,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'success': False, 'error': 'Бронирование не найдено'})
             }
         
-        if booking[1] != guest_email:
+        if booking['guest_email'] != guest_email:
             cursor.close()
             conn.close()
             return {
@@ -101,7 +98,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'success': False, 'error': 'Нет доступа к этому бронированию'})
             }
         
-        check_in_date = booking[2]
+        check_in_date = booking['check_in']
         if isinstance(check_in_date, str):
             check_in_date = datetime.strptime(check_in_date, '%Y-%m-%d').date()
         
@@ -118,7 +115,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'success': False, 'error': 'Нельзя отменить бронирование в день заезда или позже'})
             }
         
-        current_status = booking[3] if len(booking) > 3 else None
+        current_status = booking['status']
         if current_status == 'cancelled':
             cursor.close()
             conn.close()
@@ -131,10 +128,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'success': False, 'error': 'Бронирование уже отменено'})
             }
         
-        cursor.execute(
-            "UPDATE bookings SET status = 'cancelled', updated_at = NOW() WHERE id = %s",
-            (booking_id,)
-        )
+        update_booking(cursor, booking_id, {'status': 'cancelled'})
         conn.commit()
         
         cursor.close()
@@ -0,0 +1,24 @@
+# Копия backend/_shared/calendar_runs.py. Не редактировать: правьте оригинал и запустите python3 scripts/vendor_shared.py
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Компактный формат календаря (?format=runs): подряд идущие дни с одинаковым значением
+# сворачиваются в [смещение от start в днях, длина, *значение]. Декодер — src/lib/calendarRuns.ts
+RUNS_FORMAT = 'runs'
+
+def wants_runs(event: Dict[str, Any]) -> bool:
+    return (event.get('queryStringParameters') or {}).get('format') == RUNS_FORMAT
+
+def encode_runs(days: Iterable[Tuple[date, Tuple[Any, ...]]], start: date) -> List[List[Any]]:
+    '''Дни (дата, значение) по возрастанию даты -> серии; пропуск дня или смена значения начинает новую серию'''
+    runs: List[List[Any]] = []
+    prev_day = None
+    prev_value = None
+    for day, value in days:
+        value = tuple(value)
+        if runs and value == prev_value and day == prev_day + timedelta(days=1):
+            runs[-1][1] += 1
+        else:
+            runs.append([(day - start).days, 1, *value])
+        prev_day, prev_value = day, value
+    return runs
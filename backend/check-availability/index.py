@@ -1,15 +1,19 @@
 import json
 import os
-import psycopg2
 from datetime import datetime, timedelta
 from typing import Dict, Any
+from booked_ranges import iter_booked_nights, load_booked_ranges
+from calendar_runs import RUNS_FORMAT, encode_runs, wants_runs
+from db_connection import get_connection
+from prepared import execute_prepared
+from snapshot_cache import cached_json_response
 
 # Force redeploy
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Check apartment availability based on bookings
-    Args: event with httpMethod
+    Args: event with httpMethod, queryStringParameters (format=runs — компактные серии дней)
     Returns: HTTP response with availability calendar for all apartments
     '''
     method: str = event.get('httpMethod', 'GET')
@@ -20,7 +24,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -42,50 +46,67 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'Database not configured'})
             }
         
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT DISTINCT room_id
-            FROM t_p9202093_hotel_design_site.availability_calendar
-        ''')
-        
-        all_apartments = [str(row[0]) for row in cursor.fetchall()]
-        
         start_date = datetime.now().date()
         end_date = start_date + timedelta(days=365)
         
-        cursor.execute('''
-            SELECT room_id, date, is_available, price
-            FROM t_p9202093_hotel_design_site.availability_calendar
-            WHERE date >= %s AND date < %s
-            ORDER BY room_id, date
-        ''', (start_date, end_date))
-        
-        calendar_data = cursor.fetchall()
-        
-        availability = {}
-        
-        for room_id, date, is_available, price in calendar_data:
-            if str(room_id) not in availability:
-                availability[str(room_id)] = {}
+        def build_availability() -> Dict[str, Any]:
+            # Тарифы и закрытые дни — построчно из availability_calendar, занятость — интервалами из booked_ranges
+            execute_prepared(cursor, '''
+                SELECT room_id, date, is_available, price
+                FROM t_p9202093_hotel_design_site.availability_calendar
+                WHERE date >= %s AND date < %s
+                ORDER BY room_id, date
+            ''', (start_date, end_date))
             
-            availability[str(room_id)][date.isoformat()] = {
-                'available': is_available,
-                'price': float(price) if price else 8500
+            calendar_data = cursor.fetchall()
+            booked = {
+                (room_id, night)
+                for room_id, night, _ in iter_booked_nights(load_booked_ranges(cursor, start_date, end_date), start_date, end_date)
             }
+            
+            availability = {}
+            
+            for room_id, date, is_available, price in calendar_data:
+                if str(room_id) not in availability:
+                    availability[str(room_id)] = {}
+                
+                availability[str(room_id)][date.isoformat()] = {
+                    'available': is_available and (str(room_id), date) not in booked,
+                    'price': float(price) if price else 8500
+                }
+            
+            # Занятые ночи без строки тарифа
+            for room_id, night in booked:
+                availability.setdefault(room_id, {}).setdefault(night.isoformat(), {'available': False, 'price': 8500})
+            
+            if runs_format:
+                # Серии [смещение от start, длина, available, price] вместо объекта на каждый день
+                return {
+                    'format': RUNS_FORMAT,
+                    'start': start_date.isoformat(),
+                    'availability': {
+                        room: encode_runs(
+                            ((datetime.strptime(day, '%Y-%m-%d').date(), (value['available'], value['price']))
+                             for day, value in sorted(days.items())),
+                            start_date
+                        )
+                        for room, days in availability.items()
+                    }
+                }
+            return {'availability': {room: dict(sorted(days.items())) for room, days in availability.items()}}
+        
+        # Готовый ответ берётся из снимка текущей версии календаря; при совпадении ETag — 304
+        runs_format = wants_runs(event)
+        cache_key = f"check-availability:{start_date.isoformat()}{':runs' if runs_format else ''}"
+        response = cached_json_response(conn, event, cache_key, build_availability)
         
         cursor.close()
         conn.close()
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({
-                'availability': availability
-            })
-        }
+        return response
         
     except Exception as e:
         return {
@@ -0,0 +1,98 @@
+# Копия backend/_shared/snapshot_cache.py. Не редактировать: правьте оригинал и запустите python3 scripts/vendor_shared.py
+import hashlib
+import json
+from typing import Any, Callable, Dict, Optional, Tuple
+from prepared import execute_prepared
+
+# Готовые JSON-ответы календарных эндпоинтов, привязанные к версии календаря.
+# Версию поднимают триггеры на всех таблицах, из которых собираются ответы (V0094),
+# так что ни один писатель не может забыть её увеличить.
+VERSION_TABLE = 't_p9202093_hotel_design_site.calendar_version'
+SNAPSHOT_TABLE = 't_p9202093_hotel_design_site.availability_snapshots'
+
+# Снимки тёплого экземпляра функции: (ключ, версия) -> тело; без запроса тела из БД
+_memory: Dict[Tuple[str, int], str] = {}
+MEMORY_LIMIT = 64
+
+CACHE_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'ETag',
+    # Браузер всегда перепроверяет ответ по ETag и получает 304, пока версия не изменилась
+    'Cache-Control': 'no-cache'
+}
+
+def calendar_version(cur) -> int:
+    execute_prepared(cur, f"SELECT version FROM {VERSION_TABLE} WHERE id = 1")
+    row = cur.fetchone()
+    if not row:
+        return 0
+    return int(row['version'] if isinstance(row, dict) else row[0])
+
+def make_etag(cache_key: str, version: int) -> str:
+    return f'"{version}-{hashlib.sha1(cache_key.encode("utf-8")).hexdigest()[:16]}"'
+
+def request_etags(event: Dict[str, Any]) -> set:
+    '''Значения If-None-Match запроса (заголовки без учёта регистра, W/ игнорируется)'''
+    headers = {str(k).lower(): v for k, v in (event.get('headers') or {}).items()}
+    raw = headers.get('if-none-match') or ''
+    return {tag.strip().removeprefix('W/') for tag in raw.split(',') if tag.strip()}
+
+def _load(cur, cache_key: str, version: int) -> Optional[str]:
+    body = _memory.get((cache_key, version))
+    if body is not None:
+        return body
+    execute_prepared(cur, f"SELECT body FROM {SNAPSHOT_TABLE} WHERE cache_key = %s AND version = %s", (cache_key, version))
+    row = cur.fetchone()
+    if not row:
+        return None
+    body = row['body'] if isinstance(row, dict) else row[0]
+    _remember(cache_key, version, body)
+    return body
+
+def _remember(cache_key: str, version: int, body: str) -> None:
+    if len(_memory) >= MEMORY_LIMIT:
+        _memory.clear()
+    _memory[(cache_key, version)] = body
+
+def _store(cur, cache_key: str, version: int, body: str) -> None:
+    cur.execute(f"""
+        INSERT INTO {SNAPSHOT_TABLE} AS s (cache_key, version, body, created_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (cache_key) DO UPDATE SET
+            version = EXCLUDED.version, body = EXCLUDED.body, created_at = EXCLUDED.created_at
+        WHERE s.version < EXCLUDED.version
+    """, (cache_key, version, body))
+    # Снимки прошлых версий больше никому не отдаются
+    cur.execute(f"DELETE FROM {SNAPSHOT_TABLE} WHERE version < %s", (version,))
+    _remember(cache_key, version, body)
+
+def cached_json_response(conn, event: Dict[str, Any], cache_key: str,
+                         build_payload: Callable[[], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    '''
+    Ответ из снимка текущей версии календаря: 304 по If-None-Match, иначе готовое тело
+    из памяти или availability_snapshots, иначе build_payload() и сохранение снимка.
+    build_payload возвращает None, если ответа нет (например, 404) — тогда и здесь None.
+    '''
+    cur = conn.cursor()
+    version = calendar_version(cur)
+    etag = make_etag(cache_key, version)
+    headers = dict(CACHE_HEADERS, ETag=etag)
+
+    if etag in request_etags(event):
+        cur.close()
+        return {'statusCode': 304, 'headers': headers, 'body': ''}
+
+    body = _load(cur, cache_key, version)
+    if body is None:
+        payload = build_payload()
+        if payload is None:
+            cur.close()
+            return None
+        body = json.dumps(payload, ensure_ascii=False)
+        # Версия прочитана до данных, поэтому снимок не может оказаться старее своей версии
+        _store(cur, cache_key, version, body)
+        conn.commit()
+
+    cur.close()
+    return {'statusCode': 200, 'headers': headers, 'isBase64Encoded': False, 'body': body}
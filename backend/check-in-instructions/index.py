@@ -1,9 +1,9 @@
 import json
 import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
 from typing import Dict, Any
 from datetime import datetime
+from db_connection import get_connection
 
 # Force redeploy
 
@@ -30,7 +30,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     # Подключение к БД
     db_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(db_url)
+    conn = get_connection(db_url)
     
     try:
         if method == 'GET':
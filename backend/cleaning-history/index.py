@@ -6,8 +6,9 @@ Returns: HTTP response с историей уборок или результа
 
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from db_connection import get_connection
+from prepared import execute_prepared
 
 # Force redeploy
 
@@ -28,7 +29,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': ''
         }
     
-    conn = psycopg2.connect(DSN)
+    conn = get_connection(DSN)
     try:
         cur = conn.cursor()
         
@@ -37,16 +38,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             housekeeper_name = params.get('housekeeper_name')
             
             if housekeeper_name:
-                escaped_name = housekeeper_name.replace("'", "''")
-                cur.execute(f'''
+                execute_prepared(cur, '''
                     SELECT id, room_number, housekeeper_name, cleaned_at, 
                            payment_amount, payment_status, paid_at
                     FROM t_p9202093_hotel_design_site.cleaning_history
-                    WHERE housekeeper_name = '{escaped_name}'
+                    WHERE housekeeper_name = %s
                     ORDER BY cleaned_at DESC
-                ''')
+                ''', (housekeeper_name,))
             else:
-                cur.execute('''
+                execute_prepared(cur, '''
                     SELECT id, room_number, housekeeper_name, cleaned_at, 
                            payment_amount, payment_status, paid_at
                     FROM t_p9202093_hotel_design_site.cleaning_history
@@ -87,25 +87,21 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'success': False, 'error': 'Не указан номер апартамента или имя горничной'})
                 }
             
-            escaped_room = room_number.replace("'", "''")
-            escaped_name = housekeeper_name.replace("'", "''")
-            
             # Используем дату из апартамента, если она указана, иначе текущую
             if cleaned_at:
-                escaped_cleaned = cleaned_at.replace("'", "''")
-                cur.execute(f'''
+                cur.execute('''
                     INSERT INTO t_p9202093_hotel_design_site.cleaning_history 
                     (room_number, housekeeper_name, payment_amount, cleaned_at)
-                    VALUES ('{escaped_room}', '{escaped_name}', {payment}, '{escaped_cleaned}')
+                    VALUES (%s, %s, %s, %s)
                     RETURNING id
-                ''')
+                ''', (room_number, housekeeper_name, payment, cleaned_at))
             else:
-                cur.execute(f'''
+                cur.execute('''
                     INSERT INTO t_p9202093_hotel_design_site.cleaning_history 
                     (room_number, housekeeper_name, payment_amount)
-                    VALUES ('{escaped_room}', '{escaped_name}', {payment})
+                    VALUES (%s, %s, %s)
                     RETURNING id
-                ''')
+                ''', (room_number, housekeeper_name, payment))
             
             record_id = cur.fetchone()[0]
             conn.commit()
@@ -130,17 +126,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             if payment_status == 'paid':
-                cur.execute(f'''
+                cur.execute('''
                     UPDATE t_p9202093_hotel_design_site.cleaning_history
                     SET payment_status = 'paid', paid_at = NOW()
-                    WHERE id = {record_id}
-                ''')
+                    WHERE id = %s
+                ''', (record_id,))
             else:
-                cur.execute(f'''
+                cur.execute('''
                     UPDATE t_p9202093_hotel_design_site.cleaning_history
                     SET payment_status = 'unpaid', paid_at = NULL
-                    WHERE id = {record_id}
-                ''')
+                    WHERE id = %s
+                ''', (record_id,))
             
             conn.commit()
             
@@ -162,10 +158,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'success': False, 'error': 'Не указан ID записи'})
                 }
             
-            cur.execute(f'''
+            cur.execute('''
                 DELETE FROM t_p9202093_hotel_design_site.cleaning_history
-                WHERE id = {record_id}
-            ''')
+                WHERE id = %s
+            ''', (record_id,))
             
             conn.commit()
             
@@ -0,0 +1,458 @@
+# Копия backend/_shared/bookings_db.py. Не редактировать: правьте оригинал и запустите python3 scripts/vendor_shared.py
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from prepared import execute_prepared
+
+# Общий доступ к bookings для всех функций броней: одни и те же параметризованные запросы,
+# выровненные по индексам (V0097: (check_in, id), (apartment_id, check_in, id); V0098: guest_phone),
+# и один сериализатор строки в JSON. Чтения идут через prepared statements (prepared.py).
+# Копируется к функциям scripts/vendor_shared.py.
+BOOKINGS_TABLE = 't_p9202093_hotel_design_site.bookings'
+ROOMS_TABLE = 't_p9202093_hotel_design_site.rooms'
+MONTHLY_REPORTS_TABLE = 't_p9202093_hotel_design_site.monthly_reports'
+# Итоги по апартаменту и месяцу заезда, их поддерживают триггеры на bookings (V0099)
+ROLLUPS_TABLE = 't_p9202093_hotel_design_site.booking_monthly_rollups'
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Колонки, которые разрешено писать через insert_booking/update_booking
+WRITABLE_COLUMNS = frozenset((
+    'id', 'bnovo_id', 'apartment_id', 'check_in', 'check_out', 'early_check_in', 'late_check_out', 'parking',
+    'accommodation_amount', 'total_amount', 'aggregator_commission', 'tax_and_bank_commission',
+    'remainder_before_management', 'management_commission', 'remainder_before_expenses', 'operating_expenses',
+    'owner_funds', 'payment_to_owner', 'payment_date', 'maid', 'laundry', 'hygiene', 'transport', 'compliment',
+    'other', 'other_note', 'guest_name', 'guest_email', 'guest_phone', 'guests_count', 'show_to_guest',
+    'payment_status', 'payment_completed_at', 'is_prepaid', 'prepayment_amount', 'prepayment_date',
+    'status', 'source', 'notes'
+))
+
+def _fetch_dicts(cur) -> List[Dict[str, Any]]:
+    '''Строки как dict для любого курсора: и обычного, и RealDictCursor'''
+    rows = cur.fetchall()
+    if rows and isinstance(rows[0], dict):
+        return [dict(row) for row in rows]
+    columns = [c[0] for c in cur.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+def _fetch_dict(cur) -> Optional[Dict[str, Any]]:
+    row = cur.fetchone()
+    if row is None or isinstance(row, dict):
+        return dict(row) if row else None
+    return dict(zip([c[0] for c in cur.description], row))
+
+def json_value(value: Any) -> Any:
+    '''Значение колонки в JSON: даты и время — ISO, Decimal — float'''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def json_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    '''Строка как есть (snake_case), пригодная для json.dumps'''
+    return {key: json_value(value) for key, value in row.items()}
+
+# --- Сериализация: поле ответа -> (колонки, из которых оно собирается; функция строки) ---
+
+FieldSpec = Tuple[Tuple[str, ...], Callable[[Dict[str, Any]], Any]]
+
+def _num(column: str) -> FieldSpec:
+    return (column,), lambda b: float(b[column]) if b.get(column) else 0
+
+def _text(column: str, default: Any = '') -> FieldSpec:
+    return (column,), lambda b: b.get(column) or default
+
+def _date_text(column: str, default: Any = None) -> FieldSpec:
+    return (column,), lambda b: str(b[column]) if b.get(column) else default
+
+def _raw(column: str) -> FieldSpec:
+    return (column,), lambda b: b.get(column)
+
+def _owner_funds_or_remainder(b: Dict[str, Any]) -> float:
+    if b.get('owner_funds') is not None:
+        return float(b['owner_funds'])
+    return (float(b['total_amount']) if b.get('total_amount') else 0) - \
+        (float(b['aggregator_commission']) if b.get('aggregator_commission') else 0)
+
+EXPENSE_COLUMNS = ('maid', 'laundry', 'hygiene', 'transport', 'compliment', 'other')
+
+# Админский список (bookings GET): расходы вложенным объектом, статус оплаты — по предоплате
+ADMIN_FIELDS: Dict[str, FieldSpec] = {
+    'id': _raw('id'),
+    'apartmentId': _raw('apartment_id'),
+    'guestName': _raw('guest_name'),
+    'guestEmail': _raw('guest_email'),
+    'guestPhone': _raw('guest_phone'),
+    'checkIn': (('check_in',), lambda b: str(b['check_in'])),
+    'checkOut': (('check_out',), lambda b: str(b['check_out'])),
+    'totalAmount': _num('total_amount'),
+    'aggregatorCommission': _num('aggregator_commission'),
+    'ownerFunds': (('owner_funds', 'total_amount', 'aggregator_commission'), _owner_funds_or_remainder),
+    'isPrepaid': (('is_prepaid',), lambda b: b.get('is_prepaid', False)),
+    'prepaymentAmount': _num('prepayment_amount'),
+    'prepaymentDate': _date_text('prepayment_date'),
+    'showToGuest': ((), lambda b: True),
+    'paymentStatus': (('is_prepaid',), lambda b: 'paid' if b.get('is_prepaid', False) else 'pending'),
+    'expenses': (EXPENSE_COLUMNS + ('other_note',), lambda b: {
+        **{column: float(b[column]) if b.get(column) else 0 for column in EXPENSE_COLUMNS},
+        'otherNote': b.get('other_note') or ''
+    }),
+    'status': _raw('status'),
+    'source': _raw('source'),
+}
+ADMIN_DEFAULT_FIELDS = [f for f in ADMIN_FIELDS if f not in ('status', 'source')]
+# Админская выгрузка в CSV: те же поля, расходы — отдельными колонками
+ADMIN_EXPORT_FIELDS: Dict[str, FieldSpec] = {
+    **{f: spec for f, spec in ADMIN_FIELDS.items() if f not in ('showToGuest', 'expenses')},
+    **{column: _num(column) for column in EXPENSE_COLUMNS},
+    'otherNote': _text('other_note'),
+}
+
+# Отчёт собственника (owner-reports, архивы месяцев): все финансовые колонки плоско
+REPORT_FIELDS: Dict[str, FieldSpec] = {
+    'id': _raw('id'),
+    'apartmentId': _raw('apartment_id'),
+    'checkIn': (('check_in',), lambda b: str(b['check_in'])),
+    'checkOut': (('check_out',), lambda b: str(b['check_out'])),
+    'earlyCheckIn': _num('early_check_in'),
+    'lateCheckOut': _num('late_check_out'),
+    'parking': _num('parking'),
+    'accommodationAmount': _num('accommodation_amount'),
+    'totalAmount': _num('total_amount'),
+    'aggregatorCommission': _num('aggregator_commission'),
+    'taxAndBankCommission': _num('tax_and_bank_commission'),
+    'remainderBeforeManagement': _num('remainder_before_management'),
+    'managementCommission': _num('management_commission'),
+    'remainderBeforeExpenses': _num('remainder_before_expenses'),
+    'operatingExpenses': _num('operating_expenses'),
+    'ownerFunds': _num('owner_funds'),
+    'paymentToOwner': _num('payment_to_owner'),
+    'paymentDate': _date_text('payment_date', ''),
+    **{column: _num(column) for column in EXPENSE_COLUMNS},
+    'otherNote': _text('other_note'),
+    'guestName': _text('guest_name'),
+    'guestEmail': _text('guest_email'),
+    'guestPhone': _text('guest_phone'),
+    'showToGuest': _text('show_to_guest', False),
+    'paymentStatus': _text('payment_status', 'pending'),
+    'paymentCompletedAt': _date_text('payment_completed_at'),
+}
+# Поля, которые сохраняются в monthly_reports.report_data
+ARCHIVE_FIELDS = [
+    'id', 'checkIn', 'checkOut', 'guestName', 'totalAmount', 'ownerFunds', 'operatingExpenses',
+    'managementCommission', 'accommodationAmount', 'parking', 'aggregatorCommission', 'remainderBeforeManagement',
+    'remainderBeforeExpenses', 'earlyCheckIn', 'lateCheckOut', 'taxAndBankCommission', *EXPENSE_COLUMNS,
+    'otherNote', 'showToGuest', 'paymentStatus', 'paymentCompletedAt'
+]
+
+# Те же поля архива выражениями SQL: report_data собирается в базе через jsonb_agg
+# и совпадает с serialize(rows, REPORT_FIELDS, ARCHIVE_FIELDS)
+def _num_sql(column: str) -> str:
+    return f'COALESCE(b.{column}, 0)::float8'
+
+ARCHIVE_SQL: Dict[str, str] = {
+    'id': 'b.id',
+    'checkIn': 'b.check_in::text',
+    'checkOut': 'b.check_out::text',
+    'guestName': "COALESCE(b.guest_name, '')",
+    **{field: _num_sql(column) for field, column in (
+        ('totalAmount', 'total_amount'), ('ownerFunds', 'owner_funds'), ('operatingExpenses', 'operating_expenses'),
+        ('managementCommission', 'management_commission'), ('accommodationAmount', 'accommodation_amount'),
+        ('parking', 'parking'), ('aggregatorCommission', 'aggregator_commission'),
+        ('remainderBeforeManagement', 'remainder_before_management'),
+        ('remainderBeforeExpenses', 'remainder_before_expenses'), ('earlyCheckIn', 'early_check_in'),
+        ('lateCheckOut', 'late_check_out'), ('taxAndBankCommission', 'tax_and_bank_commission'),
+    )},
+    **{column: _num_sql(column) for column in EXPENSE_COLUMNS},
+    'otherNote': "COALESCE(b.other_note, '')",
+    'showToGuest': 'COALESCE(b.show_to_guest, false)',
+    'paymentStatus': "COALESCE(NULLIF(b.payment_status, ''), 'pending')",
+    'paymentCompletedAt': 'b.payment_completed_at::text',
+}
+
+# Поле тела запроса отчёта -> (колонка, значение по умолчанию); None — поле обязательно
+REPORT_BODY_COLUMNS: Dict[str, Tuple[str, Any]] = {
+    'checkIn': ('check_in', None),
+    'checkOut': ('check_out', None),
+    'earlyCheckIn': ('early_check_in', 0),
+    'lateCheckOut': ('late_check_out', 0),
+    'parking': ('parking', 0),
+    'accommodationAmount': ('accommodation_amount', None),
+    'totalAmount': ('total_amount', None),
+    'aggregatorCommission': ('aggregator_commission', 0),
+    'taxAndBankCommission': ('tax_and_bank_commission', 0),
+    'remainderBeforeManagement': ('remainder_before_management', 0),
+    'managementCommission': ('management_commission', 0),
+    'remainderBeforeExpenses': ('remainder_before_expenses', 0),
+    'operatingExpenses': ('operating_expenses', 0),
+    'ownerFunds': ('owner_funds', 0),
+    'paymentToOwner': ('payment_to_owner', 0),
+    'paymentDate': ('payment_date', ''),
+    **{column: (column, 0) for column in EXPENSE_COLUMNS},
+    'otherNote': ('other_note', ''),
+    'guestName': ('guest_name', ''),
+    'guestEmail': ('guest_email', ''),
+    'guestPhone': ('guest_phone', ''),
+    'showToGuest': ('show_to_guest', False),
+    'paymentStatus': ('payment_status', 'pending'),
+    'paymentCompletedAt': ('payment_completed_at', ''),
+}
+
+def report_values(body: Dict[str, Any]) -> Dict[str, Any]:
+    '''Тело запроса отчёта (camelCase) -> колонки bookings; пустые даты — NULL'''
+    values = {}
+    for key, (column, default) in REPORT_BODY_COLUMNS.items():
+        value = body[key] if default is None else body.get(key, default)
+        if column in ('payment_date', 'payment_completed_at'):
+            value = value or None
+        values[column] = value
+    return values
+
+def parse_fields(raw: Optional[str], view: Dict[str, FieldSpec], default: Sequence[str]) -> List[str]:
+    if not raw:
+        return list(default)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in view]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def columns_for(view: Dict[str, FieldSpec], fields: Iterable[str]) -> List[str]:
+    '''Колонки для SELECT под выбранные поля; id и check_in нужны всегда (ключ сортировки)'''
+    return sorted({'id', 'check_in'} | {c for f in fields for c in view[f][0]})
+
+def serialize(rows: Iterable[Dict[str, Any]], view: Dict[str, FieldSpec], fields: Sequence[str]) -> List[Dict[str, Any]]:
+    '''Строки bookings -> JSON-объекты выбранных полей представления'''
+    getters = [(f, view[f][1]) for f in fields]
+    return [{f: getter(row) for f, getter in getters} for row in rows]
+
+# --- Чтение ---
+
+def parse_limit(raw: Optional[str]) -> Optional[int]:
+    if raw is None or raw == '':
+        return None
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def encode_cursor(check_in: Any, booking_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([str(check_in), booking_id]).encode('utf-8')).decode('ascii')
+
+def decode_cursor(raw: str) -> List[str]:
+    try:
+        check_in, booking_id = json.loads(base64.urlsafe_b64decode(raw.encode('ascii')))
+        datetime.strptime(check_in, '%Y-%m-%d')
+        return [check_in, str(booking_id)]
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError('Invalid cursor')
+
+def booking_filters(params: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+    '''WHERE по apartment_id, booking_id, периоду проживания (date_from/date_to), status и source (через запятую)'''
+    conditions: List[str] = []
+    values: List[Any] = []
+    for name in ('date_from', 'date_to'):
+        if params.get(name):
+            try:
+                datetime.strptime(params[name], '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f'{name} must be YYYY-MM-DD')
+    if params.get('apartment_id'):
+        conditions.append('apartment_id = %s')
+        values.append(str(params['apartment_id']))
+    if params.get('booking_id'):
+        conditions.append('id = %s')
+        values.append(str(params['booking_id']))
+    # Брони, пересекающие [date_from, date_to]: выезд позже начала и заезд не позже конца
+    if params.get('date_from'):
+        conditions.append('check_out > %s::date')
+        values.append(params['date_from'])
+    if params.get('date_to'):
+        conditions.append('check_in <= %s::date')
+        values.append(params['date_to'])
+    for name in ('status', 'source'):
+        if params.get(name):
+            conditions.append(f'{name} = ANY(%s)')
+            values.append([v.strip() for v in str(params[name]).split(',') if v.strip()])
+    return conditions, values
+
+def list_bookings(cur, columns: Sequence[str], conditions: Sequence[str] = (), values: Sequence[Any] = (),
+                  after: Optional[Sequence[str]] = None,
+                  limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    '''
+    Брони от новых к старым по (check_in, id) — порядок индексов V0097.
+    after — ключ последней строки прошлой страницы; с limit возвращает и next_cursor.
+    '''
+    conditions = list(conditions)
+    values = list(values)
+    if after is not None:
+        conditions.append('(check_in, id) < (%s::date, %s)')
+        values.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    page_limit = ''
+    if limit is not None:
+        # Лишняя строка показывает, есть ли следующая страница
+        page_limit = 'LIMIT %s'
+        values.append(limit + 1)
+    execute_prepared(cur, f"""
+        SELECT {', '.join(columns)} FROM {BOOKINGS_TABLE}
+        {where}
+        ORDER BY check_in DESC, id DESC
+        {page_limit}
+    """, values)
+    rows = _fetch_dicts(cur)
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['check_in'], rows[-1]['id'])
+    return rows, next_cursor
+
+def export_query(columns: Sequence[str], conditions: Sequence[str] = (),
+                 values: Sequence[Any] = ()) -> Tuple[str, List[Any]]:
+    '''Запрос всех подходящих броней в порядке list_bookings — для серверного курсора выгрузки'''
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f"""
+        SELECT {', '.join(columns)} FROM {BOOKINGS_TABLE}
+        {where}
+        ORDER BY check_in DESC, id DESC
+    """, list(values)
+
+def get_booking(cur, booking_id: str, columns: Sequence[str] = ('*',)) -> Optional[Dict[str, Any]]:
+    execute_prepared(cur, f"SELECT {', '.join(columns)} FROM {BOOKINGS_TABLE} WHERE id = %s", (booking_id,))
+    return _fetch_dict(cur)
+
+def guest_bookings(cur, email: Optional[str], phone: Optional[str],
+                   with_apartment: bool = False) -> List[Dict[str, Any]]:
+    '''Брони гостя по email или телефону; OR раскладывается на индексы guest_email и guest_phone'''
+    apartment = ', r.number AS apartment' if with_apartment else ''
+    join = f'LEFT JOIN {ROOMS_TABLE} r ON b.apartment_id = r.id' if with_apartment else ''
+    execute_prepared(cur, f"""
+        SELECT b.*{apartment}
+        FROM {BOOKINGS_TABLE} b
+        {join}
+        WHERE b.guest_email = %s OR b.guest_phone = %s
+        ORDER BY b.check_in DESC
+    """, (email, phone))
+    return _fetch_dicts(cur)
+
+def bookings_for_month(cur, apartment_id: str, month: str) -> List[Dict[str, Any]]:
+    '''Брони апартамента с заездом в месяце YYYY-MM: диапазон по check_in вместо TO_CHAR, идёт по индексу'''
+    month_start = datetime.strptime(month, '%Y-%m').date()
+    execute_prepared(cur, f"""
+        SELECT * FROM {BOOKINGS_TABLE}
+        WHERE apartment_id = %s
+          AND check_in >= %s::date
+          AND check_in < (%s::date + interval '1 month')
+        ORDER BY check_in
+    """, (apartment_id, month_start, month_start))
+    return _fetch_dicts(cur)
+
+def archive_month(cur, month: str) -> List[Dict[str, Any]]:
+    '''
+    Архив месяца YYYY-MM в monthly_reports для всех апартаментов одним INSERT ... SELECT:
+    брони берутся диапазоном по check_in, GROUP BY apartment_id, report_data — jsonb_agg.
+    Возвращает (apartment_id, bookings_count) записанных отчётов.
+    '''
+    month_start = datetime.strptime(month, '%Y-%m').date()
+    report = ', '.join(f"'{field}', {ARCHIVE_SQL[field]}" for field in ARCHIVE_FIELDS)
+    cur.execute(f"""
+        INSERT INTO {MONTHLY_REPORTS_TABLE}
+            (apartment_id, report_month, report_data, total_amount, owner_funds,
+             operating_expenses, bookings_count, created_at)
+        SELECT b.apartment_id, %s::text,
+               jsonb_agg(jsonb_build_object({report}) ORDER BY b.check_in, b.id),
+               SUM(COALESCE(b.total_amount, 0)), SUM(COALESCE(b.owner_funds, 0)),
+               SUM(COALESCE(b.operating_expenses, 0)), COUNT(*), NOW()
+        FROM {BOOKINGS_TABLE} b
+        WHERE b.check_in >= %s::date
+          AND b.check_in < (%s::date + interval '1 month')
+        GROUP BY b.apartment_id
+        ON CONFLICT (apartment_id, report_month) DO UPDATE SET
+            report_data = EXCLUDED.report_data,
+            total_amount = EXCLUDED.total_amount,
+            owner_funds = EXCLUDED.owner_funds,
+            operating_expenses = EXCLUDED.operating_expenses,
+            bookings_count = EXCLUDED.bookings_count,
+            created_at = NOW()
+        RETURNING apartment_id, bookings_count
+    """, (month, month_start, month_start))
+    return _fetch_dicts(cur)
+
+# Колонка booking_monthly_rollups -> поле ответа
+ROLLUP_FIELDS = {
+    'bookings_count': 'bookingsCount', 'nights': 'nights', 'total_amount': 'totalAmount',
+    'accommodation_amount': 'accommodationAmount', 'tax_and_bank_commission': 'taxAndBankCommission',
+    'management_commission': 'managementCommission', 'operating_expenses': 'operatingExpenses',
+    'owner_funds': 'ownerFunds', 'payment_to_owner': 'paymentToOwner',
+    **{column: column for column in EXPENSE_COLUMNS},
+}
+
+def monthly_rollups(cur, apartment_ids: Sequence[str], month_from: Optional[str] = None,
+                    month_to: Optional[str] = None) -> List[Dict[str, Any]]:
+    '''Итоги апартаментов по месяцам заезда (YYYY-MM, границы включительно) — строка на месяц, а не на бронь'''
+    bounds = [datetime.strptime(m, '%Y-%m').date() if m else None for m in (month_from, month_to)]
+    execute_prepared(cur, f"""
+        SELECT apartment_id, month, {', '.join(ROLLUP_FIELDS)}
+        FROM {ROLLUPS_TABLE}
+        WHERE apartment_id = ANY(%s::text[])
+          AND month >= COALESCE(%s::date, '-infinity'::date)
+          AND month <= COALESCE(%s::date, 'infinity'::date)
+        ORDER BY apartment_id, month
+    """, (list(apartment_ids), *bounds))
+    return [{
+        'apartmentId': row['apartment_id'],
+        'month': row['month'].strftime('%Y-%m'),
+        **{field: json_value(row[column]) for column, field in ROLLUP_FIELDS.items()}
+    } for row in _fetch_dicts(cur)]
+
+# --- Запись ---
+
+def _check_columns(values: Dict[str, Any]) -> None:
+    unknown = set(values) - WRITABLE_COLUMNS
+    if unknown:
+        raise ValueError(f"Unknown booking columns: {', '.join(sorted(unknown))}")
+
+def insert_booking(cur, values: Dict[str, Any]) -> None:
+    '''Одна вставка; пересечение активных броней отсекает bookings_no_overlap (ExclusionViolation)'''
+    _check_columns(values)
+    columns = list(values)
+    cur.execute(
+        f"INSERT INTO {BOOKINGS_TABLE} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+        [values[c] for c in columns]
+    )
+
+def update_booking(cur, booking_id: str, values: Dict[str, Any], apartment_id: Optional[str] = None,
+                   returning: Sequence[str] = ('id',)) -> Optional[Dict[str, Any]]:
+    '''UPDATE по первичному ключу (и апартаменту, если задан); None — брони нет'''
+    _check_columns(values)
+    assignments = [f'{c} = %s' for c in values] + ['updated_at = CURRENT_TIMESTAMP']
+    params = list(values.values()) + [booking_id]
+    apartment_filter = ''
+    if apartment_id is not None:
+        apartment_filter = 'AND apartment_id = %s'
+        params.append(apartment_id)
+    cur.execute(f"""
+        UPDATE {BOOKINGS_TABLE}
+        SET {', '.join(assignments)}
+        WHERE id = %s {apartment_filter}
+        RETURNING {', '.join(returning)}
+    """, params)
+    return _fetch_dict(cur)
+
+def delete_booking(cur, booking_id: str, apartment_id: Optional[str] = None) -> Optional[str]:
+    '''Удаление брони; её интервал в booked_ranges уходит каскадом. Возвращает id или None'''
+    params: List[Any] = [booking_id]
+    apartment_filter = ''
+    if apartment_id is not None:
+        apartment_filter = 'AND apartment_id = %s'
+        params.append(apartment_id)
+    cur.execute(f"DELETE FROM {BOOKINGS_TABLE} WHERE id = %s {apartment_filter} RETURNING id", params)
+    row = _fetch_dict(cur)
+    return row['id'] if row else None
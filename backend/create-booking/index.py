@@ -1,12 +1,15 @@
 import json
 import os
 import psycopg2
+import psycopg2.errors
 import time
 import secrets
 import string
 import uuid
 from datetime import datetime
 from typing import Dict, Any, Tuple
+from bookings_db import insert_booking
+from db_connection import get_connection
 
 # Force redeploy
 
@@ -76,7 +79,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         guest_phone = body_data.get('guest_phone')
         adults = body_data.get('adults', 2)
         children = body_data.get('children', 0)
-        source = body_data.get('source', 'website')
         
         if not all([apartment_id, check_in, check_out, guest_name, guest_email, guest_phone]):
             return {
@@ -103,31 +105,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'Database not configured'})
             }
         
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT COUNT(*) FROM bookings 
-            WHERE apartment_id = %s::text
-            AND status != 'cancelled'
-            AND (
-                (check_in <= %s::date AND check_out > %s::date)
-                OR (check_in < %s::date AND check_out >= %s::date)
-                OR (check_in >= %s::date AND check_out <= %s::date)
-            )
-        ''', (str(apartment_id), check_in, check_in, check_out, check_out, check_in, check_out))
-        
-        conflict_count = cursor.fetchone()[0]
-        
-        if conflict_count > 0:
-            cursor.close()
-            conn.close()
-            return {
-                'statusCode': 409,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Dates are already booked'})
-            }
-        
         cursor.execute(f"SELECT bnovo_name, number, price_per_night FROM t_p9202093_hotel_design_site.rooms WHERE id = '{apartment_id}'")
         room_data = cursor.fetchone()
         apartment_name = room_data[0] if room_data and room_data[0] else (room_data[1] if room_data else apartment_id)
@@ -139,15 +119,36 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         nights = (check_out_date - check_in_date).days
         total_amount = price_per_night * nights
         
-        guest_id, guest_login, guest_password = create_or_get_guest(cursor, conn, guest_name, guest_email, guest_phone)
+        # Пересечение с активной бронью отсекает ограничение bookings_no_overlap (V0096):
+        # одна вставка по GiST-индексу вместо проверки и вставки, между которыми успевает другой запрос
+        try:
+            insert_booking(cursor, {
+                'id': booking_id,
+                'apartment_id': str(apartment_id),
+                'check_in': check_in,
+                'check_out': check_out,
+                'guest_name': guest_name,
+                'guest_email': guest_email,
+                'guest_phone': guest_phone,
+                'guests_count': guests_count,
+                'accommodation_amount': total_amount,
+                'total_amount': total_amount,
+                # Источник не берётся из запроса: брони Bnovo пишет только синхронизация (V0104)
+                'source': 'website',
+                'status': 'pending'
+            })
+        except psycopg2.errors.ExclusionViolation:
+            conn.rollback()
+            cursor.close()
+            conn.close()
+            return {
+                'statusCode': 409,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Dates are already booked'})
+            }
         
-        cursor.execute('''
-            INSERT INTO t_p9202093_hotel_design_site.bookings 
-            (id, apartment_id, check_in, check_out, guest_name, guest_email, guest_phone, 
-             guests_count, accommodation_amount, total_amount, source, status)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (booking_id, str(apartment_id), check_in, check_out, guest_name, guest_email, 
-              guest_phone, guests_count, total_amount, total_amount, source, 'pending'))
+        # Гость создаётся только для принятой брони; create_or_get_guest фиксирует и её
+        guest_id, guest_login, guest_password = create_or_get_guest(cursor, conn, guest_name, guest_email, guest_phone)
         
         conn.commit()
         cursor.close()
@@ -8,8 +8,9 @@ import json
 import os
 from datetime import datetime, timedelta
 from typing import Dict, Any
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from bookings_db import bookings_for_month, json_row
+from db_connection import get_connection
 
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -42,7 +43,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'DATABASE_URL not configured'})
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = get_connection(dsn)
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
@@ -66,27 +67,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 continue
             
             # Получаем бронирования за этот месяц
-            cursor.execute("""
-                SELECT * FROM bookings 
-                WHERE apartment_id = %s 
-                AND TO_CHAR(check_in, 'YYYY-MM') = %s
-                ORDER BY check_in
-            """, (apartment_id, target_month))
-            
-            bookings = cursor.fetchall()
+            bookings = bookings_for_month(cursor, apartment_id, target_month)
             
             if not bookings:
                 continue
             
-            # Конвертируем даты в строки для JSON
-            bookings_data = []
-            for booking in bookings:
-                booking_dict = dict(booking)
-                if 'check_in' in booking_dict and booking_dict['check_in']:
-                    booking_dict['check_in'] = booking_dict['check_in'].isoformat()
-                if 'check_out' in booking_dict and booking_dict['check_out']:
-                    booking_dict['check_out'] = booking_dict['check_out'].isoformat()
-                bookings_data.append(booking_dict)
+            # Даты и суммы — в JSON-совместимые значения
+            bookings_data = [json_row(b) for b in bookings]
             
             # Подсчёт сумм
             total_amount = sum(float(b.get('total_amount', 0)) for b in bookings_data)
@@ -0,0 +1,103 @@
+import json
+import os
+from typing import Dict, Any, Optional
+from db_connection import get_connection
+
+# Секции availability_calendar создаются заранее на полтора года — столько вперёд пишет sync-bnovo-rates с запасом
+DEFAULT_MONTHS_AHEAD = 18
+# Месяцы старше двух лет отсоединяются в availability_calendar_archive_YYYYMM
+DEFAULT_KEEP_MONTHS = 24
+
+def int_param(params: Dict[str, Any], name: str, default: int) -> Optional[int]:
+    '''Целый параметр запроса; keep_months=none отключает архивацию'''
+    raw = params.get(name)
+    if raw is None or raw == '':
+        return default
+    if str(raw).lower() == 'none':
+        return None
+    return max(0, int(raw))
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Обслуживание месячных секций availability_calendar (запускается по расписанию)
+    Args: event с httpMethod, queryStringParameters (months_ahead, keep_months)
+    Returns: HTTP response со списком созданных и отсоединённых в архив секций
+    '''
+    method: str = event.get('httpMethod', 'POST')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+    
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'DATABASE_URL not configured'})
+        }
+    
+    params = event.get('queryStringParameters') or {}
+    try:
+        months_ahead = int_param(params, 'months_ahead', DEFAULT_MONTHS_AHEAD)
+        keep_months = int_param(params, 'keep_months', DEFAULT_KEEP_MONTHS)
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'months_ahead and keep_months must be integers'})
+        }
+    if months_ahead is None:
+        months_ahead = DEFAULT_MONTHS_AHEAD
+    
+    conn = get_connection(dsn)
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            "SELECT action, partition_name FROM t_p9202093_hotel_design_site.maintain_calendar_partitions(%s, %s)",
+            (months_ahead, keep_months)
+        )
+        actions = cur.fetchall()
+        
+        # Строки, попавшие в DEFAULT (даты вне всех секций): их перенесёт создание секции нужного месяца
+        cur.execute("SELECT COUNT(*) FROM t_p9202093_hotel_design_site.availability_calendar_default")
+        default_rows = cur.fetchone()[0]
+        conn.commit()
+        
+        created = [name for action, name in actions if action == 'created']
+        archived = [name for action, name in actions if action == 'archived']
+        print(f'[CALENDAR PARTITIONS] created={created} archived={archived} default_rows={default_rows}')
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'success': True,
+                'created': created,
+                'archived': archived,
+                'default_rows': default_rows,
+                'months_ahead': months_ahead,
+                'keep_months': keep_months
+            }, ensure_ascii=False)
+        }
+    
+    except Exception as e:
+        conn.rollback()
+        print(f'[CALENDAR PARTITIONS] failed: {e}')
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}, ensure_ascii=False)
+        }
+    finally:
+        cur.close()
+        conn.close()
@@ -1,44 +1,118 @@
 import json
 import os
-from typing import Dict, Any
-import urllib.request
-import urllib.parse
-import urllib.error
-from datetime import datetime, timedelta, date
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta, timezone
+from bnovo_client import BnovoAuthError, enable_db_token_store, fetch_bookings, get_metrics, get_token, reset_metrics
+from booked_ranges import write_booked_ranges
+from finances import DEFAULT_AGGREGATOR_RATE, recompute_finances
+from sync_lock import SyncLock, wait_seconds_from
 
 # Force redeploy
 
-def calculate_booking_finances(apartment_id: str, total_amount: float) -> Dict[str, float]:
-    '''Расчёт финансовых показателей бронирования для инвестора'''
-    
-    # Используем стандартную ставку 20% (можно расширить логику позже)
-    management_commission_rate = 20.0
-    
-    # Расчёт показателей
-    aggregator_commission_rate = 25.0
-    aggregator_commission = total_amount * (aggregator_commission_rate / 100)
-    
-    # Налог и банковская комиссия (7% от суммы после комиссии агрегатора)
-    tax_rate = 7.0
-    tax_and_bank = (total_amount - aggregator_commission) * (tax_rate / 100)
-    
-    remainder_before_management = total_amount - aggregator_commission - tax_and_bank
-    management_commission = remainder_before_management * (management_commission_rate / 100)
-    remainder_before_expenses = remainder_before_management - management_commission
-    
-    # Операционные расходы по умолчанию
-    operating_expenses = 3500.0
-    owner_funds = max(0, remainder_before_expenses - operating_expenses)
+SYNC_STATE_KEY = 'cron-sync-bnovo'
+# Полная пересинхронизация окна раз в сутки — ловит удалённые в Bnovo брони
+FULL_SYNC_INTERVAL = timedelta(hours=24)
+# Перекрытие водяного знака, чтобы не потерять брони, изменённые во время прошлого запуска
+WATERMARK_OVERLAP = timedelta(minutes=5)
+MODIFIED_AT_FIELDS = ('updated_at', 'update_date', 'updated', 'create_date', 'created_at')
+# Маппинг для разных форматов названий из Bnovo (подстрока room_name -> номер апартамента)
+ROOM_NAME_ALIASES = (
+    ('Поклонная 9-816', '816'),
+    ('Апартамент студия Матч Поинт', '1157'),
+    ('Мат Поинт 1157', '1157'),
+    ('Энитэо-193', '193'),
+)
+
+def parse_bnovo_timestamp(value: Any) -> Optional[datetime]:
+    '''Разбор отметки времени Bnovo ("2025-10-20 15:00:00+03") в naive UTC'''
+    if not value or not isinstance(value, str):
+        return None
+    raw = value.strip().replace('T', ' ')
+    # Bnovo отдаёт смещение без минут (+03), fromisoformat в старых версиях его не понимает
+    if len(raw) > 3 and raw[-3] in '+-' and raw[-2:].isdigit():
+        raw = raw + ':00'
+    try:
+        parsed = datetime.fromisoformat(raw)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def booking_modified_at(booking: Dict[str, Any]) -> Optional[datetime]:
+    '''Дата последнего изменения брони Bnovo (или дата создания, если изменений не было)'''
+    sources = [booking]
+    if isinstance(booking.get('dates'), dict):
+        sources.append(booking['dates'])
+    for source in sources:
+        for field in MODIFIED_AT_FIELDS:
+            parsed = parse_bnovo_timestamp(source.get(field))
+            if parsed:
+                return parsed
+    return None
+
+def resolve_room_number(room_name: str) -> str:
+    '''Номер апартамента по room_name из Bnovo с учётом нестандартных названий'''
+    for alias, number in ROOM_NAME_ALIASES:
+        if alias in room_name:
+            return number
+    return room_name
+
+def build_rooms_index(rooms: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    '''Индекс комнат по номеру, включая псевдонимы названий из Bnovo'''
+    index = {str(room['number']): room for room in rooms if room.get('number')}
+    for alias, number in ROOM_NAME_ALIASES:
+        if number in index:
+            index.setdefault(alias, index[number])
+    return index
+
+def load_sync_state(cur) -> Optional[Dict[str, Any]]:
+    '''Последний успешный водяной знак синхронизации'''
+    cur.execute(
+        "SELECT last_modified_at, max_bnovo_id, window_from, window_to, last_full_sync_at "
+        "FROM t_p9202093_hotel_design_site.bnovo_sync_state WHERE sync_key = %s",
+        (SYNC_STATE_KEY,)
+    )
+    return cur.fetchone()
+
+def save_sync_state(cur, last_modified_at: Optional[datetime], max_bnovo_id: Optional[int],
+                    window_from: str, window_to: str, full_sync: bool) -> None:
+    '''Сохранение водяного знака; вызывается в той же транзакции, что и запись броней'''
+    now = datetime.utcnow()
+    cur.execute("""
+        INSERT INTO t_p9202093_hotel_design_site.bnovo_sync_state
+        (sync_key, last_modified_at, max_bnovo_id, window_from, window_to,
+         last_full_sync_at, last_success_at, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (sync_key) DO UPDATE SET
+            last_modified_at = GREATEST(bnovo_sync_state.last_modified_at, EXCLUDED.last_modified_at),
+            max_bnovo_id = GREATEST(bnovo_sync_state.max_bnovo_id, EXCLUDED.max_bnovo_id),
+            window_from = EXCLUDED.window_from,
+            window_to = EXCLUDED.window_to,
+            last_full_sync_at = COALESCE(EXCLUDED.last_full_sync_at, bnovo_sync_state.last_full_sync_at),
+            last_success_at = EXCLUDED.last_success_at,
+            updated_at = EXCLUDED.updated_at
+    """, (SYNC_STATE_KEY, last_modified_at, max_bnovo_id, window_from, window_to,
+          now if full_sync else None, now, now))
+
+def select_changed_bookings(bookings: List[Any], state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    '''Отбор броней, изменённых после водяного знака (или новых по ID, если дата изменения неизвестна)'''
+    since = state.get('last_modified_at')
+    if since:
+        since = since - WATERMARK_OVERLAP
+    max_id = state.get('max_bnovo_id') or 0
     
-    return {
-        'aggregator_commission': round(aggregator_commission_rate, 2),
-        'tax_and_bank_commission': round(tax_and_bank, 2),
-        'remainder_before_management': round(remainder_before_management, 2),
-        'management_commission': round(management_commission, 2),
-        'remainder_before_expenses': round(remainder_before_expenses, 2),
-        'operating_expenses': round(operating_expenses, 2),
-        'owner_funds': round(owner_funds, 2)
-    }
+    changed = []
+    for booking in bookings:
+        if not isinstance(booking, dict) or not booking.get('id'):
+            continue
+        modified_at = booking_modified_at(booking)
+        if modified_at and since:
+            if modified_at > since:
+                changed.append(booking)
+        elif int(booking['id']) > max_id:
+            changed.append(booking)
+    return changed
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -61,14 +135,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': ''
         }
     
+    sync_lock = None
     try:
         import psycopg2
         import psycopg2.extras
+        from db_connection import get_connection
         
         # Получаем данные для подключения
         database_url = os.environ.get('DATABASE_URL', '')
-        account_id = os.environ.get('BNOVO_ACCOUNT_ID', '')
-        password = os.environ.get('BNOVO_PASSWORD', '')
         
         if not database_url:
             return {
@@ -77,141 +151,99 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'DATABASE_URL not configured'})
             }
         
-        # Авторизация в Bnovo
-        auth_url = 'https://api.pms.bnovo.ru/api/v1/auth'
-        auth_payload = {
-            'id': int(account_id),
-            'password': password
-        }
-        
-        auth_request = urllib.request.Request(
-            auth_url,
-            data=json.dumps(auth_payload).encode('utf-8'),
-            headers={
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
-            },
-            method='POST'
-        )
-        
-        with urllib.request.urlopen(auth_request, timeout=30) as auth_response:
-            auth_data = json.loads(auth_response.read().decode())
+        reset_metrics()
         
-        jwt_token = auth_data.get('data', {}).get('access_token')
-        
-        if not jwt_token:
+        # Токен Bnovo берётся из кэша (память процесса / bnovo_auth_tokens), /auth — только по истечении
+        enable_db_token_store(database_url)
+        try:
+            get_token()
+        except BnovoAuthError as e:
             return {
                 'statusCode': 500,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Failed to get Bnovo token'})
+                'body': json.dumps({'error': str(e)})
+            }
+        
+        # Single-flight: параллельный запуск не качает окно повторно и не пишет в те же календари
+        sync_lock = SyncLock(database_url, 'cron-sync-bnovo')
+        if not sync_lock.acquire(wait_seconds_from(event)):
+            return {
+                'statusCode': 409,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'success': False,
+                    'error': 'Bnovo sync is already running',
+                    **sync_lock.running_status()
+                })
+            }
+        if sync_lock.coalesced is not None:
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({**sync_lock.coalesced, 'coalesced': True}, ensure_ascii=False)
             }
         
         # Получаем бронирования за расширенный период (60 дней назад и 180 дней вперед)
         date_from = (datetime.now() - timedelta(days=60)).strftime('%Y-%m-%d')
         date_to = (datetime.now() + timedelta(days=180)).strftime('%Y-%m-%d')
         
-        # Получаем бронирования из Bnovo API
-        all_bookings = []
-        offset = 0
-        max_iterations = 10
-        
-        for _ in range(max_iterations):
-            params = urllib.parse.urlencode({
-                'date_from': date_from,
-                'date_to': date_to,
-                'limit': 20,
-                'offset': offset
-            })
-            bookings_url = f'https://api.pms.bnovo.ru/api/v1/bookings?{params}'
-            
-            bookings_request = urllib.request.Request(
-                bookings_url,
-                headers={
-                    'Authorization': f'Bearer {jwt_token}',
-                    'Accept': 'application/json'
-                }
-            )
-            
-            with urllib.request.urlopen(bookings_request, timeout=30) as response:
-                bookings_data = json.loads(response.read().decode())
-            
-            if isinstance(bookings_data, dict):
-                if 'data' in bookings_data and isinstance(bookings_data['data'], dict):
-                    batch = bookings_data['data'].get('bookings', [])
-                else:
-                    batch = bookings_data.get('bookings', bookings_data.get('data', []))
-            else:
-                batch = bookings_data
-            
-            if not isinstance(batch, list) or len(batch) == 0:
-                break
-            
-            all_bookings.extend(batch)
-            offset += 20
-            
-            if len(batch) < 20:
-                break
-        
-        # Старый код для бэкапа (закомментирован)
-        # all_bookings = []
-        # offset = 0
-        # max_iterations = 2
-        
-        # for _ in range(max_iterations):
-        #     params = urllib.parse.urlencode({
-        #         'date_from': date_from,
-        #         'date_to': date_to,
-        #         'limit': 20,
-        #         'offset': offset
-        #     })
-        #     bookings_url = f'https://api.pms.bnovo.ru/api/v1/bookings?{params}'
-        #     
-        #     bookings_request = urllib.request.Request(
-        #         bookings_url,
-        #         headers={
-        #             'Authorization': f'Bearer {jwt_token}',
-        #             'Accept': 'application/json'
-        #         }
-        #     )
-        #     
-        #     with urllib.request.urlopen(bookings_request, timeout=30) as response:
-        #         bookings_data = json.loads(response.read().decode())
-        #     
-        #     if isinstance(bookings_data, dict):
-        #         if 'data' in bookings_data and isinstance(bookings_data['data'], dict):
-        #             batch = bookings_data['data'].get('bookings', [])
-        #         else:
-        #             batch = bookings_data.get('bookings', bookings_data.get('data', []))
-        #     else:
-        #         batch = bookings_data
-        #     
-        #     if not isinstance(batch, list) or len(batch) == 0:
-        #         break
-        #     
-        #     all_bookings.extend(batch)
-        #     offset += 20
-        #     
-        #     if len(batch) < 20:
-        #         break
+        # Получаем бронирования из Bnovo API: окно режется на отрезки, которые качаются параллельно
+        all_bookings = fetch_bookings(date_from, date_to)
         
         # Подключаемся к базе данных
-        conn = psycopg2.connect(database_url)
+        conn = get_connection(database_url)
         conn.autocommit = False
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        # Запись синхронизации: до конца транзакции брони Bnovo поверх занятых дат
+        # помечаются overbooked, а не падают на bookings_no_overlap (V0104)
+        cur.execute("SELECT set_config('app.bnovo_sync', 'on', true)")
         
         synced_bookings = 0
+        updated_bookings = 0
         skipped_bookings = 0
         updated_calendar = 0
         
-        # Временная отладка: собираем все уникальные room_name из Bnovo
-        unique_room_names = set()
-        for b in all_bookings:
-            if isinstance(b, dict) and b.get('room_name'):
-                unique_room_names.add(str(b.get('room_name')))
-        print(f"[DEBUG] Unique room_name values from Bnovo: {sorted(unique_room_names)}")
+        # Режим: инкрементальный по водяному знаку или полный раз в FULL_SYNC_INTERVAL
+        query_params = event.get('queryStringParameters') or {}
+        requested_mode = query_params.get('mode', '')
+        sync_state = load_sync_state(cur)
+        full_sync = (
+            requested_mode == 'full'
+            or not sync_state
+            or not sync_state.get('last_full_sync_at')
+            or datetime.utcnow() - sync_state['last_full_sync_at'] >= FULL_SYNC_INTERVAL
+        )
+        if requested_mode == 'incremental' and sync_state:
+            full_sync = False
+        
+        bookings_to_process = all_bookings if full_sync else select_changed_bookings(all_bookings, sync_state)
+        print(f"[CRON] Mode: {'full' if full_sync else 'incremental'}, changed bookings: {len(bookings_to_process)} of {len(all_bookings)}")
+        
+        # Новый водяной знак считаем по всему окну, а сохраняем только после успешного commit
+        modified_values = [booking_modified_at(b) for b in all_bookings if isinstance(b, dict)]
+        modified_values = [m for m in modified_values if m]
+        new_watermark = max(modified_values) if modified_values else None
+        bnovo_ids = [int(b['id']) for b in all_bookings if isinstance(b, dict) and str(b.get('id', '')).isdigit()]
+        new_max_bnovo_id = max(bnovo_ids) if bnovo_ids else None
+        affected_bnovo_ids = []
+        
+        # Индексы в памяти вместо запроса на каждую бронь: комнаты по номеру и уже известные брони
+        cur.execute("SELECT id, number, bnovo_name FROM t_p9202093_hotel_design_site.rooms")
+        rooms_by_number = build_rooms_index(cur.fetchall())
+        
+        process_ids = [int(b['id']) for b in bookings_to_process if isinstance(b, dict) and str(b.get('id', '')).isdigit()]
+        cur.execute("""
+            SELECT id, bnovo_id
+            FROM t_p9202093_hotel_design_site.bookings
+            WHERE bnovo_id = ANY(%s)
+        """, (process_ids,))
+        existing_by_bnovo_id = {row['bnovo_id']: row for row in cur.fetchall()}
+        
+        bookings_to_insert = []
+        booking_updates = []
         
         # Синхронизируем бронирования  
-        for booking in all_bookings:
+        for booking in bookings_to_process:
             if not isinstance(booking, dict):
                 continue
             
@@ -222,26 +254,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             # Получаем room_name из Bnovo (это номер апартамента, например: "1401", "906")
             room_name_raw = booking.get('room_name', '')
-            room_number_original = str(room_name_raw) if room_name_raw else ''
-            
-            # Маппинг для разных форматов названий из Bnovo
-            room_number = room_number_original
-            if 'Поклонная 9-816' in room_number_original:
-                room_number = '816'
-            elif 'Апартамент студия Матч Поинт' in room_number_original:
-                room_number = '1157'
-            elif 'Мат Поинт 1157' in room_number_original:
-                room_number = '1157'
-            elif 'Энитэо-193' in room_number_original:
-                room_number = '193'
-            
-            room_number_escaped = room_number.replace("'", "''")
-            
-            # Находим наш апартамент по номеру
-            cur.execute(
-                f"SELECT id, number, bnovo_name FROM t_p9202093_hotel_design_site.rooms WHERE number = '{room_number_escaped}'"
-            )
-            room = cur.fetchone()
+            room_number = str(room_name_raw) if room_name_raw else ''
+            room = rooms_by_number.get(room_number)
+            if not room:
+                room_number = resolve_room_number(room_number)
+                room = rooms_by_number.get(room_number)
             
             if not room:
                 if skipped_bookings == 0:
@@ -251,7 +268,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             # Используем номер апартамента как ID (как в отчетности для собственников)
             apartment_id = str(room['number'])
-            room_id = str(room['id'])
             
             # Извлекаем даты из dates объекта
             dates = booking.get('dates', {})
@@ -268,12 +284,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 skipped_bookings += 1
                 continue
             
-            # Проверяем, существует ли бронирование
-            cur.execute(
-                f"SELECT id FROM t_p9202093_hotel_design_site.bookings WHERE bnovo_id = '{bnovo_booking_id}'"
-            )
-            existing = cur.fetchone()
-            
             # Извлекаем данные гостя из customer объекта
             customer = booking.get('customer', {})
             if isinstance(customer, dict):
@@ -287,152 +297,114 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 guest_email = ''
                 guest_phone = ''
             
-            if not existing:
-                # Создаём новое бронирование
-                booking_id = f"bnovo_{bnovo_booking_id}"
-                
-                extra = booking.get('extra', {})
-                adults = extra.get('adults', 2)
-                children = extra.get('children', 0)
-                
-                guest_name_escaped = str(guest_name).replace("'", "''")
-                guest_email_escaped = str(guest_email).replace("'", "''")
-                guest_phone_escaped = str(guest_phone).replace("'", "''")
-                notes_escaped = json.dumps(booking, ensure_ascii=False)[:500].replace("'", "''")
-                
-                # Расчёт финансовых показателей
-                total_amount = booking.get('amount', 0)
-                finances = calculate_booking_finances(apartment_id, total_amount)
-                
-                cur.execute(f"""
-                    INSERT INTO t_p9202093_hotel_design_site.bookings 
-                    (id, bnovo_id, apartment_id, check_in, check_out, guest_name, guest_email, 
-                     guest_phone, guests_count, accommodation_amount, total_amount, 
-                     aggregator_commission, tax_and_bank_commission, remainder_before_management,
-                     management_commission, remainder_before_expenses, operating_expenses, owner_funds,
-                     status, source, notes, show_to_guest)
-                    VALUES ('{booking_id}', '{bnovo_booking_id}', '{apartment_id}', '{check_in}', '{check_out}', 
-                            '{guest_name_escaped}', '{guest_email_escaped}', '{guest_phone_escaped}', 
-                            {adults + children}, {total_amount}, {total_amount}, 
-                            {finances['aggregator_commission']}, {finances['tax_and_bank_commission']},
-                            {finances['remainder_before_management']}, {finances['management_commission']},
-                            {finances['remainder_before_expenses']}, {finances['operating_expenses']},
-                            {finances['owner_funds']},
-                            'confirmed', 'bnovo', '{notes_escaped}', true)
-                    ON CONFLICT (id) DO NOTHING
-                """)
-                synced_bookings += 1
-        
-        # Обновляем новый календарь для всех существующих бронирований из Bnovo
-        print("[CRON] Updating NEW calendar_bnovo for existing Bnovo bookings...")
-        
-        # Получаем все бронирования и заполняем новый календарь
-        cur.execute("""
-            SELECT b.id, b.bnovo_id, b.apartment_id, b.check_in, b.check_out, b.guest_name, b.total_amount
-            FROM t_p9202093_hotel_design_site.bookings b
-            WHERE b.source = 'bnovo'
-              AND b.apartment_id IN (SELECT number FROM t_p9202093_hotel_design_site.rooms)
-        """)
-        bnovo_bookings = cur.fetchall()
-        
-        calendar_inserts = []
-        for booking in bnovo_bookings:
-            booking_id = booking['id']
-            bnovo_id = booking['bnovo_id'] or ''
-            apartment_id = booking['apartment_id']
-            guest_name = (booking['guest_name'] or '').replace("'", "''")
-            check_in = booking['check_in'] if isinstance(booking['check_in'], date) else datetime.strptime(booking['check_in'], '%Y-%m-%d').date()
-            check_out = booking['check_out'] if isinstance(booking['check_out'], date) else datetime.strptime(booking['check_out'], '%Y-%m-%d').date()
-            price = booking['total_amount'] or 0
+            extra = booking.get('extra', {})
+            adults = extra.get('adults', 2)
+            children = extra.get('children', 0)
             
-            current_date = check_in
-            while current_date < check_out:
-                calendar_inserts.append(f"('{apartment_id}', '{current_date}', false, '{booking_id}', '{bnovo_id}', '{guest_name}', {price})")
-                current_date += timedelta(days=1)
-        
-        if calendar_inserts:
-            # Удаляем дубликаты (берём последнее бронирование для каждой даты/апартамента)
-            unique_inserts = {}
-            for insert_str in calendar_inserts:
-                parts = insert_str.strip('()').split(',')
-                apartment_id_val = parts[0].strip().strip("'")
-                date_val = parts[1].strip().strip("'")
-                key = f"{apartment_id_val}_{date_val}"
-                unique_inserts[key] = insert_str
+            total_amount = booking.get('amount', 0)
+            notes = json.dumps(booking, ensure_ascii=False)[:500]
             
-            # Вставляем пачками по 500 записей
-            batch_size = 500
-            unique_list = list(unique_inserts.values())
-            for i in range(0, len(unique_list), batch_size):
-                batch = unique_list[i:i+batch_size]
-                cur.execute(f"""
-                    INSERT INTO t_p9202093_hotel_design_site.calendar_bnovo 
-                    (apartment_id, date, is_available, booking_id, bnovo_id, guest_name, price)
-                    VALUES {','.join(batch)}
-                    ON CONFLICT (apartment_id, date) 
-                    DO UPDATE SET 
-                        is_available = EXCLUDED.is_available,
-                        booking_id = EXCLUDED.booking_id,
-                        bnovo_id = EXCLUDED.bnovo_id,
-                        guest_name = EXCLUDED.guest_name,
-                        price = EXCLUDED.price
-                """)
-        
-        print(f"[CRON] NEW calendar_bnovo updated: {len(unique_inserts)} date entries created")
-        
-        # Обновляем availability_calendar для фронтенда
-        print("[CRON] Updating availability_calendar for frontend...")
-        
-        # Получаем room_id из rooms по apartment_id (number)
-        cur.execute("""
-            SELECT b.id as booking_id, r.id as room_id, b.check_in, b.check_out, b.total_amount
+            existing = existing_by_bnovo_id.get(int(bnovo_booking_id))
+            affected_bnovo_ids.append(int(bnovo_booking_id))
+            
+            if existing:
+                # Бронь уже есть — переписываем всё, что пишет вставка: даты, гость, суммы, статус
+                booking_updates.append((
+                    existing['id'], apartment_id, check_in, check_out,
+                    str(guest_name), str(guest_email), str(guest_phone),
+                    adults + children, total_amount, total_amount, 'confirmed', notes
+                ))
+                continue
+            
+            bookings_to_insert.append((
+                f"bnovo_{bnovo_booking_id}", bnovo_booking_id, apartment_id, check_in, check_out,
+                str(guest_name), str(guest_email), str(guest_phone),
+                adults + children, total_amount, total_amount,
+                # Производные суммы досчитывает recompute_finances после вставки
+                DEFAULT_AGGREGATOR_RATE, None, None, None, None, None, None,
+                'confirmed', 'bnovo', notes, True
+            ))
+            # Повторная бронь с тем же ID в выдаче Bnovo не должна попасть в INSERT дважды
+            existing_by_bnovo_id[int(bnovo_booking_id)] = {'id': f"bnovo_{bnovo_booking_id}"}
+        
+        # Все новые брони — одним INSERT
+        if bookings_to_insert:
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO t_p9202093_hotel_design_site.bookings 
+                (id, bnovo_id, apartment_id, check_in, check_out, guest_name, guest_email, 
+                 guest_phone, guests_count, accommodation_amount, total_amount, 
+                 aggregator_commission, tax_and_bank_commission, remainder_before_management,
+                 management_commission, remainder_before_expenses, operating_expenses, owner_funds,
+                 status, source, notes, show_to_guest)
+                VALUES %s
+                ON CONFLICT (id) DO NOTHING
+            """, bookings_to_insert, page_size=len(bookings_to_insert))
+            synced_bookings = len(bookings_to_insert)
+            # Финансы всех новых броней — одним UPDATE со ставкой управления из apartment_owners
+            recompute_finances(cur, booking_ids=[row[0] for row in bookings_to_insert])
+        
+        # Изменённые в Bnovo существующие брони — одним UPDATE ... FROM (VALUES ...);
+        # строки без изменений не переписываются, чтобы не будить триггеры календаря и аналитики
+        if booking_updates:
+            updated_rows = psycopg2.extras.execute_values(cur, """
+                UPDATE t_p9202093_hotel_design_site.bookings AS b
+                SET apartment_id = v.apartment_id, check_in = v.check_in::date, check_out = v.check_out::date,
+                    guest_name = v.guest_name, guest_email = v.guest_email, guest_phone = v.guest_phone,
+                    guests_count = v.guests_count::integer,
+                    accommodation_amount = v.accommodation_amount::numeric, total_amount = v.total_amount::numeric,
+                    status = v.status, notes = v.notes, updated_at = CURRENT_TIMESTAMP
+                FROM (VALUES %s) AS v (id, apartment_id, check_in, check_out, guest_name, guest_email, guest_phone,
+                                       guests_count, accommodation_amount, total_amount, status, notes)
+                WHERE b.id = v.id
+                  AND (b.apartment_id, b.check_in, b.check_out, b.guest_name, b.guest_email, b.guest_phone,
+                       b.guests_count, b.accommodation_amount, b.total_amount, b.status, b.notes)
+                      IS DISTINCT FROM
+                      (v.apartment_id, v.check_in::date, v.check_out::date, v.guest_name, v.guest_email, v.guest_phone,
+                       v.guests_count::integer, v.accommodation_amount::numeric, v.total_amount::numeric, v.status, v.notes)
+                RETURNING b.id
+            """, booking_updates, page_size=len(booking_updates), fetch=True)
+            updated_bookings = len(updated_rows)
+            # Суммы могли измениться — финансы собственника пересчитываются, как после вставки
+            if updated_rows:
+                recompute_finances(cur, booking_ids=[row['id'] for row in updated_rows])
+        
+        # Занятость пишем интервалами: одна строка booked_ranges на бронь вместо строки на каждую ночь
+        print("[CRON] Updating booked_ranges (diff)...")
+        
+        # В инкрементальном режиме трогаем только интервалы изменённых броней
+        affected_filter = '' if full_sync else 'AND b.bnovo_id = ANY(%s)'
+        affected_params = () if full_sync else (affected_bnovo_ids,)
+        
+        cur.execute(f"""
+            SELECT b.id, b.bnovo_id, b.check_in, b.check_out, b.guest_name, r.id AS room_id
             FROM t_p9202093_hotel_design_site.bookings b
             JOIN t_p9202093_hotel_design_site.rooms r ON b.apartment_id = r.number
             WHERE b.source = 'bnovo'
-        """)
-        room_bookings = cur.fetchall()
+              {affected_filter}
+        """, affected_params)
+        bnovo_bookings = cur.fetchall()
         
-        availability_inserts = []
-        for rb in room_bookings:
-            booking_id = rb['booking_id']
-            room_id = rb['room_id']
-            check_in = rb['check_in'] if isinstance(rb['check_in'], date) else datetime.strptime(rb['check_in'], '%Y-%m-%d').date()
-            check_out = rb['check_out'] if isinstance(rb['check_out'], date) else datetime.strptime(rb['check_out'], '%Y-%m-%d').date()
-            price = rb['total_amount'] or 0
-            
-            current_date = check_in
-            while current_date < check_out:
-                availability_inserts.append(f"('{room_id}', '{current_date}', false, '{booking_id}', {price})")
-                current_date += timedelta(days=1)
+        desired_ranges = {
+            booking['id']: (booking['room_id'], booking['check_in'], booking['check_out'],
+                            booking['bnovo_id'], booking['guest_name'])
+            for booking in bnovo_bookings
+        }
         
-        if availability_inserts:
-            # Удаляем дубликаты
-            unique_avail = {}
-            for insert_str in availability_inserts:
-                parts = insert_str.strip('()').split(',')
-                room_id_val = parts[0].strip().strip("'")
-                date_val = parts[1].strip().strip("'")
-                key = f"{room_id_val}_{date_val}"
-                unique_avail[key] = insert_str
-            
-            # Вставляем пачками
-            batch_size = 500
-            unique_avail_list = list(unique_avail.values())
-            for i in range(0, len(unique_avail_list), batch_size):
-                batch = unique_avail_list[i:i+batch_size]
-                cur.execute(f"""
-                    INSERT INTO t_p9202093_hotel_design_site.availability_calendar 
-                    (room_id, date, is_available, booking_id, price)
-                    VALUES {','.join(batch)}
-                    ON CONFLICT (room_id, date) DO UPDATE SET
-                        is_available = EXCLUDED.is_available,
-                        booking_id = EXCLUDED.booking_id,
-                        price = EXCLUDED.price
-                """)
+        # Интервалы броней из области синхронизации, которых больше нет в desired (комната не найдена), удаляются
+        if full_sync:
+            cur.execute("SELECT id FROM t_p9202093_hotel_design_site.bookings WHERE source = 'bnovo'")
+        else:
+            cur.execute(
+                "SELECT id FROM t_p9202093_hotel_design_site.bookings WHERE bnovo_id = ANY(%s)",
+                (affected_bnovo_ids,)
+            )
+        scope_booking_ids = list(set(desired_ranges) | {row['id'] for row in cur.fetchall()})
         
-        print(f"[CRON] availability_calendar updated: {len(unique_avail)} date entries created")
-        updated_calendar = len(unique_avail)
+        range_changes = write_booked_ranges(cur, desired_ranges, scope_booking_ids)
+        print(f"[CRON] booked_ranges: {len(desired_ranges)} bookings, changes: {json.dumps(range_changes)}")
+        updated_calendar = sum(range_changes.values())
         
+        save_sync_state(cur, new_watermark, new_max_bnovo_id, date_from, date_to, full_sync)
         conn.commit()
         cur.close()
         conn.close()
@@ -441,13 +413,21 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         sync_result = {
             'success': True,
             'timestamp': datetime.now().isoformat(),
+            'mode': 'full' if full_sync else 'incremental',
             'synced_bookings': synced_bookings,
+            'updated_bookings': updated_bookings,
+            'changed_bookings': len(bookings_to_process),
             'updated_calendar': updated_calendar,
+            'calendar_changes': {
+                'booked_ranges': range_changes
+            },
             'skipped_bookings': skipped_bookings,
-            'total_bookings_from_bnovo': len(all_bookings)
+            'total_bookings_from_bnovo': len(all_bookings),
+            'bnovo_http': get_metrics()
         }
         
         print(f"[CRON] Bnovo sync completed: {json.dumps(sync_result)}")
+        sync_lock.record(sync_result)
         
         return {
             'statusCode': 200,
@@ -464,9 +444,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
         
         print(f"[CRON] Bnovo sync failed: {json.dumps(error_result)}")
+        if sync_lock:
+            sync_lock.record(error_result, success=False)
         
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'body': json.dumps(error_result)
-        }
\ No newline at end of file
+        }
+    
+    finally:
+        if sync_lock:
+            sync_lock.release()
\ No newline at end of file
@@ -5,6 +5,7 @@ import psycopg2.extras
 from datetime import datetime, timedelta
 import random
 from typing import Dict, Any
+from db_connection import get_connection
 
 # Force redeploy
 
@@ -38,7 +39,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Database configuration error'})
         }
     
-    conn = psycopg2.connect(database_url)
+    conn = get_connection(database_url)
     conn.set_session(autocommit=False)
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
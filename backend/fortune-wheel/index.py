@@ -1,10 +1,10 @@
 import json
 import os
-import psycopg2
 from datetime import datetime, timedelta
 import random
 import string
 from typing import Dict, Any
+from db_connection import get_connection
 
 # Force redeploy
 
@@ -63,7 +63,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'Database configuration error'})
             }
         
-        conn = psycopg2.connect(database_url)
+        conn = get_connection(database_url)
         cur = conn.cursor()
         
         if booking_id:
@@ -136,7 +136,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'Database configuration error'})
             }
         
-        conn = psycopg2.connect(database_url)
+        conn = get_connection(database_url)
         cur = conn.cursor()
         
         cur.execute(
@@ -7,15 +7,16 @@ Returns: JSON с результатом авторизации и данными
 import json
 import os
 from typing import Dict, Any
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db_connection import get_connection
+from prepared import execute_prepared
 
 def get_db_connection():
     """Подключение к БД через simple query protocol"""
     database_url = os.environ.get('DATABASE_URL')
     if not database_url:
         raise ValueError('DATABASE_URL not found')
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    return get_connection(database_url, cursor_factory=RealDictCursor)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
@@ -47,8 +48,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     body_data = json.loads(event.get('body', '{}'))
-    login = body_data.get('login', '').strip().replace("'", "''")
-    password = body_data.get('password', '').strip().replace("'", "''")
+    login = body_data.get('login', '').strip()
+    password = body_data.get('password', '').strip()
     
     if not login or not password:
         return {
@@ -62,8 +63,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     cursor = conn.cursor()
     
     try:
-        query = f"SELECT * FROM t_p9202093_hotel_design_site.guests WHERE login = '{login}' AND password = '{password}' LIMIT 1"
-        cursor.execute(query)
+        execute_prepared(
+            cursor,
+            "SELECT * FROM t_p9202093_hotel_design_site.guests WHERE login = %s AND password = %s LIMIT 1",
+            (login, password)
+        )
         guest = cursor.fetchone()
         
         if not guest:
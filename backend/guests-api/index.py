@@ -10,15 +10,16 @@ from typing import Dict, Any, List, Optional
 from datetime import datetime
 
 # Force redeploy
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from bookings_db import guest_bookings, json_row
+from db_connection import get_connection
 
 def get_db_connection():
     """Подключение к БД через simple query protocol"""
     database_url = os.environ.get('DATABASE_URL')
     if not database_url:
         raise ValueError('DATABASE_URL not found')
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    return get_connection(database_url, cursor_factory=RealDictCursor)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -63,28 +64,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                bookings_query = f"""
-                    SELECT b.*, r.number as apartment
-                    FROM t_p9202093_hotel_design_site.bookings b
-                    LEFT JOIN t_p9202093_hotel_design_site.rooms r ON b.apartment_id = r.id
-                    WHERE b.guest_email = '{guest['email'].replace("'", "''")}' 
-                       OR b.guest_phone = '{guest['phone'].replace("'", "''")}'
-                    ORDER BY b.check_in DESC
-                """
-                cursor.execute(bookings_query)
-                bookings = cursor.fetchall()
-                
-                bookings_list = []
-                for booking in bookings:
-                    booking_dict = {}
-                    for key, value in booking.items():
-                        if hasattr(value, 'isoformat'):
-                            booking_dict[key] = value.isoformat()
-                        elif str(type(value)) == "<class 'decimal.Decimal'>":
-                            booking_dict[key] = float(value)
-                        else:
-                            booking_dict[key] = value
-                    bookings_list.append(booking_dict)
+                bookings_list = [
+                    json_row(b) for b in guest_bookings(cursor, guest['email'], guest['phone'], with_apartment=True)
+                ]
                 
                 return {
                     'statusCode': 200,
@@ -106,26 +88,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                bookings_query = f"""
-                    SELECT * FROM t_p9202093_hotel_design_site.bookings 
-                    WHERE guest_email = '{guest['email'].replace("'", "''")}' 
-                       OR guest_phone = '{guest['phone'].replace("'", "''")}'
-                    ORDER BY check_in DESC
-                """
-                cursor.execute(bookings_query)
-                bookings = cursor.fetchall()
-                
-                bookings_list = []
-                for booking in bookings:
-                    booking_dict = {}
-                    for key, value in booking.items():
-                        if hasattr(value, 'isoformat'):
-                            booking_dict[key] = value.isoformat()
-                        elif str(type(value)) == "<class 'decimal.Decimal'>":
-                            booking_dict[key] = float(value)
-                        else:
-                            booking_dict[key] = value
-                    bookings_list.append(booking_dict)
+                bookings_list = [json_row(b) for b in guest_bookings(cursor, guest['email'], guest['phone'])]
                 
                 return {
                     'statusCode': 200,
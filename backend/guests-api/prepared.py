@@ -0,0 +1,95 @@
+# Копия backend/_shared/prepared.py. Не редактировать: правьте оригинал и запустите python3 scripts/vendor_shared.py
+import hashlib
+import os
+import re
+import weakref
+from typing import Any, Sequence, Set
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+
+# Реестр серверных prepared statements для горячих запросов: текст разбирается
+# и планируется один раз на соединение (PREPARE), дальше — EXECUTE по имени.
+# Соединения из db_connection живут между вызовами, а вместе с ними и подготовленные
+# запросы: при возврате в пул сессия сбрасывается без DEALLOCATE ALL (db_connection.SESSION_RESET).
+# PREPARED_STATEMENTS=0 выключает PREPARE (например, за пулером в режиме transaction).
+ENABLED = os.environ.get('PREPARED_STATEMENTS', '1') != '0'
+# Текстов на соединение: projection fields= даёт много форм запроса, лишние идут без PREPARE
+MAX_PER_CONNECTION = 64
+
+_PLACEHOLDER = re.compile(r'%%|%s')
+
+# conn -> имена подготовленных на нём запросов
+_prepared: 'weakref.WeakKeyDictionary[Any, Set[str]]' = weakref.WeakKeyDictionary()
+# conn -> имена, которые есть на сервере, но использовать их нельзя (сменился тип результата):
+# перед повторным PREPARE их нужно DEALLOCATE
+_stale: 'weakref.WeakKeyDictionary[Any, Set[str]]' = weakref.WeakKeyDictionary()
+
+def statement_name(sql: str) -> str:
+    '''Имя запроса по его тексту: один и тот же SQL в любой функции — одно имя'''
+    return 'ps_' + hashlib.sha1(sql.encode('utf-8')).hexdigest()[:16]
+
+def _to_server_sql(sql: str) -> str:
+    '''Плейсхолдеры psycopg2 %s -> $1, $2, ...; %% -> %'''
+    counter = iter(range(1, 10000))
+    return _PLACEHOLDER.sub(lambda m: '%' if m.group(0) == '%%' else f'${next(counter)}', sql)
+
+def _execute_by_name(cur, name: str, params: Sequence[Any]) -> None:
+    if params:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cur.execute(f'EXECUTE {name}')
+
+def _prepare(cur, name: str, sql: str) -> None:
+    stale = _stale.setdefault(cur.connection, set())
+    if name in stale:
+        cur.execute(f'DEALLOCATE {name}')
+        stale.discard(name)
+    cur.execute(f'PREPARE {name} AS {_to_server_sql(sql)}')
+
+def forget(conn) -> None:
+    '''Сервер потерял подготовленные запросы соединения (DISCARD ALL, пулер) — подготовить заново'''
+    _prepared.pop(conn, None)
+    _stale.pop(conn, None)
+
+def execute_prepared(cur, sql: str, params: Sequence[Any] = ()) -> None:
+    '''
+    cur.execute(sql, params) через PREPARE/EXECUTE. В sql только позиционные %s;
+    типы параметров Postgres выводит из запроса, где не выводятся — нужен явный ::cast.
+    '''
+    params = list(params)
+    conn = cur.connection
+    statements = _prepared.setdefault(conn, set())
+    name = statement_name(sql)
+
+    if not ENABLED or (name not in statements and len(statements) >= MAX_PER_CONNECTION):
+        cur.execute(sql, params)
+        return
+
+    if name not in statements:
+        _prepare(cur, name, sql)
+        statements.add(name)
+        _execute_by_name(cur, name, params)
+        return
+
+    # Запрос первый в транзакции — при сбое откатывать нечего и можно подготовить его заново
+    first_in_transaction = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    try:
+        _execute_by_name(cur, name, params)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # Сессию сбросил пулер: пропали все запросы соединения, а не только этот
+        forget(conn)
+        if not first_in_transaction:
+            raise
+        conn.rollback()
+        execute_prepared(cur, sql, params)
+    except psycopg2.errors.FeatureNotSupported:
+        # Миграция поменяла колонки запроса с SELECT * ("cached plan must not change result type"):
+        # запрос остаётся на сервере, следующий PREPARE сначала удалит его
+        statements.discard(name)
+        _stale.setdefault(conn, set()).add(name)
+        if not first_in_transaction:
+            raise
+        conn.rollback()
+        execute_prepared(cur, sql, params)
@@ -9,15 +9,15 @@ import json
 import os
 from typing import Dict, Any, List, Optional
 from datetime import datetime
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db_connection import get_connection
 
 def get_db_connection():
     """Создание подключения к БД"""
     dsn = os.environ.get('DATABASE_URL')
     if not dsn:
         raise Exception('DATABASE_URL not configured')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    return get_connection(dsn, cursor_factory=RealDictCursor)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
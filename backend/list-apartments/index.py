@@ -1,7 +1,7 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from db_connection import get_connection
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -39,7 +39,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'Database not configured'})
             }
         
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -0,0 +1,110 @@
+# Копия backend/_shared/finances.py. Не редактировать: правьте оригинал и запустите python3 scripts/vendor_shared.py
+from typing import Any, List, Optional, Sequence
+
+# Финансы броней для собственника считаются одним UPDATE на всю пачку броней:
+# синхронизации Bnovo после вставки, пересчёт за период/апартамент — в manage-commission.
+BOOKINGS_TABLE = 't_p9202093_hotel_design_site.bookings'
+OWNERS_TABLE = 't_p9202093_hotel_design_site.apartment_owners'
+ROOMS_TABLE = 't_p9202093_hotel_design_site.rooms'
+
+# Комиссия агрегатора для броней Bnovo. bookings.aggregator_commission хранит ставку в процентах
+# (DECIMAL(5,2), в отчётах выводится с %), сумма комиссии из неё выводится при расчёте
+DEFAULT_AGGREGATOR_RATE = 25.0
+# УСН и комиссия банка — от суммы после комиссии агрегатора
+TAX_AND_BANK_RATE = 7.0
+# Ставка управляющей компании, если у апартамента нет строки в apartment_owners
+DEFAULT_MANAGEMENT_RATE = 20.0
+# Операционные расходы брони, пока не внесены статьи (горничная, прачечная, ...)
+DEFAULT_OPERATING_EXPENSES = 3500.0
+
+FINANCE_COLUMNS = (
+    'tax_and_bank_commission', 'remainder_before_management', 'management_commission',
+    'remainder_before_expenses', 'operating_expenses', 'owner_funds'
+)
+
+# apartment_owners после V0082 ссылается на rooms.id, а брони Bnovo хранят номер апартамента:
+# ставка ищется по обоим ключам
+_OWNER_RATES = f"""
+    SELECT DISTINCT ON (apartment_key) apartment_key, commission_rate
+    FROM (
+        SELECT ao.apartment_id AS apartment_key, ao.commission_rate, 0 AS priority FROM {OWNERS_TABLE} ao
+        UNION ALL
+        SELECT r.number, ao.commission_rate, 1 FROM {OWNERS_TABLE} ao JOIN {ROOMS_TABLE} r ON r.id = ao.apartment_id
+    ) keys
+    WHERE commission_rate IS NOT NULL
+    ORDER BY apartment_key, priority
+"""
+
+def recompute_finances(cur, booking_ids: Optional[Sequence[str]] = None, apartment_id: Optional[str] = None,
+                       date_from: Optional[str] = None, date_to: Optional[str] = None,
+                       source: Optional[str] = 'bnovo') -> int:
+    '''
+    Пересчёт производных колонок броней одним проходом: ставка управления — commission_rate
+    апартамента, расходы — сумма статей, иначе сохранённые, иначе DEFAULT_OPERATING_EXPENSES.
+    Фильтры: брони по id, апартамент (id комнаты или номер), заезд в [date_from, date_to], источник.
+    Переписываются только изменившиеся строки; возвращает их число.
+    '''
+    conditions: List[str] = []
+    values: List[Any] = []
+    if booking_ids is not None:
+        conditions.append('b.id = ANY(%s)')
+        values.append(list(booking_ids))
+    if apartment_id:
+        conditions.append(f"""b.apartment_id IN (
+            SELECT %s UNION ALL SELECT number FROM {ROOMS_TABLE} WHERE id = %s
+            UNION ALL SELECT id FROM {ROOMS_TABLE} WHERE number = %s
+        )""")
+        values.extend([apartment_id] * 3)
+    if date_from:
+        conditions.append('b.check_in >= %s::date')
+        values.append(date_from)
+    if date_to:
+        conditions.append('b.check_in <= %s::date')
+        values.append(date_to)
+    if source:
+        conditions.append('b.source = %s')
+        values.append(source)
+    where = ' AND '.join(conditions) if conditions else 'true'
+
+    cur.execute(f"""
+        WITH owner_rates AS ({_OWNER_RATES}),
+        base AS (
+            SELECT b.id,
+                   COALESCE(b.total_amount, 0) AS total,
+                   COALESCE(b.aggregator_commission, 0) AS aggregator_rate,
+                   COALESCE(r.commission_rate, %s::numeric) AS management_rate,
+                   COALESCE(
+                       NULLIF(COALESCE(b.maid, 0) + COALESCE(b.laundry, 0) + COALESCE(b.hygiene, 0)
+                              + COALESCE(b.transport, 0) + COALESCE(b.compliment, 0) + COALESCE(b.other, 0), 0),
+                       b.operating_expenses,
+                       %s::numeric
+                   ) AS expenses
+            FROM {BOOKINGS_TABLE} b
+            LEFT JOIN owner_rates r ON r.apartment_key = b.apartment_id
+            WHERE {where}
+        ),
+        calc AS (
+            SELECT base.id, base.expenses, t.tax, m.before_management,
+                   m.before_management * base.management_rate / 100 AS management,
+                   m.before_management * (1 - base.management_rate / 100) AS before_expenses
+            FROM base
+            CROSS JOIN LATERAL (SELECT (base.total - base.total * base.aggregator_rate / 100) * %s::numeric / 100 AS tax) t
+            CROSS JOIN LATERAL (SELECT base.total - base.total * base.aggregator_rate / 100 - t.tax AS before_management) m
+        )
+        UPDATE {BOOKINGS_TABLE} b SET
+            tax_and_bank_commission = ROUND(calc.tax, 2),
+            remainder_before_management = ROUND(calc.before_management, 2),
+            management_commission = ROUND(calc.management, 2),
+            remainder_before_expenses = ROUND(calc.before_expenses, 2),
+            operating_expenses = ROUND(calc.expenses, 2),
+            owner_funds = GREATEST(0, ROUND(calc.before_expenses - calc.expenses, 2)),
+            updated_at = CURRENT_TIMESTAMP
+        FROM calc
+        WHERE b.id = calc.id
+          AND ({', '.join(f'b.{c}' for c in FINANCE_COLUMNS)}) IS DISTINCT FROM (
+              ROUND(calc.tax, 2), ROUND(calc.before_management, 2), ROUND(calc.management, 2),
+              ROUND(calc.before_expenses, 2), ROUND(calc.expenses, 2),
+              GREATEST(0, ROUND(calc.before_expenses - calc.expenses, 2))
+          )
+    """, [DEFAULT_MANAGEMENT_RATE, DEFAULT_OPERATING_EXPENSES, *values, TAX_AND_BANK_RATE])
+    return cur.rowcount
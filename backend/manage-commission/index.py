@@ -1,14 +1,17 @@
 import json
 import os
-import psycopg2
+from datetime import datetime
 from typing import Dict, Any
+from db_connection import get_connection
+from finances import recompute_finances
 
 # Force redeploy
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Manage owner commission rates for apartments
-    Args: event - dict with httpMethod, body (for PUT)
+    Business: Manage owner commission rates for apartments and recompute booking finances
+    Args: event - dict with httpMethod, body (PUT: apartment_id, commission_rate;
+          POST: apartment_id, date_from, date_to — all optional, recompute Bnovo bookings)
           context - object with request_id attribute
     Returns: HTTP response with owners list or update confirmation
     '''
@@ -19,7 +22,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, PUT, OPTIONS',
+                'Access-Control-Allow-Methods': 'GET, PUT, POST, OPTIONS',
                 'Access-Control-Allow-Headers': 'Content-Type',
                 'Access-Control-Max-Age': '86400'
             },
@@ -34,7 +37,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'DATABASE_URL not configured'})
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = get_connection(dsn)
     cur = conn.cursor()
     
     try:
@@ -94,6 +97,35 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 })
             }
         
+        elif method == 'POST':
+            body_data = json.loads(event.get('body') or '{}')
+            date_from = body_data.get('date_from')
+            date_to = body_data.get('date_to')
+            
+            for value in (date_from, date_to):
+                if value:
+                    try:
+                        datetime.strptime(value, '%Y-%m-%d')
+                    except (TypeError, ValueError):
+                        return {
+                            'statusCode': 400,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'date_from and date_to must be YYYY-MM-DD'})
+                        }
+            
+            # Все брони периода/апартамента пересчитываются одним UPDATE по текущим ставкам
+            updated = recompute_finances(
+                cur, apartment_id=body_data.get('apartment_id'), date_from=date_from, date_to=date_to
+            )
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True, 'updated': updated})
+            }
+        
         else:
             return {
                 'statusCode': 405,
@@ -1,8 +1,8 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
 from datetime import datetime
+from db_connection import get_connection
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -32,7 +32,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'DATABASE_URL not configured'})
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = get_connection(dsn)
     cursor = conn.cursor()
     
     try:
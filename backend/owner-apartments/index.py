@@ -1,16 +1,18 @@
 import json
 import os
 from typing import Dict, Any
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db_connection import get_connection
+from owner_analytics import month_range, owner_analytics
 
 # Force redeploy
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Получение списка квартир собственника
-    Args: event - httpMethod (GET/OPTIONS), queryStringParameters с ownerId
-    Returns: HTTP response со списком квартир
+    Args: event - httpMethod (GET/OPTIONS), queryStringParameters с ownerId;
+          view=analytics (month_from, month_to — YYYY-MM) — метрики квартир по месяцам
+    Returns: HTTP response со списком квартир (и аналитикой)
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -28,6 +30,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     params = event.get('queryStringParameters', {}) or {}
     owner_id = params.get('ownerId', '')
+    analytics = params.get('view') == 'analytics'
     
     if not owner_id:
         return {
@@ -37,8 +40,19 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'success': False, 'message': 'Owner ID required'})
         }
     
+    if analytics:
+        try:
+            period = month_range(params.get('month_from'), params.get('month_to'))
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': False, 'message': str(e)})
+            }
+    
     db_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(db_url, options="-c search_path=t_p9202093_hotel_design_site")
+    conn = get_connection(db_url, options="-c search_path=t_p9202093_hotel_design_site")
     
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
@@ -63,17 +77,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
            ORDER BY apartment_id"""
         cursor.execute(sql)
         apartments = cursor.fetchall()
+        
+        response = {
+            'success': True,
+            'ownerName': owner['name'],
+            'apartments': [{'apartment_id': a['apartment_id'], 'name': a['name']} for a in apartments]
+        }
+        
+        # Весь дашборд одним запросом: метрики считаются в БД, прошлые месяцы — из кэша
+        if analytics:
+            response['months'] = owner_analytics(cursor, [a['apartment_id'] for a in apartments], *period)
+            conn.commit()
         cursor.close()
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'isBase64Encoded': False,
-            'body': json.dumps({
-                'success': True,
-                'ownerName': owner['name'],
-                'apartments': [{'apartment_id': a['apartment_id'], 'name': a['name']} for a in apartments]
-            })
+            'body': json.dumps(response)
         }
     finally:
         conn.close()
\ No newline at end of file
@@ -2,8 +2,8 @@ import json
 import os
 import hashlib
 from typing import Dict, Any
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db_connection import get_connection
 
 # Force redeploy
 
@@ -48,7 +48,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     action = body_data.get('action', 'login')
     
     db_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(db_url, options="-c search_path=t_p9202093_hotel_design_site")
+    conn = get_connection(db_url, options="-c search_path=t_p9202093_hotel_design_site")
     
     try:
         if action == 'register':
@@ -1,7 +1,19 @@
 import json
 import os
-import psycopg2
+import psycopg2.errors
+from datetime import datetime
 from typing import Dict, Any
+from bookings_db import REPORT_FIELDS, columns_for, delete_booking, insert_booking, list_bookings, monthly_rollups, report_values, serialize, update_booking
+from db_connection import get_connection
+from export_file import EXPORT_FORMATS, export_response, stream_query
+
+# Колонки legacy-отчёта в CSV — в порядке SELECT
+LEGACY_EXPORT_COLUMNS = [
+    'id', 'apartment_number', 'check_in_date', 'check_out_date', 'booking_sum', 'total_sum', 'commission_percent',
+    'usn_percent', 'commission_before_usn', 'commission_after_usn', 'remaining_before_expenses',
+    'expenses_on_operations', 'average_cleaning', 'owner_payment', 'payment_date', 'hot_water', 'chemical_cleaning',
+    'hygiene_ср_ва', 'transportation', 'utilities', 'other', 'note_to_billing', 'created_at'
+]
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -39,7 +51,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     try:
-        conn = psycopg2.connect(dsn)
+        conn = get_connection(dsn)
         cur = conn.cursor()
         
         # Handle bookings API (new system)
@@ -81,56 +93,28 @@ def handle_bookings_api(method: str, params: Dict, event: Dict, cur, conn) -> Di
                     'isBase64Encoded': False
                 }
             
-            cur.execute('''
-                SELECT 
-                    id, apartment_id, check_in, check_out, early_check_in, late_check_out,
-                    parking, accommodation_amount, total_amount, aggregator_commission,
-                    tax_and_bank_commission, remainder_before_management, management_commission,
-                    remainder_before_expenses, operating_expenses, owner_funds, payment_to_owner,
-                    payment_date, maid, laundry, hygiene, transport, compliment, other,
-                    other_note, guest_name, guest_email, guest_phone, show_to_guest,
-                    payment_status, payment_completed_at, created_at, updated_at
-                FROM bookings 
-                WHERE apartment_id = %s 
-                ORDER BY check_in DESC
-            ''', (apartment_id,))
+            # Помесячные итоги из booking_monthly_rollups — без чтения броней
+            if params.get('view') == 'monthly':
+                try:
+                    months = monthly_rollups(cur, [apartment_id], params.get('month_from'), params.get('month_to'))
+                except ValueError:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'month_from and month_to must be YYYY-MM'}),
+                        'isBase64Encoded': False
+                    }
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'months': months}),
+                    'isBase64Encoded': False
+                }
             
-            rows = cur.fetchall()
-            bookings = []
-            for row in rows:
-                bookings.append({
-                    'id': row[0],
-                    'apartmentId': row[1],
-                    'checkIn': str(row[2]),
-                    'checkOut': str(row[3]),
-                    'earlyCheckIn': float(row[4]) if row[4] else 0,
-                    'lateCheckOut': float(row[5]) if row[5] else 0,
-                    'parking': float(row[6]) if row[6] else 0,
-                    'accommodationAmount': float(row[7]) if row[7] else 0,
-                    'totalAmount': float(row[8]) if row[8] else 0,
-                    'aggregatorCommission': float(row[9]) if row[9] else 0,
-                    'taxAndBankCommission': float(row[10]) if row[10] else 0,
-                    'remainderBeforeManagement': float(row[11]) if row[11] else 0,
-                    'managementCommission': float(row[12]) if row[12] else 0,
-                    'remainderBeforeExpenses': float(row[13]) if row[13] else 0,
-                    'operatingExpenses': float(row[14]) if row[14] else 0,
-                    'ownerFunds': float(row[15]) if row[15] else 0,
-                    'paymentToOwner': float(row[16]) if row[16] else 0,
-                    'paymentDate': str(row[17]) if row[17] else '',
-                    'maid': float(row[18]) if row[18] else 0,
-                    'laundry': float(row[19]) if row[19] else 0,
-                    'hygiene': float(row[20]) if row[20] else 0,
-                    'transport': float(row[21]) if row[21] else 0,
-                    'compliment': float(row[22]) if row[22] else 0,
-                    'other': float(row[23]) if row[23] else 0,
-                    'otherNote': row[24] or '',
-                    'guestName': row[25] or '',
-                    'guestEmail': row[26] or '',
-                    'guestPhone': row[27] or '',
-                    'showToGuest': row[28] or False,
-                    'paymentStatus': row[29] or 'pending',
-                    'paymentCompletedAt': str(row[30]) if row[30] else None
-                })
+            rows, _ = list_bookings(
+                cur, columns_for(REPORT_FIELDS, REPORT_FIELDS), ['apartment_id = %s'], [apartment_id]
+            )
+            bookings = serialize(rows, REPORT_FIELDS, list(REPORT_FIELDS))
             
             return {
                 'statusCode': 200,
@@ -142,32 +126,11 @@ def handle_bookings_api(method: str, params: Dict, event: Dict, cur, conn) -> Di
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
             
-            cur.execute('''
-            INSERT INTO bookings (
-                id, apartment_id, check_in, check_out, early_check_in, late_check_out,
-                parking, accommodation_amount, total_amount, aggregator_commission,
-                tax_and_bank_commission, remainder_before_management, management_commission,
-                remainder_before_expenses, operating_expenses, owner_funds, payment_to_owner,
-                payment_date, maid, laundry, hygiene, transport, compliment, other,
-                other_note, guest_name, guest_email, guest_phone, show_to_guest,
-                payment_status, payment_completed_at
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-            )
-            ''', (
-                body_data['id'], body_data['apartmentId'], body_data['checkIn'], body_data['checkOut'],
-                body_data.get('earlyCheckIn', 0), body_data.get('lateCheckOut', 0),
-                body_data.get('parking', 0), body_data['accommodationAmount'], body_data['totalAmount'],
-                body_data.get('aggregatorCommission', 0), body_data.get('taxAndBankCommission', 0),
-                body_data.get('remainderBeforeManagement', 0), body_data.get('managementCommission', 0),
-                body_data.get('remainderBeforeExpenses', 0), body_data.get('operatingExpenses', 0),
-                body_data.get('ownerFunds', 0), body_data.get('paymentToOwner', 0),
-                body_data.get('paymentDate') or None, body_data.get('maid', 0), body_data.get('laundry', 0),
-                body_data.get('hygiene', 0), body_data.get('transport', 0), body_data.get('compliment', 0),
-                body_data.get('other', 0), body_data.get('otherNote', ''), body_data.get('guestName', ''),
-                body_data.get('guestEmail', ''), body_data.get('guestPhone', ''), body_data.get('showToGuest', False),
-                body_data.get('paymentStatus', 'pending'), body_data.get('paymentCompletedAt') or None
-            ))
+            insert_booking(cur, {
+                'id': body_data['id'],
+                'apartment_id': body_data['apartmentId'],
+                **report_values(body_data)
+            })
             
             conn.commit()
             
@@ -192,31 +155,7 @@ def handle_bookings_api(method: str, params: Dict, event: Dict, cur, conn) -> Di
                     'isBase64Encoded': False
                 }
             
-            cur.execute('''
-                UPDATE bookings SET
-                    check_in = %s, check_out = %s, early_check_in = %s, late_check_out = %s,
-                    parking = %s, accommodation_amount = %s, total_amount = %s, aggregator_commission = %s,
-                    tax_and_bank_commission = %s, remainder_before_management = %s, management_commission = %s,
-                    remainder_before_expenses = %s, operating_expenses = %s, owner_funds = %s, payment_to_owner = %s,
-                    payment_date = %s, maid = %s, laundry = %s, hygiene = %s, transport = %s, compliment = %s,
-                    other = %s, other_note = %s, guest_name = %s, guest_email = %s, guest_phone = %s,
-                    show_to_guest = %s, payment_status = %s, payment_completed_at = %s, updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s AND apartment_id = %s
-            ''', (
-                body_data['checkIn'], body_data['checkOut'], body_data.get('earlyCheckIn', 0),
-                body_data.get('lateCheckOut', 0), body_data.get('parking', 0), body_data['accommodationAmount'],
-                body_data['totalAmount'], body_data.get('aggregatorCommission', 0),
-                body_data.get('taxAndBankCommission', 0), body_data.get('remainderBeforeManagement', 0),
-                body_data.get('managementCommission', 0), body_data.get('remainderBeforeExpenses', 0),
-                body_data.get('operatingExpenses', 0), body_data.get('ownerFunds', 0),
-                body_data.get('paymentToOwner', 0), body_data.get('paymentDate') or None,
-                body_data.get('maid', 0), body_data.get('laundry', 0), body_data.get('hygiene', 0),
-                body_data.get('transport', 0), body_data.get('compliment', 0), body_data.get('other', 0),
-                body_data.get('otherNote', ''), body_data.get('guestName', ''), body_data.get('guestEmail', ''),
-                body_data.get('guestPhone', ''), body_data.get('showToGuest', False),
-                body_data.get('paymentStatus', 'pending'), body_data.get('paymentCompletedAt') or None,
-                body_data['id'], body_data['apartmentId']
-            ))
+            update_booking(cur, body_data['id'], report_values(body_data), apartment_id=body_data['apartmentId'])
             
             conn.commit()
             
@@ -239,8 +178,7 @@ def handle_bookings_api(method: str, params: Dict, event: Dict, cur, conn) -> Di
                     'isBase64Encoded': False
                 }
             
-            cur.execute('DELETE FROM availability_calendar WHERE booking_id = %s', (booking_id,))
-            cur.execute('DELETE FROM bookings WHERE id = %s AND apartment_id = %s', (booking_id, apartment_id))
+            delete_booking(cur, booking_id, apartment_id)
             conn.commit()
             
             return {
@@ -256,6 +194,15 @@ def handle_bookings_api(method: str, params: Dict, event: Dict, cur, conn) -> Di
             'body': json.dumps({'error': 'Method not allowed'}),
             'isBase64Encoded': False
         }
+    except psycopg2.errors.ExclusionViolation:
+        # bookings_no_overlap (V0096): даты пересекаются с другой активной бронью апартамента
+        conn.rollback()
+        return {
+            'statusCode': 409,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Dates are already booked'}),
+            'isBase64Encoded': False
+        }
     except Exception as e:
         print(f'Error in handle_bookings_api: {str(e)}')
         import traceback
@@ -395,7 +342,7 @@ def handle_legacy_reports(method: str, event: Dict, cur, conn) -> Dict[str, Any]
             FROM owner_reports
             ORDER BY check_in_date DESC
         '''
-        cur.execute(query)
+        query_values = ()
     elif user_apartments:
         query = '''
             SELECT 
@@ -411,7 +358,7 @@ def handle_legacy_reports(method: str, event: Dict, cur, conn) -> Dict[str, Any]
             WHERE apartment_number = ANY(%s)
             ORDER BY check_in_date DESC
         '''
-        cur.execute(query, (user_apartments,))
+        query_values = (user_apartments,)
     else:
         cur.close()
         conn.close()
@@ -425,6 +372,22 @@ def handle_legacy_reports(method: str, event: Dict, cur, conn) -> Dict[str, Any]
             'body': json.dumps({'reports': []})
         }
     
+    # format=csv|xlsx — вся история файлом: серверный курсор порциями, без списка отчётов в памяти
+    query_string = event.get('queryStringParameters', {}) or {}
+    export_format = query_string.get('format')
+    if export_format in EXPORT_FORMATS:
+        write_file, content_type = EXPORT_FORMATS[export_format]
+        report_file = write_file(
+            stream_query(conn, query, query_values, 'owner_reports_export'), LEGACY_EXPORT_COLUMNS,
+            lambda row: [row[column] for column in LEGACY_EXPORT_COLUMNS]
+        )
+        cur.close()
+        conn.close()
+        return export_response(
+            report_file, f"owner-reports-{datetime.now().strftime('%Y-%m-%d')}.{export_format}", content_type
+        )
+    
+    cur.execute(query, query_values)
     rows = cur.fetchall()
     
     reports = []
@@ -15,8 +15,8 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import Dict, Any
 from datetime import datetime, timedelta
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db_connection import get_connection
 
 def hash_password(password: str) -> str:
     """Hash password using SHA256"""
@@ -31,7 +31,7 @@ def get_db_connection():
     dsn = os.environ.get('DATABASE_URL')
     if not dsn:
         raise ValueError('DATABASE_URL not set')
-    return psycopg2.connect(dsn)
+    return get_connection(dsn)
 
 def send_reset_email(email: str, token: str) -> bool:
     """Send password reset email"""
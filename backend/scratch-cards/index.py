@@ -5,6 +5,8 @@ import psycopg2.extras
 from datetime import datetime
 import random
 from typing import Dict, Any, List
+from db_connection import get_connection
+from prepared import execute_prepared
 
 # Force redeploy
 
@@ -55,7 +57,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Database configuration error'})
         }
     
-    conn = psycopg2.connect(database_url)
+    conn = get_connection(database_url)
     conn.set_session(autocommit=False)
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
@@ -87,14 +89,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         if booking_id:
-            # Escape single quotes in booking_id by doubling them
-            booking_id_escaped = booking_id.replace("'", "''")
-            
-            cur.execute(f"""
+            execute_prepared(cur, """
                 SELECT id, bonus_points, is_scratched, scratched_at
                 FROM t_p9202093_hotel_design_site.scratch_cards
-                WHERE guest_id = {guest_id_int} AND booking_id = '{booking_id_escaped}'
-                """)
+                WHERE guest_id = %s AND booking_id = %s
+                """, (guest_id_int, booking_id))
             
             card = cur.fetchone()
             
@@ -124,12 +123,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 })
             }
         
-        cur.execute(f"""
+        execute_prepared(cur, """
             SELECT id, booking_id, bonus_points, is_scratched, scratched_at, created_at
             FROM t_p9202093_hotel_design_site.scratch_cards
-            WHERE guest_id = {guest_id_int}
+            WHERE guest_id = %s
             ORDER BY created_at DESC
-            """)
+            """, (guest_id_int,))
         
         cards = cur.fetchall()
         
@@ -187,10 +186,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'guest_id must be a valid integer'})
                 }
             
-            # Escape single quotes in booking_id by doubling them
-            booking_id_escaped = booking_id.replace("'", "''")
-            
-            cur.execute(f"SELECT id FROM t_p9202093_hotel_design_site.scratch_cards WHERE booking_id = '{booking_id_escaped}'")
+            cur.execute("SELECT id FROM t_p9202093_hotel_design_site.scratch_cards WHERE booking_id = %s", (booking_id,))
             
             existing = cur.fetchone()
             
@@ -207,12 +203,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             cards_data = generate_scratch_cards(booking_id)
             chosen_card = random.choice(cards_data)
             
-            cur.execute(f"""
+            cur.execute("""
                 INSERT INTO t_p9202093_hotel_design_site.scratch_cards
                 (guest_id, booking_id, bonus_points)
-                VALUES ({guest_id_int}, '{booking_id_escaped}', {chosen_card['bonus_points']})
+                VALUES (%s, %s, %s)
                 RETURNING id
-                """)
+                """, (guest_id_int, booking_id, chosen_card['bonus_points']))
             
             card_id = cur.fetchone()['id']
             
@@ -257,14 +253,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'guest_id and booking_id are required'})
                 }
             
-            # Escape single quotes in booking_id by doubling them
-            booking_id_escaped = booking_id.replace("'", "''")
-            
-            cur.execute(f"""
+            cur.execute("""
                 SELECT id, bonus_points, is_scratched
                 FROM t_p9202093_hotel_design_site.scratch_cards
-                WHERE guest_id = {guest_id_int} AND booking_id = '{booking_id_escaped}'
-                """)
+                WHERE guest_id = %s AND booking_id = %s
+                """, (guest_id_int, booking_id))
             
             card = cur.fetchone()
             
@@ -294,24 +287,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             # Get current timestamp for scratched_at
             scratched_at = datetime.now().isoformat()
             
-            cur.execute(f"""
+            cur.execute("""
                 UPDATE t_p9202093_hotel_design_site.scratch_cards
-                SET is_scratched = true, scratched_at = '{scratched_at}'
-                WHERE id = '{card_id}'
-                """)
+                SET is_scratched = true, scratched_at = %s
+                WHERE id = %s
+                """, (scratched_at, card_id))
             
             if bonus_points > 0:
-                cur.execute(f"""
+                cur.execute("""
                     UPDATE t_p9202093_hotel_design_site.guests
-                    SET bonus_points = bonus_points + {bonus_points}
-                    WHERE id = {guest_id_int}
+                    SET bonus_points = bonus_points + %s
+                    WHERE id = %s
                     RETURNING bonus_points
-                    """)
+                    """, (bonus_points, guest_id_int))
                 
                 updated_guest = cur.fetchone()
                 new_total = updated_guest['bonus_points'] if updated_guest else bonus_points
             else:
-                cur.execute(f"SELECT bonus_points FROM t_p9202093_hotel_design_site.guests WHERE id = {guest_id_int}")
+                cur.execute("SELECT bonus_points FROM t_p9202093_hotel_design_site.guests WHERE id = %s", (guest_id_int,))
                 guest_data = cur.fetchone()
                 new_total = guest_data['bonus_points'] if guest_data else 0
             
@@ -0,0 +1,123 @@
+import json
+import os
+from datetime import datetime
+from typing import Dict, Any, Optional
+from booked_ranges import search_free_rooms
+
+# Максимальная длина проживания в одном поиске
+MAX_STAY_NIGHTS = 90
+
+def parse_price(value: Any) -> Optional[float]:
+    if value in (None, ''):
+        return None
+    return float(value)
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Поиск апартаментов, свободных на весь период проживания, с итоговой ценой
+    Args: event - dict с httpMethod, queryStringParameters (check_in, check_out, guests, min_price, max_price)
+          context - объект с атрибутами request_id
+    Returns: HTTP response со списком свободных апартаментов
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+    
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'})
+        }
+    
+    params = event.get('queryStringParameters', {}) or {}
+    try:
+        check_in = datetime.strptime(params.get('check_in', ''), '%Y-%m-%d').date()
+        check_out = datetime.strptime(params.get('check_out', ''), '%Y-%m-%d').date()
+        guests = int(params.get('guests') or 1)
+        # Границы цены — за ночь (в среднем по периоду)
+        min_price = parse_price(params.get('min_price'))
+        max_price = parse_price(params.get('max_price'))
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'check_in and check_out (YYYY-MM-DD) are required; guests, min_price, max_price must be numbers'})
+        }
+    
+    nights = (check_out - check_in).days
+    if nights <= 0 or nights > MAX_STAY_NIGHTS or guests < 1:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'check_out must be 1..{MAX_STAY_NIGHTS} nights after check_in, guests >= 1'})
+        }
+    
+    try:
+        import psycopg2
+        import psycopg2.extras
+        from db_connection import get_connection
+        
+        dsn = os.environ.get('DATABASE_URL')
+        if not dsn:
+            return {
+                'statusCode': 500,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Database not configured'})
+            }
+        
+        conn = get_connection(dsn)
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        
+        # Свободные комнаты и цена проживания считаются одним запросом в БД
+        rooms = search_free_rooms(cur, check_in, check_out, guests, min_price, max_price)
+        
+        cur.close()
+        conn.close()
+        
+        apartments = []
+        for room in rooms:
+            # Если у части ночей нет ни тарифа, ни базовой цены, итог неизвестен
+            total_price = float(room['total_price']) if room['total_price'] is not None and not room['unpriced_nights'] else None
+            apartments.append({
+                'id': room['room_id'],
+                'name': room['bnovo_name'] or room['number'],
+                'number': room['number'],
+                'max_guests': room['max_guests'] or 2,
+                'bedrooms': room['bedrooms'] or 1,
+                'bathrooms': room['bathrooms'] or 1,
+                'nights': room['nights'],
+                'total_price': total_price,
+                'price_per_night': round(total_price / room['nights'], 2) if total_price is not None else None
+            })
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({
+                'apartments': apartments,
+                'total': len(apartments),
+                'check_in': check_in.isoformat(),
+                'check_out': check_out.isoformat(),
+                'nights': nights,
+                'guests': guests
+            }, ensure_ascii=False)
+        }
+        
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)})
+        }
@@ -1,12 +1,14 @@
 import json
 import os
 from typing import Dict, Any
-import urllib.request
-import urllib.parse
 from datetime import datetime, timedelta
+from bnovo_client import BnovoAuthError, enable_db_token_store, fetch_rates, get_metrics, get_token, reset_metrics
 
 # Force redeploy
 
+# Строк в одном INSERT ... ON CONFLICT
+RATES_BATCH_SIZE = 5000
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Синхронизация тарифов и доступности из Bnovo в availability_calendar
@@ -31,10 +33,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     try:
         import psycopg2
         import psycopg2.extras
+        from db_connection import get_connection
         
         database_url = os.environ.get('DATABASE_URL', '')
-        account_id = os.environ.get('BNOVO_ACCOUNT_ID', '')
-        password = os.environ.get('BNOVO_PASSWORD', '')
         
         if not database_url:
             return {
@@ -43,35 +44,20 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'DATABASE_URL not configured'})
             }
         
-        auth_url = 'https://api.pms.bnovo.ru/api/v1/auth'
-        auth_payload = {
-            'id': int(account_id),
-            'password': password
-        }
-        
-        auth_request = urllib.request.Request(
-            auth_url,
-            data=json.dumps(auth_payload).encode('utf-8'),
-            headers={
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
-            },
-            method='POST'
-        )
+        reset_metrics()
         
-        with urllib.request.urlopen(auth_request, timeout=30) as auth_response:
-            auth_data = json.loads(auth_response.read().decode())
-        
-        jwt_token = auth_data.get('data', {}).get('access_token')
-        
-        if not jwt_token:
+        # Токен Bnovo берётся из кэша (память процесса / bnovo_auth_tokens), /auth — только по истечении
+        enable_db_token_store(database_url)
+        try:
+            get_token()
+        except BnovoAuthError as e:
             return {
                 'statusCode': 500,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Failed to get Bnovo token'})
+                'body': json.dumps({'error': str(e)})
             }
         
-        conn = psycopg2.connect(database_url)
+        conn = get_connection(database_url)
         conn.autocommit = False
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
@@ -82,56 +68,43 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         date_from = datetime.now().date()
         date_to = date_from + timedelta(days=365)
         
-        for room in rooms:
-            room_id = room['id']
-            bnovo_room_id = room['bnovo_id']
-            
-            params = urllib.parse.urlencode({
-                'room_id': bnovo_room_id,
-                'date_from': date_from.isoformat(),
-                'date_to': date_to.isoformat()
-            })
-            rates_url = f'https://api.pms.bnovo.ru/api/v1/rates?{params}'
-            
-            rates_request = urllib.request.Request(
-                rates_url,
-                headers={
-                    'Authorization': f'Bearer {jwt_token}',
-                    'Accept': 'application/json'
-                }
-            )
-            
-            try:
-                with urllib.request.urlopen(rates_request, timeout=30) as response:
-                    rates_data = json.loads(response.read().decode())
-                
-                rates_list = rates_data.get('data', {}).get('rates', [])
-                
-                for rate in rates_list:
-                    rate_date = rate.get('date')
-                    price = rate.get('price', 0)
-                    available = rate.get('available', True)
-                    min_days = rate.get('min_days', 1)
-                    
-                    if rate_date:
-                        cur.execute("""
-                            INSERT INTO t_p9202093_hotel_design_site.availability_calendar 
-                            (room_id, date, is_available, price)
-                            VALUES (%s, %s, %s, %s)
-                            ON CONFLICT (room_id, date) 
-                            DO UPDATE SET 
-                                price = EXCLUDED.price,
-                                is_available = CASE 
-                                    WHEN t_p9202093_hotel_design_site.availability_calendar.booking_id IS NOT NULL 
-                                    THEN false 
-                                    ELSE EXCLUDED.is_available 
-                                END
-                        """, (room_id, rate_date, available, price))
-                        total_synced += 1
-                
-            except Exception as e:
-                print(f"Error fetching rates for room {bnovo_room_id}: {e}")
+        # Тарифы всех комнат качаются параллельно, запись — пакетными upsert'ами
+        room_by_bnovo_id = {room['bnovo_id']: room['id'] for room in rooms}
+        rates_by_room = fetch_rates(list(room_by_bnovo_id.keys()), date_from, date_to)
+        
+        rate_rows = {}
+        rooms_failed = 0
+        for bnovo_room_id, rates_list in rates_by_room.items():
+            if isinstance(rates_list, Exception):
+                print(f"Error fetching rates for room {bnovo_room_id}: {rates_list}")
+                rooms_failed += 1
                 continue
+            
+            room_id = room_by_bnovo_id[bnovo_room_id]
+            for rate in rates_list:
+                rate_date = rate.get('date')
+                if rate_date:
+                    # Одна строка на (комнату, дату): повтор в одном INSERT ... ON CONFLICT недопустим
+                    rate_rows[(room_id, rate_date)] = (
+                        room_id, rate_date, rate.get('available', True), rate.get('price', 0)
+                    )
+        
+        rows = list(rate_rows.values())
+        for i in range(0, len(rows), RATES_BATCH_SIZE):
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO t_p9202093_hotel_design_site.availability_calendar 
+                (room_id, date, is_available, price)
+                VALUES %s
+                ON CONFLICT (room_id, date) 
+                DO UPDATE SET 
+                    price = EXCLUDED.price,
+                    is_available = CASE 
+                        WHEN t_p9202093_hotel_design_site.availability_calendar.booking_id IS NOT NULL 
+                        THEN false 
+                        ELSE EXCLUDED.is_available 
+                    END
+            """, rows[i:i + RATES_BATCH_SIZE], page_size=RATES_BATCH_SIZE)
+        total_synced = len(rows)
         
         conn.commit()
         cur.close()
@@ -143,7 +116,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({
                 'success': True,
                 'synced_dates': total_synced,
-                'rooms_processed': len(rooms)
+                'rooms_processed': len(rooms),
+                'rooms_failed': rooms_failed,
+                'bnovo_http': get_metrics()
             }, ensure_ascii=False)
         }
         
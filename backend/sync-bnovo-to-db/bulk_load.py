@@ -0,0 +1,39 @@
+# Копия backend/_shared/bulk_load.py. Не редактировать: правьте оригинал и запустите python3 scripts/vendor_shared.py
+import io
+from datetime import date, datetime
+from typing import Any, Iterable, Sequence
+
+def _copy_value(value: Any) -> str:
+    '''Значение в текстовом формате COPY: NULL как \\N, экранирование служебных символов'''
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    text = str(value)
+    return (text.replace('\\', '\\\\')
+                .replace('\t', '\\t')
+                .replace('\n', '\\n')
+                .replace('\r', '\\r'))
+
+def create_staging_like(cur, staging: str, target: str, columns: Sequence[str]) -> None:
+    '''Временная таблица с типами колонок целевой таблицы; удаляется при commit'''
+    cur.execute(f"""
+        CREATE TEMP TABLE {staging} ON COMMIT DROP AS
+        SELECT {', '.join(columns)} FROM {target} WITH NO DATA
+    """)
+
+def copy_rows(cur, table: str, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> int:
+    '''Потоковая загрузка строк одним COPY FROM STDIN; возвращает число строк'''
+    buffer = io.StringIO()
+    count = 0
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(v) for v in row))
+        buffer.write('\n')
+        count += 1
+    if not count:
+        return 0
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+    return count
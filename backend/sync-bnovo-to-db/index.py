@@ -5,39 +5,19 @@ import secrets
 import string
 from typing import Dict, Any, Tuple
 from datetime import datetime, timedelta
-import requests
+from bnovo_client import BnovoAuthError, enable_db_token_store, fetch_bookings, get_metrics, get_token, reset_metrics
+from booked_ranges import write_booked_ranges
+from bulk_load import create_staging_like, copy_rows
+from finances import DEFAULT_AGGREGATOR_RATE, recompute_finances
+from sync_lock import SyncLock, wait_seconds_from
 
-def calculate_booking_finances(apartment_id: str, total_amount: float) -> dict:
-    '''Расчёт финансовых показателей бронирования для инвестора'''
-    
-    # Используем стандартную ставку 20% (можно расширить логику позже)
-    management_commission_rate = 20.0
-    
-    # Расчёт показателей
-    aggregator_commission_rate = 25.0
-    aggregator_commission = total_amount * (aggregator_commission_rate / 100)
-    
-    # Налог и банковская комиссия (7% от суммы после комиссии агрегатора)
-    tax_rate = 7.0
-    tax_and_bank = (total_amount - aggregator_commission) * (tax_rate / 100)
-    
-    remainder_before_management = total_amount - aggregator_commission - tax_and_bank
-    management_commission = remainder_before_management * (management_commission_rate / 100)
-    remainder_before_expenses = remainder_before_management - management_commission
-    
-    # Операционные расходы по умолчанию
-    operating_expenses = 3500.0
-    owner_funds = max(0, remainder_before_expenses - operating_expenses)
-    
-    return {
-        'aggregator_commission': round(aggregator_commission_rate, 2),
-        'tax_and_bank_commission': round(tax_and_bank, 2),
-        'remainder_before_management': round(remainder_before_management, 2),
-        'management_commission': round(management_commission, 2),
-        'remainder_before_expenses': round(remainder_before_expenses, 2),
-        'operating_expenses': round(operating_expenses, 2),
-        'owner_funds': round(owner_funds, 2)
-    }
+BOOKING_COLUMNS = (
+    'id', 'bnovo_id', 'apartment_id', 'check_in', 'check_out', 'guest_name', 'guest_email',
+    'guest_phone', 'guests_count', 'accommodation_amount', 'total_amount',
+    'aggregator_commission', 'tax_and_bank_commission', 'remainder_before_management',
+    'management_commission', 'remainder_before_expenses', 'operating_expenses', 'owner_funds',
+    'status', 'source', 'notes', 'show_to_guest'
+)
 
 def generate_password(length: int = 8) -> str:
     alphabet = string.ascii_letters + string.digits
@@ -109,9 +89,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': ''
         }
     
+    sync_lock = None
     try:
         import psycopg2
         import psycopg2.extras
+        from db_connection import get_connection
         
         # Получаем данные для подключения
         database_url = os.environ.get('DATABASE_URL', '')
@@ -134,108 +116,56 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'BNOVO credentials not configured'})
             }
         
-        # Авторизация в Bnovo
-        auth_url = 'https://api.pms.bnovo.ru/api/v1/auth'
-        auth_payload = {
-            'id': int(account_id),
-            'password': bnovo_password
-        }
-        
-        auth_response = requests.post(
-            auth_url,
-            json=auth_payload,
-            headers={
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
-            },
-            timeout=30
-        )
-        auth_response.raise_for_status()
-        auth_data = auth_response.json()
+        reset_metrics()
         
-        jwt_token = auth_data.get('data', {}).get('access_token')
-        
-        if not jwt_token:
+        # Токен Bnovo берётся из кэша (память процесса / bnovo_auth_tokens), /auth — только по истечении
+        enable_db_token_store(database_url)
+        try:
+            get_token()
+        except BnovoAuthError as e:
             return {
                 'statusCode': 500,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Failed to get Bnovo token'})
+                'body': json.dumps({'error': str(e)})
             }
         
-        # Получаем бронирования с пагинацией
+        # Single-flight: параллельный запуск не качает окно повторно и не пишет в те же календари
+        sync_lock = SyncLock(database_url, 'sync-bnovo-to-db')
+        if not sync_lock.acquire(wait_seconds_from(event)):
+            return {
+                'statusCode': 409,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({
+                    'success': False,
+                    'error': 'Bnovo sync is already running',
+                    **sync_lock.running_status()
+                })
+            }
+        if sync_lock.coalesced is not None:
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({**sync_lock.coalesced, 'coalesced': True}, ensure_ascii=False)
+            }
+        
+        # Получаем бронирования
         date_from = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
         date_to = (datetime.now() + timedelta(days=90)).strftime('%Y-%m-%d')
         
-        all_bookings = []
-        offset = 0
-        limit = 20
-        
-        while True:
-            params = {
-                'date_from': date_from,
-                'date_to': date_to,
-                'limit': limit,
-                'offset': offset
-            }
-            
-            bookings_response = requests.get(
-                'https://api.pms.bnovo.ru/api/v1/bookings',
-                params=params,
-                headers={
-                    'Authorization': f'Bearer {jwt_token}',
-                    'Accept': '*/*',
-                    'User-Agent': 'Mozilla/5.0'
-                },
-                timeout=30
-            )
-            
-            bookings_response.raise_for_status()
-            bookings_data = bookings_response.json()
-            
-            # Bnovo возвращает данные в формате {'data': {'bookings': [...]}} или {'bookings': [...]}
-            if isinstance(bookings_data, dict):
-                # Сначала проверяем data.bookings
-                if 'data' in bookings_data and isinstance(bookings_data['data'], dict):
-                    current_batch = bookings_data['data'].get('bookings', [])
-                else:
-                    # Если нет, то просто bookings
-                    current_batch = bookings_data.get('bookings', bookings_data.get('data', []))
-            else:
-                current_batch = bookings_data
-            
-            # Проверяем, что current_batch это список
-            if not isinstance(current_batch, list):
-                return {
-                    'statusCode': 500,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'error': 'Invalid bookings data format',
-                        'type': str(type(current_batch)),
-                        'raw_response': str(bookings_data)[:500]
-                    })
-                }
-            
-            if not current_batch:
-                break
-            
-            all_bookings.extend(current_batch)
-            
-            # Если получили меньше чем limit, значит это последняя страница
-            if len(current_batch) < limit:
-                break
-            
-            offset += limit
+        # Окно режется на отрезки, которые качаются параллельно; неполная выборка — ошибка
+        all_bookings = fetch_bookings(date_from, date_to)
         
         bookings_list = all_bookings
         
         # Подключаемся к базе данных
-        conn = psycopg2.connect(database_url)
+        conn = get_connection(database_url)
         conn.autocommit = False
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
         synced_bookings = 0
         synced_rooms = 0
         updated_calendar = 0
+        calendar_rows = 0
         created_guests = 0
         
         # Извлекаем уникальные room_id из бронирований и создаем комнаты
@@ -336,68 +266,67 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             booking_id = f"bnovo_{bnovo_booking_id}"
             total_amount = booking.get('amount', booking.get('total', 0))
             
-            # Расчёт финансов для инвестора
-            finances = calculate_booking_finances(room_id, total_amount)
-            
             bookings_to_insert.append((
                 booking_id, bnovo_booking_id, room_id, check_in, check_out,
                 guest_name, guest_email, guest_phone,
                 booking.get('guests', booking.get('guests_count', 1)),
                 booking.get('amount', booking.get('price', 0)),
                 total_amount,
-                finances['aggregator_commission'], finances['tax_and_bank_commission'],
-                finances['remainder_before_management'], finances['management_commission'],
-                finances['remainder_before_expenses'], finances['operating_expenses'],
-                finances['owner_funds'],
+                # Производные суммы досчитывает recompute_finances после вставки
+                DEFAULT_AGGREGATOR_RATE, None, None, None, None, None, None,
                 'confirmed', 'bnovo',
                 json.dumps(booking, ensure_ascii=False)[:500],
                 True
             ))
             
             if room_id:
-                calendar_updates.append((room_id, check_in, check_out, booking_id, booking.get('price', 0)))
+                calendar_updates.append((room_id, check_in, check_out, booking_id, bnovo_booking_id, guest_name))
         
-        # Batch insert бронирований
+        # Новые брони: COPY во временную таблицу и одна вставка в bookings.
+        # app.bnovo_sync до конца транзакции: только так бронь Bnovo поверх занятых дат
+        # помечается overbooked, а не падает на bookings_no_overlap (V0104)
         if bookings_to_insert:
-            psycopg2.extras.execute_batch(cur, """
-                INSERT INTO t_p9202093_hotel_design_site.bookings 
-                (id, bnovo_id, apartment_id, check_in, check_out, guest_name, guest_email, 
-                 guest_phone, guests_count, accommodation_amount, total_amount,
-                 aggregator_commission, tax_and_bank_commission, remainder_before_management,
-                 management_commission, remainder_before_expenses, operating_expenses, owner_funds,
-                 status, source, notes, show_to_guest)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            cur.execute("SELECT set_config('app.bnovo_sync', 'on', true)")
+            create_staging_like(cur, 'stage_bookings', 't_p9202093_hotel_design_site.bookings', BOOKING_COLUMNS)
+            copy_rows(cur, 'stage_bookings', BOOKING_COLUMNS, bookings_to_insert)
+            cur.execute(f"""
+                INSERT INTO t_p9202093_hotel_design_site.bookings ({', '.join(BOOKING_COLUMNS)})
+                SELECT {', '.join(BOOKING_COLUMNS)} FROM stage_bookings
                 ON CONFLICT (id) DO NOTHING
-            """, bookings_to_insert, page_size=100)
+            """)
             synced_bookings = len(bookings_to_insert)
+            # Финансы всех новых броней — одним UPDATE со ставкой управления из apartment_owners
+            recompute_finances(cur, booking_ids=[row[0] for row in bookings_to_insert])
         
-        # Batch update календаря
+        # Занятость: одна строка booked_ranges на новую бронь вместо разворота по ночам
         if calendar_updates:
-            for room_id, check_in, check_out, booking_id, price in calendar_updates:
-                cur.execute("""
-                    INSERT INTO t_p9202093_hotel_design_site.availability_calendar 
-                    (room_id, date, is_available, booking_id, price)
-                    SELECT %s, generate_series(%s::date, %s::date - interval '1 day', '1 day')::date, false, %s, %s
-                    ON CONFLICT (room_id, date) 
-                    DO UPDATE SET is_available = false, booking_id = EXCLUDED.booking_id
-                """, (room_id, check_in, check_out, booking_id, price))
+            range_changes = write_booked_ranges(cur, {
+                booking_id: (room_id, check_in, check_out, bnovo_booking_id, guest_name)
+                for room_id, check_in, check_out, booking_id, bnovo_booking_id, guest_name in calendar_updates
+            }, [])
+            calendar_rows = range_changes['upserted']
             updated_calendar = len(calendar_updates)
         
         conn.commit()
         cur.close()
         conn.close()
         
+        sync_result = {
+            'success': True,
+            'synced_bookings': synced_bookings,
+            'synced_rooms': synced_rooms,
+            'updated_calendar': updated_calendar,
+            'calendar_rows': calendar_rows,
+            'created_guests': created_guests,
+            'total_bookings_from_bnovo': len(bookings_list),
+            'bnovo_http': get_metrics()
+        }
+        sync_lock.record(sync_result)
+        
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'success': True,
-                'synced_bookings': synced_bookings,
-                'synced_rooms': synced_rooms,
-                'updated_calendar': updated_calendar,
-                'created_guests': created_guests,
-                'total_bookings_from_bnovo': len(bookings_list)
-            }, ensure_ascii=False)
+            'body': json.dumps(sync_result, ensure_ascii=False)
         }
     
     except Exception as e:
@@ -405,6 +334,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         error_trace = traceback.format_exc()
         print(f'ERROR in sync-bnovo-to-db: {type(e).__name__}: {str(e)}')
         print(f'Traceback:\n{error_trace}')
+        if sync_lock:
+            sync_lock.record({'success': False, 'error': str(e), 'error_type': type(e).__name__}, success=False)
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -414,4 +345,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'error_type': type(e).__name__,
                 'traceback': error_trace
             })
-        }
\ No newline at end of file
+        }
+    
+    finally:
+        if sync_lock:
+            sync_lock.release()
\ No newline at end of file
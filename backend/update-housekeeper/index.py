@@ -6,8 +6,8 @@ Returns: HTTP response с обновленной горничной
 
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from db_connection import get_connection
 
 # Force redeploy
 
@@ -55,7 +55,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Database connection not configured'})
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = get_connection(dsn)
     conn.autocommit = True
     cursor = conn.cursor()
     
@@ -0,0 +1,11 @@
+-- Водяные знаки инкрементальной синхронизации с Bnovo (одна строка на синхронизатор)
+CREATE TABLE IF NOT EXISTS t_p9202093_hotel_design_site.bnovo_sync_state (
+    sync_key VARCHAR(100) PRIMARY KEY,
+    last_modified_at TIMESTAMP,           -- максимальная дата изменения брони из Bnovo (UTC)
+    max_bnovo_id BIGINT,                  -- максимальный ID брони Bnovo в окне
+    window_from DATE,
+    window_to DATE,
+    last_full_sync_at TIMESTAMP,
+    last_success_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
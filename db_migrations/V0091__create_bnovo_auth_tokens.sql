@@ -0,0 +1,7 @@
+-- Кэш JWT-токена Bnovo между холодными стартами функций синхронизации
+CREATE TABLE IF NOT EXISTS t_p9202093_hotel_design_site.bnovo_auth_tokens (
+    account_id VARCHAR(50) PRIMARY KEY,
+    access_token TEXT NOT NULL,
+    expires_at TIMESTAMP NOT NULL,         -- UTC
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
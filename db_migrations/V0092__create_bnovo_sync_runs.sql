@@ -0,0 +1,15 @@
+-- Журнал запусков синхронизаций Bnovo под общей advisory-блокировкой:
+-- второй вызов отдаёт статус идущего запуска или дожидается его результата
+CREATE TABLE IF NOT EXISTS t_p9202093_hotel_design_site.bnovo_sync_runs (
+    id SERIAL PRIMARY KEY,
+    function_name VARCHAR(100) NOT NULL,  -- cron-sync-bnovo, sync-bnovo-to-db, bnovo-sync
+    status VARCHAR(20) NOT NULL DEFAULT 'running',  -- running, success, failed, abandoned
+    started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP,
+    result JSONB
+);
+
+CREATE INDEX IF NOT EXISTS idx_bnovo_sync_runs_function_finished
+    ON t_p9202093_hotel_design_site.bnovo_sync_runs(function_name, finished_at DESC);
+CREATE INDEX IF NOT EXISTS idx_bnovo_sync_runs_running
+    ON t_p9202093_hotel_design_site.bnovo_sync_runs(started_at DESC) WHERE status = 'running';
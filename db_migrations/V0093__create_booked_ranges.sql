@@ -0,0 +1,30 @@
+-- Занятость апартаментов интервалами вместо строки на каждую ночь:
+-- одна строка на бронь, stay = [заезд, выезд). Пересечения ищутся по GiST-индексу (room_id, stay).
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+CREATE TABLE IF NOT EXISTS t_p9202093_hotel_design_site.booked_ranges (
+    booking_id TEXT PRIMARY KEY REFERENCES t_p9202093_hotel_design_site.bookings(id) ON DELETE CASCADE,
+    room_id VARCHAR(50) NOT NULL REFERENCES t_p9202093_hotel_design_site.rooms(id),
+    stay DATERANGE NOT NULL CHECK (NOT isempty(stay) AND lower_inc(stay) AND NOT upper_inc(stay)),
+    bnovo_id BIGINT,
+    guest_name VARCHAR(255),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_booked_ranges_room_stay
+    ON t_p9202093_hotel_design_site.booked_ranges USING GIST (room_id, stay);
+
+-- Перенос занятых ночей из availability_calendar: брони непрерывны, поэтому [min, max + 1)
+INSERT INTO t_p9202093_hotel_design_site.booked_ranges (booking_id, room_id, stay, bnovo_id, guest_name)
+SELECT ac.booking_id, MIN(ac.room_id), daterange(MIN(ac.date), MAX(ac.date) + 1, '[)'),
+       MIN(b.bnovo_id), MIN(b.guest_name)
+FROM t_p9202093_hotel_design_site.availability_calendar ac
+JOIN t_p9202093_hotel_design_site.bookings b ON b.id = ac.booking_id
+WHERE ac.booking_id IS NOT NULL
+GROUP BY ac.booking_id
+ON CONFLICT (booking_id) DO NOTHING;
+
+-- Ночи броней в availability_calendar больше не ведутся: там остаются только тарифы и закрытые дни
+UPDATE t_p9202093_hotel_design_site.availability_calendar
+SET booking_id = NULL, is_available = true
+WHERE booking_id IS NOT NULL;
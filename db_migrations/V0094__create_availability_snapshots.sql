@@ -0,0 +1,53 @@
+-- Версия календаря: растёт при любой записи в таблицы, из которых собираются
+-- check-availability, apartment-availability и calendar-bnovo
+CREATE TABLE IF NOT EXISTS t_p9202093_hotel_design_site.calendar_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO t_p9202093_hotel_design_site.calendar_version (id, version)
+VALUES (1, 1)
+ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION t_p9202093_hotel_design_site.bump_calendar_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE t_p9202093_hotel_design_site.calendar_version
+    SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггеры уровня оператора: один подъём версии на INSERT/UPDATE/DELETE, а не на каждую строку
+DROP TRIGGER IF EXISTS trg_calendar_version ON t_p9202093_hotel_design_site.availability_calendar;
+CREATE TRIGGER trg_calendar_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p9202093_hotel_design_site.availability_calendar
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.bump_calendar_version();
+
+DROP TRIGGER IF EXISTS trg_calendar_version ON t_p9202093_hotel_design_site.booked_ranges;
+CREATE TRIGGER trg_calendar_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p9202093_hotel_design_site.booked_ranges
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.bump_calendar_version();
+
+DROP TRIGGER IF EXISTS trg_calendar_version ON t_p9202093_hotel_design_site.bookings;
+CREATE TRIGGER trg_calendar_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p9202093_hotel_design_site.bookings
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.bump_calendar_version();
+
+DROP TRIGGER IF EXISTS trg_calendar_version ON t_p9202093_hotel_design_site.rooms;
+CREATE TRIGGER trg_calendar_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p9202093_hotel_design_site.rooms
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.bump_calendar_version();
+
+-- Готовые тела ответов: одна строка на ключ запроса, только для актуальной версии
+CREATE TABLE IF NOT EXISTS t_p9202093_hotel_design_site.availability_snapshots (
+    cache_key TEXT PRIMARY KEY,
+    version BIGINT NOT NULL,
+    body TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_availability_snapshots_version
+    ON t_p9202093_hotel_design_site.availability_snapshots(version);
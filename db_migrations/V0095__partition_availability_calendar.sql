@@ -0,0 +1,141 @@
+-- availability_calendar секционируется по месяцам (RANGE по date): запросы окна
+-- check-availability, apartment-availability и calendar-bnovo затрагивают только секции своих месяцев.
+-- Секции ведёт maintain_calendar_partitions (функция cron-calendar-partitions):
+-- создаёт будущие месяцы заранее и отсоединяет старые в архивные таблицы.
+
+ALTER TABLE t_p9202093_hotel_design_site.availability_calendar RENAME TO availability_calendar_legacy;
+ALTER SEQUENCE t_p9202093_hotel_design_site.availability_calendar_id_seq RENAME TO availability_calendar_legacy_id_seq;
+ALTER TABLE t_p9202093_hotel_design_site.availability_calendar_legacy
+    RENAME CONSTRAINT availability_calendar_pkey TO availability_calendar_legacy_pkey;
+ALTER TABLE t_p9202093_hotel_design_site.availability_calendar_legacy
+    RENAME CONSTRAINT availability_calendar_room_id_date_key TO availability_calendar_legacy_room_id_date_key;
+DROP INDEX IF EXISTS t_p9202093_hotel_design_site.idx_calendar_room_date;
+DROP INDEX IF EXISTS t_p9202093_hotel_design_site.idx_calendar_available;
+DROP INDEX IF EXISTS t_p9202093_hotel_design_site.idx_availability_calendar_unique;
+
+-- Ключ секционирования входит в первичный и уникальный ключи; (room_id, date) по-прежнему
+-- цель ON CONFLICT у sync-bnovo-rates и индекс для всех запросов по комнате и датам
+CREATE TABLE t_p9202093_hotel_design_site.availability_calendar (
+    id SERIAL,
+    room_id VARCHAR(50) REFERENCES t_p9202093_hotel_design_site.rooms(id),
+    date DATE NOT NULL,
+    is_available BOOLEAN DEFAULT TRUE,
+    booking_id TEXT REFERENCES t_p9202093_hotel_design_site.bookings(id),
+    price DECIMAL(10, 2),
+    PRIMARY KEY (id, date),
+    UNIQUE (room_id, date)
+) PARTITION BY RANGE (date);
+
+-- Даты вне созданных секций не теряются, а попадают сюда; create_calendar_partition их переносит
+CREATE TABLE t_p9202093_hotel_design_site.availability_calendar_default
+    PARTITION OF t_p9202093_hotel_design_site.availability_calendar DEFAULT;
+
+CREATE OR REPLACE FUNCTION t_p9202093_hotel_design_site.create_calendar_partition(p_month DATE)
+RETURNS TEXT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_month)::date;
+    month_end DATE := (date_trunc('month', p_month) + interval '1 month')::date;
+    part_name TEXT := 'availability_calendar_p' || to_char(p_month, 'YYYYMM');
+BEGIN
+    IF to_regclass('t_p9202093_hotel_design_site.' || part_name) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    -- Строки этого месяца в DEFAULT не дают создать секцию: переносим их через временную таблицу
+    CREATE TEMP TABLE IF NOT EXISTS calendar_partition_move
+        (LIKE t_p9202093_hotel_design_site.availability_calendar_default) ON COMMIT DROP;
+    TRUNCATE calendar_partition_move;
+    WITH moved AS (
+        DELETE FROM t_p9202093_hotel_design_site.availability_calendar_default
+        WHERE date >= month_start AND date < month_end
+        RETURNING *
+    )
+    INSERT INTO calendar_partition_move SELECT * FROM moved;
+
+    EXECUTE format(
+        'CREATE TABLE t_p9202093_hotel_design_site.%I PARTITION OF t_p9202093_hotel_design_site.availability_calendar FOR VALUES FROM (%L) TO (%L)',
+        part_name, month_start, month_end
+    );
+    INSERT INTO t_p9202093_hotel_design_site.availability_calendar SELECT * FROM calendar_partition_move;
+    RETURN part_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Секции на months_ahead месяцев вперёд; секции старше keep_months месяцев отсоединяются
+-- и переименовываются в availability_calendar_archive_YYYYMM (данные остаются, но вне горячих запросов).
+-- keep_months = NULL — ничего не отсоединять
+CREATE OR REPLACE FUNCTION t_p9202093_hotel_design_site.maintain_calendar_partitions(
+    months_ahead INTEGER DEFAULT 18,
+    keep_months INTEGER DEFAULT 24
+)
+RETURNS TABLE (action TEXT, partition_name TEXT) AS $$
+DECLARE
+    current_month DATE := date_trunc('month', CURRENT_DATE)::date;
+    month_value DATE;
+    created TEXT;
+    part RECORD;
+BEGIN
+    FOR month_value IN
+        SELECT generate_series(current_month, current_month + make_interval(months => months_ahead), interval '1 month')::date
+    LOOP
+        created := t_p9202093_hotel_design_site.create_calendar_partition(month_value);
+        IF created IS NOT NULL THEN
+            action := 'created';
+            partition_name := created;
+            RETURN NEXT;
+        END IF;
+    END LOOP;
+
+    IF keep_months IS NULL THEN
+        RETURN;
+    END IF;
+
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 't_p9202093_hotel_design_site.availability_calendar'::regclass
+          AND c.relname ~ '^availability_calendar_p[0-9]{6}$'
+          AND to_date(right(c.relname, 6), 'YYYYMM') < current_month - make_interval(months => keep_months)
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format(
+            'ALTER TABLE t_p9202093_hotel_design_site.availability_calendar DETACH PARTITION t_p9202093_hotel_design_site.%I',
+            part.relname
+        );
+        EXECUTE format(
+            'ALTER TABLE t_p9202093_hotel_design_site.%I RENAME TO %I',
+            part.relname, 'availability_calendar_archive_' || right(part.relname, 6)
+        );
+        action := 'archived';
+        partition_name := 'availability_calendar_archive_' || right(part.relname, 6);
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Секции под все месяцы существующих данных и на полтора года вперёд, затем перенос строк
+SELECT t_p9202093_hotel_design_site.create_calendar_partition(month_value::date)
+FROM generate_series(
+    (SELECT date_trunc('month', MIN(date)) FROM t_p9202093_hotel_design_site.availability_calendar_legacy),
+    date_trunc('month', CURRENT_DATE) - interval '1 month',
+    interval '1 month'
+) AS month_value;
+
+SELECT * FROM t_p9202093_hotel_design_site.maintain_calendar_partitions(18, NULL);
+
+INSERT INTO t_p9202093_hotel_design_site.availability_calendar (id, room_id, date, is_available, booking_id, price)
+SELECT id, room_id, date, is_available, booking_id, price
+FROM t_p9202093_hotel_design_site.availability_calendar_legacy;
+
+SELECT setval(
+    pg_get_serial_sequence('t_p9202093_hotel_design_site.availability_calendar', 'id'),
+    GREATEST((SELECT MAX(id) FROM t_p9202093_hotel_design_site.availability_calendar), 1)
+);
+
+DROP TABLE t_p9202093_hotel_design_site.availability_calendar_legacy;
+
+-- Триггер версии календаря (V0094) жил на старой таблице
+CREATE TRIGGER trg_calendar_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p9202093_hotel_design_site.availability_calendar
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.bump_calendar_version();
@@ -0,0 +1,52 @@
+-- Пересечение активных броней одного апартамента запрещает сама база:
+-- EXCLUDE по (apartment_id, [check_in, check_out)) через GiST (btree_gist подключён в V0093).
+-- create-booking делает один INSERT и отвечает 409 на exclusion_violation вместо SELECT COUNT(*) перед вставкой.
+
+-- Уже существующие пересечения и брони из Bnovo, пришедшие поверх активной брони,
+-- помечаются overbooked и в ограничение не входят: Bnovo — источник истины, синхронизация не должна падать
+ALTER TABLE t_p9202093_hotel_design_site.bookings
+    ADD COLUMN IF NOT EXISTS overbooked BOOLEAN NOT NULL DEFAULT false;
+
+-- Из каждой группы пересекающихся броней в ограничении остаётся самая ранняя
+UPDATE t_p9202093_hotel_design_site.bookings b
+SET overbooked = true
+WHERE COALESCE(b.status, '') <> 'cancelled'
+  AND b.check_out > b.check_in
+  AND EXISTS (
+      SELECT 1 FROM t_p9202093_hotel_design_site.bookings o
+      WHERE o.apartment_id = b.apartment_id
+        AND COALESCE(o.status, '') <> 'cancelled'
+        AND o.check_out > o.check_in
+        AND daterange(o.check_in, o.check_out, '[)') && daterange(b.check_in, b.check_out, '[)')
+        AND (COALESCE(o.created_at, '-infinity'), o.id) < (COALESCE(b.created_at, '-infinity'), b.id)
+  );
+
+ALTER TABLE t_p9202093_hotel_design_site.bookings
+    ADD CONSTRAINT bookings_no_overlap
+    EXCLUDE USING GIST (apartment_id WITH =, daterange(check_in, check_out, '[)') WITH &&)
+    WHERE (COALESCE(status, '') <> 'cancelled' AND check_out > check_in AND NOT overbooked);
+
+CREATE OR REPLACE FUNCTION t_p9202093_hotel_design_site.flag_bnovo_overbooking()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.overbooked := COALESCE(NEW.status, '') <> 'cancelled'
+        AND NEW.check_out > NEW.check_in
+        AND EXISTS (
+            SELECT 1 FROM t_p9202093_hotel_design_site.bookings o
+            WHERE o.apartment_id = NEW.apartment_id
+              AND o.id <> NEW.id
+              AND COALESCE(o.status, '') <> 'cancelled'
+              AND o.check_out > o.check_in
+              AND NOT o.overbooked
+              AND daterange(o.check_in, o.check_out, '[)') && daterange(NEW.check_in, NEW.check_out, '[)')
+        );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql VOLATILE;
+
+-- Только для броней из Bnovo; сайт и админка получают exclusion_violation
+DROP TRIGGER IF EXISTS trg_flag_bnovo_overbooking ON t_p9202093_hotel_design_site.bookings;
+CREATE TRIGGER trg_flag_bnovo_overbooking
+    BEFORE INSERT OR UPDATE OF apartment_id, check_in, check_out, status ON t_p9202093_hotel_design_site.bookings
+    FOR EACH ROW WHEN (NEW.source = 'bnovo')
+    EXECUTE FUNCTION t_p9202093_hotel_design_site.flag_bnovo_overbooking();
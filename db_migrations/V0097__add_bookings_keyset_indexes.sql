@@ -0,0 +1,8 @@
+-- Постраничный список броней (GET bookings?limit=&cursor=) идёт по ключу (check_in, id) по убыванию:
+-- следующая страница — обратный проход индекса от последней пары, без OFFSET и сортировки всей таблицы
+CREATE INDEX IF NOT EXISTS idx_bookings_check_in_id
+    ON t_p9202093_hotel_design_site.bookings (check_in, id);
+
+-- То же внутри одного апартамента
+CREATE INDEX IF NOT EXISTS idx_bookings_apartment_check_in_id
+    ON t_p9202093_hotel_design_site.bookings (apartment_id, check_in, id);
@@ -0,0 +1,4 @@
+-- Брони гостя ищутся по email ИЛИ телефону (bookings_db.guest_bookings):
+-- с индексом по guest_phone рядом с idx_bookings_guest_email это BitmapOr двух индексов, а не полный проход
+CREATE INDEX IF NOT EXISTS idx_bookings_guest_phone
+    ON t_p9202093_hotel_design_site.bookings (guest_phone);
@@ -0,0 +1,136 @@
+-- Итоги собственника по апартаменту и месяцу заезда, которые поддерживает сама база:
+-- триггеры на bookings с transition tables добавляют дельту каждой записи (сайт, админка,
+-- отчёты, отмены, синхронизации Bnovo), так что дашборды читают O(месяцев) строк, а не брони.
+-- Отменённые брони в итоги не входят; месяц — по check_in, как в monthly_reports.
+CREATE TABLE IF NOT EXISTS t_p9202093_hotel_design_site.booking_monthly_rollups (
+    apartment_id TEXT NOT NULL,
+    month DATE NOT NULL,
+    bookings_count INTEGER NOT NULL DEFAULT 0,
+    nights INTEGER NOT NULL DEFAULT 0,
+    total_amount NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    accommodation_amount NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    tax_and_bank_commission NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    management_commission NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    operating_expenses NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    owner_funds NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    payment_to_owner NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    maid NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    laundry NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    hygiene NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    transport NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    compliment NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    other NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (apartment_id, month)
+);
+
+-- Опустевшие месяцы удаляются после каждой записи — поиск по частичному индексу, а не по всей таблице
+CREATE INDEX IF NOT EXISTS idx_booking_monthly_rollups_empty
+    ON t_p9202093_hotel_design_site.booking_monthly_rollups (apartment_id)
+    WHERE bookings_count <= 0;
+
+-- Строки-вклады броней: sign = 1 для новых версий строк, -1 для старых
+CREATE OR REPLACE FUNCTION t_p9202093_hotel_design_site.apply_booking_rollup_delta()
+RETURNS TRIGGER AS $$
+DECLARE
+    source_rows TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        source_rows := 'SELECT 1 AS sign, * FROM new_rows';
+    ELSIF TG_OP = 'UPDATE' THEN
+        source_rows := 'SELECT 1 AS sign, * FROM new_rows UNION ALL SELECT -1 AS sign, * FROM old_rows';
+    ELSE
+        source_rows := 'SELECT -1 AS sign, * FROM old_rows';
+    END IF;
+
+    -- Ключи упорядочены: параллельные транзакции блокируют строки итогов в одном порядке
+    EXECUTE format($sql$
+        INSERT INTO t_p9202093_hotel_design_site.booking_monthly_rollups AS r (
+            apartment_id, month, bookings_count, nights, total_amount, accommodation_amount,
+            tax_and_bank_commission, management_commission, operating_expenses, owner_funds, payment_to_owner,
+            maid, laundry, hygiene, transport, compliment, other, updated_at
+        )
+        SELECT apartment_id, date_trunc('month', check_in)::date,
+               SUM(sign), SUM(sign * GREATEST(check_out - check_in, 0)),
+               SUM(sign * COALESCE(total_amount, 0)), SUM(sign * COALESCE(accommodation_amount, 0)),
+               SUM(sign * COALESCE(tax_and_bank_commission, 0)), SUM(sign * COALESCE(management_commission, 0)),
+               SUM(sign * COALESCE(operating_expenses, 0)), SUM(sign * COALESCE(owner_funds, 0)),
+               SUM(sign * COALESCE(payment_to_owner, 0)),
+               SUM(sign * COALESCE(maid, 0)), SUM(sign * COALESCE(laundry, 0)), SUM(sign * COALESCE(hygiene, 0)),
+               SUM(sign * COALESCE(transport, 0)), SUM(sign * COALESCE(compliment, 0)), SUM(sign * COALESCE(other, 0)),
+               CURRENT_TIMESTAMP
+        FROM (%s) d
+        WHERE COALESCE(status, '') <> 'cancelled' AND apartment_id IS NOT NULL AND check_in IS NOT NULL
+        GROUP BY apartment_id, date_trunc('month', check_in)::date
+        -- Правки, не задевшие итоги (заметки, updated_at), дают нулевую дельту и ничего не пишут
+        HAVING SUM(sign) <> 0 OR SUM(sign * GREATEST(check_out - check_in, 0)) <> 0
+            OR SUM(sign * COALESCE(total_amount, 0)) <> 0 OR SUM(sign * COALESCE(accommodation_amount, 0)) <> 0
+            OR SUM(sign * COALESCE(tax_and_bank_commission, 0)) <> 0 OR SUM(sign * COALESCE(management_commission, 0)) <> 0
+            OR SUM(sign * COALESCE(operating_expenses, 0)) <> 0 OR SUM(sign * COALESCE(owner_funds, 0)) <> 0
+            OR SUM(sign * COALESCE(payment_to_owner, 0)) <> 0
+            OR SUM(sign * COALESCE(maid, 0)) <> 0 OR SUM(sign * COALESCE(laundry, 0)) <> 0
+            OR SUM(sign * COALESCE(hygiene, 0)) <> 0 OR SUM(sign * COALESCE(transport, 0)) <> 0
+            OR SUM(sign * COALESCE(compliment, 0)) <> 0 OR SUM(sign * COALESCE(other, 0)) <> 0
+        ORDER BY 1, 2
+        ON CONFLICT (apartment_id, month) DO UPDATE SET
+            bookings_count = r.bookings_count + EXCLUDED.bookings_count,
+            nights = r.nights + EXCLUDED.nights,
+            total_amount = r.total_amount + EXCLUDED.total_amount,
+            accommodation_amount = r.accommodation_amount + EXCLUDED.accommodation_amount,
+            tax_and_bank_commission = r.tax_and_bank_commission + EXCLUDED.tax_and_bank_commission,
+            management_commission = r.management_commission + EXCLUDED.management_commission,
+            operating_expenses = r.operating_expenses + EXCLUDED.operating_expenses,
+            owner_funds = r.owner_funds + EXCLUDED.owner_funds,
+            payment_to_owner = r.payment_to_owner + EXCLUDED.payment_to_owner,
+            maid = r.maid + EXCLUDED.maid,
+            laundry = r.laundry + EXCLUDED.laundry,
+            hygiene = r.hygiene + EXCLUDED.hygiene,
+            transport = r.transport + EXCLUDED.transport,
+            compliment = r.compliment + EXCLUDED.compliment,
+            other = r.other + EXCLUDED.other,
+            updated_at = EXCLUDED.updated_at
+    $sql$, source_rows);
+
+    -- Месяц, из которого ушли все брони, не остаётся нулевой строкой
+    DELETE FROM t_p9202093_hotel_design_site.booking_monthly_rollups WHERE bookings_count <= 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql VOLATILE;
+
+-- Transition tables не сочетаются с несколькими событиями в одном триггере — по триггеру на событие
+DROP TRIGGER IF EXISTS trg_booking_rollups_insert ON t_p9202093_hotel_design_site.bookings;
+CREATE TRIGGER trg_booking_rollups_insert
+    AFTER INSERT ON t_p9202093_hotel_design_site.bookings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.apply_booking_rollup_delta();
+
+DROP TRIGGER IF EXISTS trg_booking_rollups_update ON t_p9202093_hotel_design_site.bookings;
+CREATE TRIGGER trg_booking_rollups_update
+    AFTER UPDATE ON t_p9202093_hotel_design_site.bookings
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.apply_booking_rollup_delta();
+
+DROP TRIGGER IF EXISTS trg_booking_rollups_delete ON t_p9202093_hotel_design_site.bookings;
+CREATE TRIGGER trg_booking_rollups_delete
+    AFTER DELETE ON t_p9202093_hotel_design_site.bookings
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.apply_booking_rollup_delta();
+
+-- Начальное заполнение из текущих броней
+TRUNCATE t_p9202093_hotel_design_site.booking_monthly_rollups;
+INSERT INTO t_p9202093_hotel_design_site.booking_monthly_rollups (
+    apartment_id, month, bookings_count, nights, total_amount, accommodation_amount,
+    tax_and_bank_commission, management_commission, operating_expenses, owner_funds, payment_to_owner,
+    maid, laundry, hygiene, transport, compliment, other
+)
+SELECT apartment_id, date_trunc('month', check_in)::date,
+       COUNT(*), SUM(GREATEST(check_out - check_in, 0)),
+       SUM(COALESCE(total_amount, 0)), SUM(COALESCE(accommodation_amount, 0)),
+       SUM(COALESCE(tax_and_bank_commission, 0)), SUM(COALESCE(management_commission, 0)),
+       SUM(COALESCE(operating_expenses, 0)), SUM(COALESCE(owner_funds, 0)),
+       SUM(COALESCE(payment_to_owner, 0)),
+       SUM(COALESCE(maid, 0)), SUM(COALESCE(laundry, 0)), SUM(COALESCE(hygiene, 0)),
+       SUM(COALESCE(transport, 0)), SUM(COALESCE(compliment, 0)), SUM(COALESCE(other, 0))
+FROM t_p9202093_hotel_design_site.bookings
+WHERE COALESCE(status, '') <> 'cancelled' AND apartment_id IS NOT NULL AND check_in IS NOT NULL
+GROUP BY apartment_id, date_trunc('month', check_in)::date;
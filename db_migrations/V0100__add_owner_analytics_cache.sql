@@ -0,0 +1,86 @@
+-- Метрики закрытых месяцев для аналитики собственника (owner-apartments ?view=analytics):
+-- прошлый месяц считается один раз, дальше читается отсюда. Строку удаляют триггеры, когда
+-- меняется бронь или день календаря, попадающие в этот месяц, — следующий запрос пересчитает её.
+CREATE TABLE IF NOT EXISTS t_p9202093_hotel_design_site.owner_analytics_months (
+    apartment_id TEXT NOT NULL,
+    month DATE NOT NULL,
+    metrics JSONB NOT NULL,
+    computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (apartment_id, month)
+);
+
+-- Затронутые записью (апартамент, первый и последний день): бронь — ночи [check_in, check_out),
+-- календарь — один день. Апартамент броней Bnovo — номер комнаты, кэш ключуется rooms.id
+CREATE OR REPLACE FUNCTION t_p9202093_hotel_design_site.invalidate_owner_analytics()
+RETURNS TRIGGER AS $$
+DECLARE
+    projection TEXT;
+    source_rows TEXT;
+BEGIN
+    IF TG_TABLE_NAME = 'bookings' THEN
+        projection := 'apartment_id AS apartment_key, check_in AS first_day, GREATEST(check_out - 1, check_in) AS last_day';
+    ELSE
+        projection := 'room_id AS apartment_key, date AS first_day, date AS last_day';
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        source_rows := format('SELECT %s FROM new_rows', projection);
+    ELSIF TG_OP = 'UPDATE' THEN
+        source_rows := format('SELECT %1$s FROM new_rows UNION ALL SELECT %1$s FROM old_rows', projection);
+    ELSE
+        source_rows := format('SELECT %s FROM old_rows', projection);
+    END IF;
+
+    -- Кэш хранит только прошлые месяцы: правки будущих дат (цены sync-bnovo-rates) ничего не удаляют
+    EXECUTE format($sql$
+        DELETE FROM t_p9202093_hotel_design_site.owner_analytics_months c
+        USING (
+            SELECT DISTINCT apartment_key, date_trunc('month', first_day)::date AS first_month, last_day
+            FROM (%s) s
+            WHERE apartment_key IS NOT NULL AND first_day < date_trunc('month', CURRENT_DATE)
+        ) a
+        LEFT JOIN t_p9202093_hotel_design_site.rooms r ON r.number = a.apartment_key
+        WHERE c.apartment_id IN (a.apartment_key, r.id)
+          AND c.month >= a.first_month AND c.month <= a.last_day
+    $sql$, source_rows);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql VOLATILE;
+
+-- Transition tables не сочетаются с несколькими событиями в одном триггере — по триггеру на событие
+DROP TRIGGER IF EXISTS trg_owner_analytics_insert ON t_p9202093_hotel_design_site.bookings;
+CREATE TRIGGER trg_owner_analytics_insert
+    AFTER INSERT ON t_p9202093_hotel_design_site.bookings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.invalidate_owner_analytics();
+
+DROP TRIGGER IF EXISTS trg_owner_analytics_update ON t_p9202093_hotel_design_site.bookings;
+CREATE TRIGGER trg_owner_analytics_update
+    AFTER UPDATE ON t_p9202093_hotel_design_site.bookings
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.invalidate_owner_analytics();
+
+DROP TRIGGER IF EXISTS trg_owner_analytics_delete ON t_p9202093_hotel_design_site.bookings;
+CREATE TRIGGER trg_owner_analytics_delete
+    AFTER DELETE ON t_p9202093_hotel_design_site.bookings
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.invalidate_owner_analytics();
+
+-- Закрытые для продажи дни календаря уменьшают число доступных ночей месяца
+DROP TRIGGER IF EXISTS trg_owner_analytics_insert ON t_p9202093_hotel_design_site.availability_calendar;
+CREATE TRIGGER trg_owner_analytics_insert
+    AFTER INSERT ON t_p9202093_hotel_design_site.availability_calendar
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.invalidate_owner_analytics();
+
+DROP TRIGGER IF EXISTS trg_owner_analytics_update ON t_p9202093_hotel_design_site.availability_calendar;
+CREATE TRIGGER trg_owner_analytics_update
+    AFTER UPDATE ON t_p9202093_hotel_design_site.availability_calendar
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.invalidate_owner_analytics();
+
+DROP TRIGGER IF EXISTS trg_owner_analytics_delete ON t_p9202093_hotel_design_site.availability_calendar;
+CREATE TRIGGER trg_owner_analytics_delete
+    AFTER DELETE ON t_p9202093_hotel_design_site.availability_calendar
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.invalidate_owner_analytics();
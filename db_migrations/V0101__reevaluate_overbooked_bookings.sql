@@ -0,0 +1,102 @@
+-- overbooked (V0096) пересчитывался только при изменении самой брони. Если отменили, перенесли
+-- или удалили бронь, с которой она пересекалась, флаг оставался и бронь навсегда выпадала
+-- из bookings_no_overlap. Теперь после таких изменений пересчитываются помеченные брони
+-- того же апартамента на освободившихся датах.
+--
+-- Гонка, которую ограничение не снимает: бронь Bnovo вставляется, пока пересекающаяся прямая бронь
+-- (create-booking, админка) ещё не закоммичена. flag_bnovo_overbooking её не видит, INSERT ждёт
+-- коммита и получает exclusion_violation — пачка синхронизации откатывается целиком. Следующий запуск
+-- cron-sync-bnovo видит закоммиченную бронь, помечает бронь Bnovo overbooked и проходит.
+
+-- Помеченные брони на датах [check_in, check_out) апартаментов проверяются по одной, от ранней
+-- к поздней: снятая пометка видна следующей проверке, поэтому две пересекающиеся друг с другом
+-- помеченные брони не вернутся в ограничение обе
+CREATE OR REPLACE FUNCTION t_p9202093_hotel_design_site.release_overbooked(
+    apartment_ids TEXT[], check_ins DATE[], check_outs DATE[]
+) RETURNS INTEGER AS $$
+DECLARE
+    candidate RECORD;
+    released INTEGER := 0;
+    changed INTEGER;
+BEGIN
+    FOR candidate IN
+        SELECT DISTINCT b.id, b.apartment_id, b.check_in, b.check_out, b.created_at
+        FROM unnest(apartment_ids, check_ins, check_outs) AS f(apartment_id, check_in, check_out)
+        JOIN t_p9202093_hotel_design_site.bookings b
+          ON b.apartment_id = f.apartment_id
+         AND daterange(b.check_in, b.check_out, '[)') && daterange(f.check_in, f.check_out, '[)')
+        WHERE b.overbooked
+          AND COALESCE(b.status, '') <> 'cancelled'
+          AND b.check_out > b.check_in
+        ORDER BY b.created_at NULLS FIRST, b.id
+    LOOP
+        UPDATE t_p9202093_hotel_design_site.bookings b
+        SET overbooked = false
+        WHERE b.id = candidate.id
+          AND NOT EXISTS (
+              SELECT 1 FROM t_p9202093_hotel_design_site.bookings o
+              WHERE o.apartment_id = candidate.apartment_id
+                AND o.id <> candidate.id
+                AND COALESCE(o.status, '') <> 'cancelled'
+                AND o.check_out > o.check_in
+                AND NOT o.overbooked
+                AND daterange(o.check_in, o.check_out, '[)') && daterange(candidate.check_in, candidate.check_out, '[)')
+          );
+        GET DIAGNOSTICS changed = ROW_COUNT;
+        released := released + changed;
+    END LOOP;
+    RETURN released;
+END;
+$$ LANGUAGE plpgsql VOLATILE;
+
+-- Освободившиеся даты: старые версии броней, которые занимали место в ограничении
+-- и у которых сменились апартамент, даты или статус (или которые удалены).
+-- Transition tables не сочетаются с UPDATE OF, поэтому фильтр по колонкам — здесь;
+-- UPDATE самого overbooked из release_overbooked ничего не освобождает и цикла не даёт
+CREATE OR REPLACE FUNCTION t_p9202093_hotel_design_site.reevaluate_overbooked()
+RETURNS TRIGGER AS $$
+DECLARE
+    apartment_ids TEXT[];
+    check_ins DATE[];
+    check_outs DATE[];
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        SELECT array_agg(o.apartment_id), array_agg(o.check_in), array_agg(o.check_out)
+        INTO apartment_ids, check_ins, check_outs
+        FROM old_rows o
+        JOIN new_rows n ON n.id = o.id
+        WHERE (o.apartment_id, o.check_in, o.check_out, COALESCE(o.status, ''))
+              IS DISTINCT FROM (n.apartment_id, n.check_in, n.check_out, COALESCE(n.status, ''))
+          AND COALESCE(o.status, '') <> 'cancelled' AND o.check_out > o.check_in AND NOT o.overbooked;
+    ELSE
+        SELECT array_agg(o.apartment_id), array_agg(o.check_in), array_agg(o.check_out)
+        INTO apartment_ids, check_ins, check_outs
+        FROM old_rows o
+        WHERE COALESCE(o.status, '') <> 'cancelled' AND o.check_out > o.check_in AND NOT o.overbooked;
+    END IF;
+
+    IF apartment_ids IS NOT NULL THEN
+        PERFORM t_p9202093_hotel_design_site.release_overbooked(apartment_ids, check_ins, check_outs);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql VOLATILE;
+
+DROP TRIGGER IF EXISTS trg_reevaluate_overbooked_update ON t_p9202093_hotel_design_site.bookings;
+CREATE TRIGGER trg_reevaluate_overbooked_update
+    AFTER UPDATE ON t_p9202093_hotel_design_site.bookings
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.reevaluate_overbooked();
+
+DROP TRIGGER IF EXISTS trg_reevaluate_overbooked_delete ON t_p9202093_hotel_design_site.bookings;
+CREATE TRIGGER trg_reevaluate_overbooked_delete
+    AFTER DELETE ON t_p9202093_hotel_design_site.bookings
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.reevaluate_overbooked();
+
+-- Брони, которые освободились ещё до этой миграции
+SELECT t_p9202093_hotel_design_site.release_overbooked(
+    array_agg(apartment_id), array_agg(check_in), array_agg(check_out)
+)
+FROM t_p9202093_hotel_design_site.bookings
+WHERE overbooked AND COALESCE(status, '') <> 'cancelled' AND check_out > check_in;
@@ -0,0 +1,6 @@
+-- Ответы check-availability, apartment-availability и calendar-bnovo собираются из
+-- availability_calendar, booked_ranges и rooms — bookings они не читают, занятость приходит
+-- через booked_ranges с собственным триггером версии. Триггер на bookings поднимал версию
+-- на каждой записи (расходы, предоплата, пересчёт финансов), сбрасывая все снимки, и держал
+-- блокировку строки calendar_version до коммита: писатели броней ждали долгие синхронизации.
+DROP TRIGGER IF EXISTS trg_calendar_version ON t_p9202093_hotel_design_site.bookings;
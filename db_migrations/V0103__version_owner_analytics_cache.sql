@@ -0,0 +1,75 @@
+-- Кэш owner_analytics_months (V0100) удалял строку при записи в месяц. Запрос аналитики,
+-- начавшийся до коммита такой записи, не видел ни её, ни строки кэша и потом вставлял метрики
+-- из старого снимка — они оставались до следующей записи в этот месяц. Теперь запись не удаляет,
+-- а помечает месяц устаревшим и увеличивает generation (строка-метка создаётся, даже если месяц
+-- ещё не кэширован). Запрос аналитики сохраняет метрики, только если строка за время его работы
+-- не менялась: generation та же, что в его снимке (0 — строки не было).
+ALTER TABLE t_p9202093_hotel_design_site.owner_analytics_months
+    ALTER COLUMN metrics DROP NOT NULL,
+    ADD COLUMN IF NOT EXISTS generation BIGINT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS stale BOOLEAN NOT NULL DEFAULT false;
+
+-- Затронутые записью (апартамент, первый и последний день): бронь — ночи [check_in, check_out),
+-- календарь — один день. Апартамент броней Bnovo — номер комнаты, кэш ключуется rooms.id
+CREATE OR REPLACE FUNCTION t_p9202093_hotel_design_site.invalidate_owner_analytics()
+RETURNS TRIGGER AS $$
+DECLARE
+    projection TEXT;
+    source_rows TEXT;
+BEGIN
+    IF TG_TABLE_NAME = 'bookings' THEN
+        projection := 'apartment_id AS apartment_key, check_in AS first_day, GREATEST(check_out - 1, check_in) AS last_day';
+    ELSE
+        projection := 'room_id AS apartment_key, date AS first_day, date AS last_day';
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        source_rows := format('SELECT %s FROM new_rows', projection);
+    ELSIF TG_OP = 'UPDATE' THEN
+        source_rows := format('SELECT %1$s FROM new_rows UNION ALL SELECT %1$s FROM old_rows', projection);
+    ELSE
+        source_rows := format('SELECT %s FROM old_rows', projection);
+    END IF;
+
+    -- Кэш хранит только прошлые месяцы: правки будущих дат (цены sync-bnovo-rates) ничего не пишут.
+    -- Ключи упорядочены: параллельные писатели блокируют строки кэша в одном порядке
+    EXECUTE format($sql$
+        INSERT INTO t_p9202093_hotel_design_site.owner_analytics_months AS c
+            (apartment_id, month, metrics, generation, stale, computed_at)
+        SELECT DISTINCT COALESCE(r.id, a.apartment_key), m::date, NULL::jsonb, 1, true, CURRENT_TIMESTAMP
+        FROM (
+            SELECT apartment_key, first_day, LEAST(last_day, date_trunc('month', CURRENT_DATE)::date - 1) AS last_day
+            FROM (%s) s
+            WHERE apartment_key IS NOT NULL AND first_day < date_trunc('month', CURRENT_DATE)
+        ) a
+        LEFT JOIN t_p9202093_hotel_design_site.rooms r ON r.number = a.apartment_key
+        CROSS JOIN generate_series(date_trunc('month', a.first_day::timestamp), a.last_day::timestamp, interval '1 month') m
+        ORDER BY 1, 2
+        ON CONFLICT (apartment_id, month) DO UPDATE SET
+            stale = true, generation = c.generation + 1, computed_at = EXCLUDED.computed_at
+    $sql$, source_rows);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql VOLATILE;
+
+-- Брони Bnovo сопоставляются с комнатой по номеру: смена номера меняет, чьи брони попадают в месяц.
+-- Помечаются уже кэшированные месяцы комнаты; месяц, который параллельный запрос аналитики
+-- досчитывает по старому номеру, может попасть в кэш со старыми бронями — переименования редки
+CREATE OR REPLACE FUNCTION t_p9202093_hotel_design_site.invalidate_owner_analytics_rooms()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE t_p9202093_hotel_design_site.owner_analytics_months c
+    SET stale = true, generation = c.generation + 1, computed_at = CURRENT_TIMESTAMP
+    FROM new_rows n
+    JOIN old_rows o ON o.id = n.id
+    WHERE n.number IS DISTINCT FROM o.number
+      AND c.apartment_id IN (n.id, o.number, n.number);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql VOLATILE;
+
+DROP TRIGGER IF EXISTS trg_owner_analytics_update ON t_p9202093_hotel_design_site.rooms;
+CREATE TRIGGER trg_owner_analytics_update
+    AFTER UPDATE ON t_p9202093_hotel_design_site.rooms
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.invalidate_owner_analytics_rooms();
@@ -0,0 +1,26 @@
+-- flag_bnovo_overbooking (V0096) срабатывал по NEW.source = 'bnovo', а source присылал клиент
+-- create-booking: бронь сайта с "source": "bnovo" помечалась overbooked и сохранялась поверх занятых дат
+-- вместо 409. Теперь пометка ставится только в транзакциях синхронизации (cron-sync-bnovo,
+-- sync-bnovo-to-db), которые выставляют set_config('app.bnovo_sync', 'on', true).
+-- Остальные записи — в том числе правки броней Bnovo из админки — проверяются bookings_no_overlap.
+CREATE OR REPLACE FUNCTION t_p9202093_hotel_design_site.flag_bnovo_overbooking()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF current_setting('app.bnovo_sync', true) IS DISTINCT FROM 'on' THEN
+        RETURN NEW;
+    END IF;
+
+    NEW.overbooked := COALESCE(NEW.status, '') <> 'cancelled'
+        AND NEW.check_out > NEW.check_in
+        AND EXISTS (
+            SELECT 1 FROM t_p9202093_hotel_design_site.bookings o
+            WHERE o.apartment_id = NEW.apartment_id
+              AND o.id <> NEW.id
+              AND COALESCE(o.status, '') <> 'cancelled'
+              AND o.check_out > o.check_in
+              AND NOT o.overbooked
+              AND daterange(o.check_in, o.check_out, '[)') && daterange(NEW.check_in, NEW.check_out, '[)')
+        );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql VOLATILE;
@@ -0,0 +1,19 @@
+-- Поправка к V0102: снимки календаря bookings всё же читают. load_booked_ranges (booked_ranges.py)
+-- берёт имя гостя из bookings поверх копии в booked_ranges, и calendar-bnovo кладёт его в снимок и ETag.
+-- Без триггера правка guest_name вне синхронизации отдавала 304 со старым именем.
+-- Версия поднимается только при изменении колонок, влияющих на календарь: расходы, предоплата
+-- и пересчёт финансов по-прежнему не сбрасывают снимки и не блокируют строку calendar_version.
+-- Уровень строки с WHEN, потому что UPDATE OF срабатывает и на неизменённые значения из SET.
+DROP TRIGGER IF EXISTS trg_calendar_version ON t_p9202093_hotel_design_site.bookings;
+CREATE TRIGGER trg_calendar_version
+    AFTER UPDATE OF guest_name, status, check_in, check_out, apartment_id ON t_p9202093_hotel_design_site.bookings
+    FOR EACH ROW
+    WHEN ((OLD.guest_name, OLD.status, OLD.check_in, OLD.check_out, OLD.apartment_id)
+          IS DISTINCT FROM (NEW.guest_name, NEW.status, NEW.check_in, NEW.check_out, NEW.apartment_id))
+    EXECUTE FUNCTION t_p9202093_hotel_design_site.bump_calendar_version();
+
+-- Удалённая бронь: имя в снимке откатывается к копии из booked_ranges
+DROP TRIGGER IF EXISTS trg_calendar_version_delete ON t_p9202093_hotel_design_site.bookings;
+CREATE TRIGGER trg_calendar_version_delete
+    AFTER DELETE ON t_p9202093_hotel_design_site.bookings
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p9202093_hotel_design_site.bump_calendar_version();
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+'''
+Сквозной бенчмарк синхронизаций Bnovo: cron-sync-bnovo и sync-bnovo-to-db
+против локальной заглушки Bnovo (scripts/bnovo_fake_server.py) и локального Postgres.
+
+    createdb bnovo_bench
+    python3 scripts/bench_bnovo_sync.py --dsn postgresql://localhost/bnovo_bench
+    python3 scripts/bench_bnovo_sync.py --dsn ... --sizes 1000,10000 --latency-ms 50 --error-rate 0.01
+
+Схема t_p9202093_hotel_design_site в указанной базе пересоздаётся из db_migrations,
+таблицы броней и календарей очищаются перед каждым прогоном — только для пустой тестовой базы!
+DSN передаётся явно (--dsn или BENCH_DATABASE_URL), DATABASE_URL окружения не используется.
+
+Каждый прогон — отдельный процесс (у функций одинаковые имена модулей index/bnovo_client),
+в нём psycopg2.connect подменяется на счётчик SQL-запросов и записанных строк.
+Отчёт: время работы handler'а, HTTP-вызовы (по заглушке и по метрикам клиента),
+SQL-запросы и строки, записанные в каждую таблицу.
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = ROOT / 'backend'
+MIGRATIONS_DIR = ROOT / 'db_migrations'
+SCHEMA = 't_p9202093_hotel_design_site'
+RESULT_MARKER = '__BENCH_RESULT__ '
+
+# Окно генерации броней покрывает окна обеих функций (60 дней назад — 180 вперёд)
+WINDOW_BACK_DAYS = 60
+WINDOW_DAYS = 240
+
+# (функция, режим, очищать ли базу перед прогоном)
+SCENARIOS = [
+    ('cron-sync-bnovo', 'full', True),
+    ('cron-sync-bnovo', 'incremental', False),
+    ('sync-bnovo-to-db', None, True),
+]
+
+RESET_TABLES = ['bookings', 'availability_calendar', 'calendar_bnovo', 'bnovo_sync_state', 'bnovo_auth_tokens', 'bnovo_sync_runs']
+
+WRITE_RE = re.compile(r'^\s*(insert\s+into|update|delete\s+from)\s+([\w."]+)', re.IGNORECASE)
+
+def install_sql_counter(stats: Dict[str, Any]) -> None:
+    '''Подмена psycopg2.connect: каждый курсор считает запросы и строки, записанные в таблицы'''
+    import psycopg2
+    import psycopg2.extensions
+
+    cursor_classes: Dict[type, type] = {}
+
+    def record(cur, query: Any, statements: int = 1) -> None:
+        stats['statements'] += statements
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', errors='ignore')
+        elif not isinstance(query, str):
+            query = query.as_string(cur)
+        match = WRITE_RE.match(query)
+        if match and cur.rowcount > 0:
+            table = match.group(2).split('.')[-1].strip('"')
+            stats['rows_written'][table] = stats['rows_written'].get(table, 0) + cur.rowcount
+
+    def counting_cursor(base: type) -> type:
+        if base not in cursor_classes:
+            class CountingCursor(base):
+                def execute(self, query, vars=None):
+                    result = super().execute(query, vars)
+                    record(self, query)
+                    return result
+
+                def executemany(self, query, vars_list):
+                    vars_list = list(vars_list)
+                    result = super().executemany(query, vars_list)
+                    record(self, query, len(vars_list))
+                    return result
+
+                def copy_expert(self, sql, file, size=8192):
+                    result = super().copy_expert(sql, file, size)
+                    stats['statements'] += 1
+                    stats['copy_rows'] += max(self.rowcount, 0)
+                    return result
+
+            cursor_classes[base] = CountingCursor
+        return cursor_classes[base]
+
+    connection_classes: Dict[type, type] = {}
+
+    def counting_connection(base: type) -> type:
+        # Функции подключаются через db_connection со своей connection_factory — счётчик встаёт поверх неё
+        if base not in connection_classes:
+            class CountingConnection(base):
+                def cursor(self, *args, **kwargs):
+                    base_cursor = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+                    kwargs['cursor_factory'] = counting_cursor(base_cursor)
+                    stats['cursors'] += 1
+                    return super().cursor(*args, **kwargs)
+
+            connection_classes[base] = CountingConnection
+        return connection_classes[base]
+
+    original_connect = psycopg2.connect
+
+    def connect(dsn=None, **kwargs):
+        kwargs['connection_factory'] = counting_connection(kwargs.get('connection_factory') or psycopg2.extensions.connection)
+        stats['connections'] += 1
+        return original_connect(dsn, **kwargs)
+
+    psycopg2.connect = connect
+
+def run_function(function: str, mode: Optional[str]) -> int:
+    '''Дочерний процесс: один вызов handler'а функции с подсчётом SQL'''
+    stats: Dict[str, Any] = {'statements': 0, 'copy_rows': 0, 'cursors': 0, 'connections': 0, 'rows_written': {}}
+    install_sql_counter(stats)
+
+    sys.path.insert(0, str(BACKEND_DIR / function))
+    import index
+
+    event = {'httpMethod': 'POST', 'queryStringParameters': {'mode': mode} if mode else {}}
+    # Функции печатают в stdout по строке на бронь/гостя — в отчёт это не нужно
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = index.handler(event, None)
+    elapsed = time.perf_counter() - started
+
+    try:
+        body = json.loads(response.get('body') or '{}')
+    except ValueError:
+        body = {'raw': response.get('body')}
+    print(RESULT_MARKER + json.dumps({
+        'status': response.get('statusCode'),
+        'wall_s': round(elapsed, 3),
+        'sql': stats,
+        'body': body
+    }, ensure_ascii=False, default=str))
+    return 0
+
+def prepare_schema(dsn: str) -> List[str]:
+    '''Пересоздание схемы из db_migrations; возвращает миграции, которые не применились'''
+    import psycopg2
+
+    failed = []
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+    cur.execute(f'CREATE SCHEMA {SCHEMA}')
+    # Ранние миграции пишут имена таблиц без схемы
+    cur.execute(f'SET search_path TO {SCHEMA}, public')
+    for migration in sorted(MIGRATIONS_DIR.glob('V*.sql')):
+        try:
+            cur.execute('BEGIN')
+            cur.execute(migration.read_text(encoding='utf-8'))
+            cur.execute('COMMIT')
+        except psycopg2.Error as e:
+            cur.execute('ROLLBACK')
+            failed.append(f'{migration.name}: {str(e).strip().splitlines()[0]}')
+    cur.close()
+    conn.close()
+    return failed
+
+def reset_data(dsn: str, room_bnovo_ids: Dict[str, int]) -> None:
+    '''Пустые брони и календари, комнаты заглушки с её bnovo_id'''
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute(f"TRUNCATE {', '.join(f'{SCHEMA}.{t}' for t in RESET_TABLES)} CASCADE")
+    for number, bnovo_id in room_bnovo_ids.items():
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.rooms (id, number, floor, bnovo_id, bnovo_name)
+            VALUES (%s, %s, 0, %s, %s)
+            ON CONFLICT (id) DO UPDATE SET number = EXCLUDED.number, bnovo_id = EXCLUDED.bnovo_id
+        """, (f'bench-{number}', number, bnovo_id, number))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+def run_scenario(function: str, mode: Optional[str], env: Dict[str, str]) -> Dict[str, Any]:
+    args = [sys.executable, str(Path(__file__).resolve()), '--run-function', function]
+    if mode:
+        args += ['--mode', mode]
+    completed = subprocess.run(args, env=env, capture_output=True, text=True)
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    return {'status': None, 'error': (completed.stderr or completed.stdout).strip()[-2000:]}
+
+def format_row(size: int, label: str, result: Dict[str, Any], http: Dict[str, int]) -> str:
+    if result.get('status') is None:
+        return f'{size:>7}  {label:<30}  FAILED: {result.get("error")}'
+    sql = result['sql']
+    rows = sum(sql['rows_written'].values())
+    client_http = result['body'].get('bnovo_http') or {}
+    http_calls = sum(v for k, v in http.items() if not k.startswith('injected'))
+    return (f'{size:>7}  {label:<30}  {result["status"]:>4}  {result["wall_s"]:>8.2f}  '
+            f'{http_calls:>6}  {client_http.get("retries", 0):>7}  {sql["statements"]:>7}  '
+            f'{rows:>8}  {sql["copy_rows"]:>8}')
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='End-to-end benchmark of Bnovo sync functions')
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_DATABASE_URL', ''),
+                        help='Postgres тестовой базы (по умолчанию BENCH_DATABASE_URL)')
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--functions', default='cron-sync-bnovo,sync-bnovo-to-db')
+    parser.add_argument('--skip-migrations', action='store_true', help='схема уже создана прошлым прогоном')
+    parser.add_argument('--json', action='store_true', help='вывести результаты JSON вместо таблицы')
+    parser.add_argument('--run-function', help=argparse.SUPPRESS)
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_function:
+        return run_function(args.run_function, args.mode)
+
+    if not args.dsn:
+        parser.error('укажите --dsn или BENCH_DATABASE_URL (база будет очищена)')
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from bnovo_fake_server import ROOM_BNOVO_IDS, generate_bookings, server_stats, start_server
+
+    if not args.skip_migrations:
+        failed = prepare_schema(args.dsn)
+        for line in failed:
+            print(f'Миграция не применилась: {line}', file=sys.stderr)
+
+    functions = set(args.functions.split(','))
+    results = []
+    if not args.json:
+        print(f'{"size":>7}  {"scenario":<30}  {"code":>4}  {"wall_s":>8}  {"http":>6}  {"retries":>7}  '
+              f'{"sql":>7}  {"rows":>8}  {"copied":>8}')
+
+    for size in [int(s) for s in args.sizes.split(',') if s]:
+        bookings = generate_bookings(size, date.today() - timedelta(days=WINDOW_BACK_DAYS), WINDOW_DAYS)
+        server = start_server(0, bookings, args.latency_ms, args.error_rate)
+        env = dict(os.environ,
+                   DATABASE_URL=args.dsn,
+                   BNOVO_API_URL=f'http://127.0.0.1:{server.server_address[1]}',
+                   BNOVO_ACCOUNT_ID='1',
+                   BNOVO_PASSWORD='fake')
+        try:
+            for function, mode, reset in SCENARIOS:
+                if function not in functions:
+                    continue
+                if reset:
+                    reset_data(args.dsn, ROOM_BNOVO_IDS)
+                server_stats(server, reset=True)
+                result = run_scenario(function, mode, env)
+                http = server_stats(server)
+                label = f'{function} ({mode})' if mode else function
+                results.append({'size': size, 'scenario': label, 'http': http, **result})
+                if not args.json:
+                    print(format_row(size, label, result, http), flush=True)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2, default=str))
+    return 0 if all(r.get('status') == 200 for r in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
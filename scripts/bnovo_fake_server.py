@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+'''
+Локальная заглушка Bnovo API для офлайн-прогона синхронизаций.
+
+    python3 scripts/bnovo_fake_server.py --port 8765 --bookings 1000
+    BNOVO_API_URL=http://127.0.0.1:8765 ...   # функции ходят в заглушку вместо api.pms.bnovo.ru
+
+    python3 scripts/bnovo_fake_server.py --bookings 10000 --latency-ms 80 --error-rate 0.02
+    # задержка каждого ответа и доля ответов 429/503, чтобы проверить повторы и breaker клиента
+
+Эндпоинты: POST /api/v1/auth, GET /api/v1/bookings, GET /api/v1/rates, GET /__stats (счётчики запросов).
+
+    python3 scripts/bnovo_fake_server.py --self-check --bookings 5000
+    # поднимает заглушку и проверяет, что общий загрузчик забирает все брони без потерь
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+FAKE_TOKEN = 'fake-bnovo-token'
+ROOM_NAMES = ['816', '906', '1116', '1311', '1401', '2019', '2110', '2111', '2119', '2817']
+# Идентификаторы комнат в Bnovo: далеко от настоящих, чтобы не пересечься с rooms.bnovo_id из миграций
+ROOM_BNOVO_IDS = {name: 900000 + i for i, name in enumerate(ROOM_NAMES)}
+GUEST_NAMES = ['Иван', 'Мария', 'Алексей', 'Ольга', 'Дмитрий', 'Анна']
+# Жёсткий лимит страницы, как у настоящего Bnovo
+MAX_LIMIT = 20
+
+def generate_bookings(count: int, window_start: date, window_days: int, seed: int = 42) -> List[Dict[str, Any]]:
+    '''
+    Синтетические брони в формате /api/v1/bookings.
+    Кроме полей Bnovo (dates, customer) есть room_id и arrival/departure верхнего уровня,
+    которые читает sync-bnovo-to-db.
+    '''
+    rnd = random.Random(seed)
+    bookings = []
+    for i in range(count):
+        arrival = window_start + timedelta(days=rnd.randrange(window_days))
+        departure = arrival + timedelta(days=rnd.randint(1, 10))
+        room_name = rnd.choice(ROOM_NAMES)
+        bookings.append({
+            'id': 100000 + i,
+            'room_id': ROOM_BNOVO_IDS[room_name],
+            'room_name': room_name,
+            'arrival': arrival.isoformat(),
+            'departure': departure.isoformat(),
+            'amount': rnd.randint(5, 60) * 1000,
+            'dates': {
+                'arrival': f'{arrival.isoformat()} 15:00:00+03',
+                'departure': f'{departure.isoformat()} 12:00:00+03'
+            },
+            'customer': {
+                'name': rnd.choice(GUEST_NAMES),
+                'surname': f'Гость{i}',
+                'email': f'guest{i}@example.com',
+                'phone': f'+7900{i:07d}'
+            },
+            'extra': {'adults': rnd.randint(1, 3), 'children': rnd.randint(0, 2)},
+            'updated_at': f'{(arrival - timedelta(days=rnd.randint(1, 60))).isoformat()} 10:00:00+03'
+        })
+    return bookings
+
+def generate_rates(room_id: int, date_from: date, date_to: date) -> List[Dict[str, Any]]:
+    '''Тарифы комнаты по дням [date_from, date_to]; детерминированы по (комната, дата)'''
+    rates = []
+    current = date_from
+    while current <= date_to:
+        rnd = random.Random(f'{room_id}:{current.isoformat()}')
+        rates.append({
+            'date': current.isoformat(),
+            'price': rnd.randint(40, 150) * 100,
+            'available': rnd.random() > 0.3,
+            'min_days': rnd.choice([1, 1, 2, 3])
+        })
+        current += timedelta(days=1)
+    return rates
+
+class FakeBnovoHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1, чтобы клиент мог держать keep-alive соединения
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    bookings: List[Dict[str, Any]] = []
+    # Задержка каждого ответа и доля ответов 429/503 (кроме /__stats)
+    latency_ms: float = 0.0
+    error_rate: float = 0.0
+    stats: Dict[str, int] = {}
+    stats_lock = threading.Lock()
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _count(self, key: str) -> None:
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def _inject_faults(self, path: str) -> bool:
+        '''Имитация медленного и нестабильного Bnovo; True — ответ с ошибкой уже отправлен'''
+        self._count(f'{self.command} {path}')
+        if self.latency_ms:
+            # ±50% разброса, чтобы запросы не приходили строем
+            time.sleep(self.latency_ms * random.uniform(0.5, 1.5) / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            status = random.choice([429, 503])
+            self._count(f'injected {status}')
+            self._send(status, {'error': 'injected failure'}, {'Retry-After': '0'} if status == 429 else None)
+            return True
+        return False
+
+    def _send(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        return self.headers.get('Authorization') == f'Bearer {FAKE_TOKEN}'
+
+    def do_POST(self) -> None:
+        path = urllib.parse.urlparse(self.path).path
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        if path != '/api/v1/auth':
+            self._send(404, {'error': 'not found'})
+            return
+        if self._inject_faults(path):
+            return
+        self._send(200, {'data': {'access_token': FAKE_TOKEN}})
+
+    def do_GET(self) -> None:
+        parsed = urllib.parse.urlparse(self.path)
+        if parsed.path == '/__stats':
+            with self.stats_lock:
+                self._send(200, dict(self.stats))
+            return
+        if parsed.path not in ('/api/v1/bookings', '/api/v1/rates'):
+            self._send(404, {'error': 'not found'})
+            return
+        if self._inject_faults(parsed.path):
+            return
+        if not self._authorized():
+            self._send(401, {'error': 'unauthorized'})
+            return
+
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        if parsed.path == '/api/v1/rates':
+            self._send_rates(query)
+            return
+
+        date_from = query.get('date_from', '0000-00-00')
+        date_to = query.get('date_to', '9999-99-99')
+        limit = min(int(query.get('limit', MAX_LIMIT)), MAX_LIMIT)
+        offset = int(query.get('offset', 0))
+
+        # Фильтр по дате заезда, границы включительно
+        matching = [b for b in self.bookings if date_from <= b['dates']['arrival'][:10] <= date_to]
+        self._send(200, {'data': {'bookings': matching[offset:offset + limit]}})
+
+    def _send_rates(self, query: Dict[str, str]) -> None:
+        try:
+            room_id = int(query['room_id'])
+            date_from = date.fromisoformat(query['date_from'])
+            date_to = date.fromisoformat(query['date_to'])
+        except (KeyError, ValueError):
+            self._send(400, {'error': 'room_id, date_from and date_to are required'})
+            return
+        if room_id not in ROOM_BNOVO_IDS.values():
+            self._send(404, {'error': f'room {room_id} not found'})
+            return
+        self._send(200, {'data': {'rates': generate_rates(room_id, date_from, date_to)}})
+
+def start_server(port: int, bookings: List[Dict[str, Any]], latency_ms: float = 0.0,
+                 error_rate: float = 0.0) -> ThreadingHTTPServer:
+    '''Запуск заглушки в фоновом потоке'''
+    handler = type('BoundFakeBnovoHandler', (FakeBnovoHandler,), {
+        'bookings': bookings,
+        'latency_ms': latency_ms,
+        'error_rate': error_rate,
+        'stats': {},
+        'stats_lock': threading.Lock()
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def server_stats(server: ThreadingHTTPServer, reset: bool = False) -> Dict[str, int]:
+    '''Счётчики запросов заглушки по методу и пути, плюс число внедрённых ошибок'''
+    handler = server.RequestHandlerClass
+    with handler.stats_lock:
+        stats = dict(handler.stats)
+        if reset:
+            handler.stats.clear()
+    return stats
+
+def self_check(bookings_count: int, latency_ms: float = 0.0, error_rate: float = 0.0) -> int:
+    '''Прогон общего загрузчика против заглушки: все брони окна должны прийти ровно по одному разу'''
+    window_start = date.today() - timedelta(days=60)
+    bookings = generate_bookings(bookings_count, window_start, 240)
+    server = start_server(0, bookings, latency_ms, error_rate)
+    os.environ['BNOVO_API_URL'] = f'http://127.0.0.1:{server.server_address[1]}'
+    os.environ.setdefault('BNOVO_ACCOUNT_ID', '1')
+    os.environ.setdefault('BNOVO_PASSWORD', 'fake')
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend' / '_shared'))
+    import bnovo_client
+
+    started = datetime.now()
+    fetched = bnovo_client.fetch_bookings(window_start, window_start + timedelta(days=239))
+    rates = bnovo_client.fetch_rates(list(ROOM_BNOVO_IDS.values()), window_start, window_start + timedelta(days=29))
+    elapsed = (datetime.now() - started).total_seconds()
+    stats = server_stats(server)
+    server.shutdown()
+
+    fetched_ids = [b['id'] for b in fetched]
+    expected_ids = {b['id'] for b in bookings}
+    rates_ok = all(isinstance(r, list) and len(r) == 30 for r in rates.values())
+    ok = len(fetched_ids) == len(set(fetched_ids)) and set(fetched_ids) == expected_ids and rates_ok
+    print(f"{'OK' if ok else 'FAIL'}: fetched {len(fetched_ids)} of {len(expected_ids)} bookings "
+          f"and rates for {sum(isinstance(r, list) for r in rates.values())} of {len(rates)} rooms "
+          f"in {elapsed:.2f}s; server: {json.dumps(stats, sort_keys=True)}")
+    return 0 if ok else 1
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Fake Bnovo API')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--bookings', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--self-check', action='store_true')
+    args = parser.parse_args()
+
+    if args.self_check:
+        return self_check(args.bookings, args.latency_ms, args.error_rate)
+
+    bookings = generate_bookings(args.bookings, date.today() - timedelta(days=60), 240)
+    server = start_server(args.port, bookings, args.latency_ms, args.error_rate)
+    print(f'Fake Bnovo API on http://127.0.0.1:{args.port} with {len(bookings)} bookings '
+          f'(latency {args.latency_ms:g} ms, error rate {args.error_rate:g})')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
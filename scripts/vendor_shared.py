@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+'''
+Копирует общие модули из backend/_shared в каталоги облачных функций.
+
+Каждая функция деплоится отдельно и видит только свой каталог, поэтому общий код
+лежит копией рядом с index.py. Править нужно оригинал в backend/_shared, затем:
+
+    python3 scripts/vendor_shared.py          # обновить копии
+    python3 scripts/vendor_shared.py --check  # проверить, что копии актуальны
+'''
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SHARED_DIR = ROOT / 'backend' / '_shared'
+BACKEND_DIR = ROOT / 'backend'
+
+# модуль -> функции, которые его используют
+SHARED_MODULES = {
+    'bnovo_client.py': ['cron-sync-bnovo', 'sync-bnovo-to-db', 'bnovo-sync', 'sync-bnovo-rates'],
+    'booked_ranges.py': ['cron-sync-bnovo', 'sync-bnovo-to-db', 'check-availability', 'apartment-availability', 'calendar-bnovo',
+                         'search-apartments'],
+    'bookings_db.py': ['bookings', 'owner-reports', 'create-booking', 'cancel-booking', 'guests-api',
+                       'archive-monthly-reports', 'cron-archive'],
+    'bulk_load.py': ['sync-bnovo-to-db'],
+    'calendar_runs.py': ['check-availability', 'calendar-bnovo'],
+    'db_connection.py': [
+        'apartment-availability', 'archive-monthly-reports', 'auth', 'auth-housekeepers', 'bnovo-sync', 'booking-pdf',
+        'bookings', 'calendar-bnovo', 'cancel-booking', 'check-availability', 'check-in-instructions',
+        'cleaning-history', 'cleaning-tasks', 'create-booking', 'cron-archive', 'cron-calendar-partitions',
+        'cron-sync-bnovo', 'fortune-wheel', 'fortune-wheel-bonus', 'guest-auth', 'guests-api', 'housekeeping',
+        'list-apartments', 'maids', 'manage-commission', 'monthly-reports', 'owner-apartments', 'owner-auth',
+        'owner-reports', 'owner-users-management', 'owners', 'password-reset', 'scratch-cards',
+        'search-apartments', 'sync-bnovo-rates', 'sync-bnovo-to-db', 'update-housekeeper'
+    ],
+    'export_file.py': ['bookings', 'owner-reports'],
+    'finances.py': ['cron-sync-bnovo', 'sync-bnovo-to-db', 'manage-commission'],
+    'owner_analytics.py': ['owner-apartments'],
+    'prepared.py': ['check-availability', 'apartment-availability', 'calendar-bnovo', 'bookings', 'owner-reports',
+                    'create-booking', 'cancel-booking', 'guests-api', 'archive-monthly-reports', 'cron-archive',
+                    'guest-auth', 'scratch-cards', 'cleaning-history'],
+    'snapshot_cache.py': ['check-availability', 'apartment-availability', 'calendar-bnovo'],
+    'sync_lock.py': ['cron-sync-bnovo', 'sync-bnovo-to-db', 'bnovo-sync'],
+}
+
+HEADER = '# Копия backend/_shared/{name}. Не редактировать: правьте оригинал и запустите python3 scripts/vendor_shared.py\n'
+
+def render(name: str) -> str:
+    return HEADER.format(name=name) + (SHARED_DIR / name).read_text(encoding='utf-8')
+
+def main() -> int:
+    check_only = '--check' in sys.argv[1:]
+    stale = []
+
+    for name, functions in SHARED_MODULES.items():
+        content = render(name)
+        for function in functions:
+            target = BACKEND_DIR / function / name
+            current = target.read_text(encoding='utf-8') if target.exists() else None
+            if current == content:
+                continue
+            stale.append(target.relative_to(ROOT))
+            if not check_only:
+                target.write_text(content, encoding='utf-8')
+
+    if check_only and stale:
+        print('Устаревшие копии общих модулей:')
+        for path in stale:
+            print(f'  {path}')
+        return 1
+
+    for path in stale:
+        print(f'Обновлено: {path}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
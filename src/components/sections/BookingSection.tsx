@@ -4,6 +4,7 @@ import { FizzyButton } from '@/components/ui/fizzy-button';
 import Icon from '@/components/ui/icon';
 import { useToast } from '@/hooks/use-toast';
 import MonthCalendar from '@/components/booking/MonthCalendar';
+import { decodeAvailabilityRuns, isRunsPayload } from '@/lib/calendarRuns';
 
 interface Apartment {
   id: number;
@@ -55,13 +56,17 @@ const BookingSection = () => {
   const loadAvailability = async () => {
     console.log('🔄 Starting to load availability...');
     try {
-      const url = `https://functions.poehali.dev/c8a4acdb-ddbe-41e1-b4d8-a6e6055be8c6?t=${Date.now()}`;
+      // Компактные серии дней; свежесть проверяется по ETag (ответ 304, пока календарь не изменился)
+      const url = 'https://functions.poehali.dev/c8a4acdb-ddbe-41e1-b4d8-a6e6055be8c6?format=runs';
       console.log('📡 Fetching from:', url);
       
       const response = await fetch(url);
       console.log('📦 Response status:', response.status);
       
-      const data = await response.json();
+      const payload = await response.json();
+      const data = isRunsPayload(payload)
+        ? { availability: decodeAvailabilityRuns(payload) }
+        : payload;
       console.log('✅ Availability data loaded:', data);
       console.log('🏠 Apartment 2019 availability:', data.availability?.['2019']);
       
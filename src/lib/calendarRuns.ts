@@ -0,0 +1,73 @@
+// Декодер компактного формата календаря (?format=runs) функций check-availability и calendar-bnovo.
+// Серия — [смещение от start в днях, длина, ...значение дня]; дни вне серий в ответе не было.
+
+type Run = [number, number, ...unknown[]];
+
+export interface AvailabilityDay {
+  price?: number;
+  available: boolean;
+}
+
+export interface CalendarRunsDay {
+  date: string;
+  is_available: boolean;
+  price?: number;
+  booking_id?: string;
+  guest_name?: string;
+}
+
+const DAY_MS = 24 * 60 * 60 * 1000;
+
+const addDays = (start: string, offset: number): string => {
+  // Считаем в UTC, чтобы переход на летнее время не сдвигал даты
+  const [year, month, day] = start.split('-').map(Number);
+  return new Date(Date.UTC(year, month - 1, day) + offset * DAY_MS).toISOString().slice(0, 10);
+};
+
+const expandRuns = (start: string, runs: Run[]): [string, unknown[]][] => {
+  const days: [string, unknown[]][] = [];
+  for (const [offset, length, ...value] of runs) {
+    for (let i = 0; i < length; i++) {
+      days.push([addDays(start, offset + i), value]);
+    }
+  }
+  return days;
+};
+
+export const isRunsPayload = (data: { format?: string } | null | undefined): boolean =>
+  data?.format === 'runs';
+
+// check-availability: { format, start, availability: { [apt]: [[offset, length, available, price], ...] } }
+export const decodeAvailabilityRuns = (data: {
+  start: string;
+  availability: Record<string, Run[]>;
+}): Record<string, Record<string, AvailabilityDay>> => {
+  const result: Record<string, Record<string, AvailabilityDay>> = {};
+  for (const [apartmentId, runs] of Object.entries(data.availability || {})) {
+    const days: Record<string, AvailabilityDay> = {};
+    for (const [date, [available, price]] of expandRuns(data.start, runs)) {
+      days[date] = { available: Boolean(available), price: price as number | undefined };
+    }
+    result[apartmentId] = days;
+  }
+  return result;
+};
+
+// calendar-bnovo: { format, start, calendars: [{ room_id, room_name, runs: [[offset, length, is_available, price, booking_id, guest_name], ...] }] }
+export const decodeCalendarRuns = (data: {
+  start: string | null;
+  calendars: { room_id: string; room_name: string; runs: Run[] }[];
+}): { room_id: string; room_name: string; days: CalendarRunsDay[] }[] =>
+  (data.calendars || []).map(({ room_id, room_name, runs }) => ({
+    room_id,
+    room_name,
+    days: data.start
+      ? expandRuns(data.start, runs).map(([date, [isAvailable, price, bookingId, guestName]]) => ({
+          date,
+          is_available: Boolean(isAvailable),
+          price: price as number | undefined,
+          booking_id: (bookingId as string | null) ?? undefined,
+          guest_name: (guestName as string | null) ?? undefined,
+        }))
+      : [],
+  }));
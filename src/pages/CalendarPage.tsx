@@ -6,6 +6,7 @@ import AdminLogin from '@/components/AdminLogin';
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from '@/components/ui/dialog';
 import { format, addMonths, startOfMonth, endOfMonth, eachDayOfInterval, isSameMonth, isSameDay, addDays, startOfWeek, endOfWeek } from 'date-fns';
 import { ru } from 'date-fns/locale';
+import { decodeCalendarRuns, isRunsPayload } from '@/lib/calendarRuns';
 
 const AUTH_KEY = 'premium_apartments_admin_auth';
 
@@ -74,12 +75,12 @@ export default function CalendarPage() {
       const endDate = format(endOfMonth(addMonths(currentMonth, 2)), 'yyyy-MM-dd');
       
       const response = await fetch(
-        `https://functions.poehali.dev/cb06df00-bb06-4e01-a02d-f31057ae60af?start_date=${startDate}&end_date=${endDate}`
+        `https://functions.poehali.dev/cb06df00-bb06-4e01-a02d-f31057ae60af?start_date=${startDate}&end_date=${endDate}&format=runs`
       );
       
       if (response.ok) {
         const data = await response.json();
-        setCalendars(data.calendars || []);
+        setCalendars(isRunsPayload(data) ? decodeCalendarRuns(data) : data.calendars || []);
       }
     } catch (error) {
       console.error('Failed to load calendars:', error);